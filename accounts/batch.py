@@ -0,0 +1,300 @@
+from bisect import bisect_right
+from collections import defaultdict
+
+import numpy as np
+
+import accounts.runtime
+from accounts.runtime import *
+from accounts.schedule_arrays import schedule_due_dates
+
+
+def _decimal(value=0):
+    # Decimal(...) in expressions evaluated over columns
+    if isinstance(value, np.ndarray):
+        return value.astype(np.float64)
+
+    return float(value)
+
+
+# expressions are evaluated with the same globals as in AccountValuation, with float Decimal constructor
+_NAMESPACE = dict(vars(accounts.runtime))
+_NAMESPACE["Decimal"] = _decimal
+
+
+def _column(values: List[Any]) -> np.ndarray:
+    if all(isinstance(value, (Decimal, int, float)) and not isinstance(value, bool) for value in values):
+        return np.array([float(value) for value in values], dtype=np.float64)
+
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+class _PropertyColumn:
+    # value dated property of all accounts, one row per date on which the value changes for any account
+    def __init__(self, values: List[PropertyValue]):
+        self.dates = sorted({value_date for value in values for value_date in value.value})
+        self.rows = np.full((len(self.dates), len(values)), np.nan)
+
+        for index, value in enumerate(values):
+            for row, value_date in enumerate(self.dates):
+                if value.value and min(value.value) <= value_date:
+                    self.rows[row, index] = float(value[value_date])
+
+    def __getitem__(self, value_date: date) -> np.ndarray:
+        row = bisect_right(self.dates, value_date) - 1
+
+        if row < 0:
+            return np.full(self.rows.shape[1], np.nan)
+
+        return self.rows[row]
+
+
+class _RateColumn:
+    def __init__(self, rate_type: RateType):
+        self.name = rate_type.name
+        self.keys = sorted(rate_type.rate_tiers)
+        self.tiers = [[(float(tier.from_amount), float(tier.to_amount), float(tier.rate))
+                       for tier in rate_type.rate_tiers[key]] for key in self.keys]
+
+    def get_rate(self, value_date: date, amount) -> np.ndarray:
+        index = bisect_right(self.keys, value_date.strftime("%Y-%m-%d")) - 1
+        if index < 0:
+            raise Exception(f"No rate tiers found for date {str(value_date)} in rate table {self.name}")
+
+        amount = np.asarray(amount, dtype=np.float64)
+        rate = np.full(amount.shape, np.nan)
+
+        # first applicable tier wins, as in RateType.get_rate; amounts without a tier stay NaN unless negative
+        for from_amount, to_amount, tier_rate in reversed(self.tiers[index]):
+            rate = np.where((from_amount <= amount) & (amount <= to_amount), tier_rate, rate)
+
+        return np.where(np.isnan(rate) & (amount < 0), 0.0, rate)
+
+
+class _AccountTypeColumns:
+    def __init__(self, account_type: AccountType):
+        self.account_type = account_type
+        self.rates = {name: _RateColumn(rate_type) for name, rate_type in account_type.rate_types.items()}
+
+    def __getattr__(self, name):
+        if name in self.rates:
+            return self.rates[name]
+
+        return getattr(self.account_type, name)
+
+
+class _AccountColumns:
+    def __init__(self, positions: Dict[str, np.ndarray], attributes: Dict[str, Any]):
+        self.positions = positions
+        self.attributes = attributes
+
+    def __getattr__(self, name):
+        if name in self.positions:
+            return self.positions[name]
+        if name in self.attributes:
+            return self.attributes[name]
+
+        raise AttributeError(f'No such attribute: {name}')
+
+
+class _TransactionColumns:
+    def __init__(self, transaction_type: str, value_date: date, amount: np.ndarray):
+        self.transaction_type = transaction_type
+        self.value_date = value_date
+        self.amount = amount
+
+
+class BatchValuation:
+    # forecast of many accounts of the same account type, positions are held as float64 columns with one row per
+    # account, and each expression is evaluated once per day for all accounts on which it is due.
+    # Only positions are calculated, transactions are not added to the accounts.
+    account_type: AccountType
+    accounts: List[Account]
+    action_date: date
+    positions: Dict[str, np.ndarray]
+    postings: int
+
+    def __init__(self, account_type: AccountType, accounts: List[Account], action_date: date):
+        self.account_type = account_type
+        self.accounts = accounts
+        self.action_date = action_date
+        self.postings = 0
+
+        self.positions = {name: np.array([float(account.positions[name].amount) for account in accounts])
+                          for name in accounts[0].positions} if accounts else {}
+
+        self.__start_dates = np.array([account.start_date.toordinal() for account in accounts], dtype=np.int64)
+        self.__account_type = _AccountTypeColumns(account_type)
+        self.__account = _AccountColumns(self.positions, self.__attributes())
+        self.__due: Dict[str, Any] = {}
+
+    def __attributes(self) -> Dict[str, Any]:
+        attributes: Dict[str, Any] = {"start_date": _column([account.start_date for account in self.accounts])}
+
+        names = {name for account in self.accounts for name in (*account.properties, *account.dates)}
+
+        for name in sorted(names):
+            values = [account.properties[name] if name in account.properties else account.dates.get(name)
+                      for account in self.accounts]
+
+            if all(isinstance(value, PropertyValue) for value in values):
+                attributes[name] = _PropertyColumn(values)
+            else:
+                attributes[name] = _column(values)
+
+        return attributes
+
+    def __schedule_masks(self, from_date: date, to_date: date):
+        count = len(self.accounts)
+        plan = self.account_type.valuation_plan()
+
+        for schedule_name in {st.schedule_name for st in plan.start_of_day + plan.end_of_day}:
+            schedules = [account.schedules[schedule_name] for account in self.accounts]
+
+            if all(schedule.is_daily() for schedule in schedules):
+                last_date = date.max.toordinal()
+                self.__due[schedule_name] = (
+                    np.array([schedule.start_date.toordinal() for schedule in schedules], dtype=np.int64),
+                    np.array([schedule.end_date.toordinal() if schedule.end_type == ScheduleEndType.END_DATE
+                              else last_date for schedule in schedules], dtype=np.int64))
+                continue
+
+            # due dates of all accounts generated at once, one mask of accounts per date
+            due = schedule_due_dates(schedules, to_date)
+            accounts = np.repeat(np.arange(count), np.diff(due.offsets))
+            in_range = due.dates >= np.datetime64(from_date, 'D')
+            unique_dates, rows = np.unique(due.dates[in_range], return_inverse=True)
+
+            masks = np.zeros((len(unique_dates), count), dtype=bool)
+            masks[rows, accounts[in_range]] = True
+            due_dates = dict(zip(unique_dates.astype(date).tolist(), masks))
+
+            self.__due[schedule_name] = due_dates
+
+    def __is_due(self, schedule_name: str, value_date: date) -> Optional[np.ndarray]:
+        due = self.__due[schedule_name]
+
+        if isinstance(due, tuple):
+            ordinal = value_date.toordinal()
+            return (due[0] <= ordinal) & (ordinal <= due[1])
+
+        return due.get(value_date)
+
+    def __evaluate(self, code, value_date: date, transaction: Optional[_TransactionColumns] = None):
+        locals = {"accountType": self.__account_type, "account": self.__account, "value_date": value_date}
+        if transaction is not None:
+            locals["transaction"] = transaction
+
+        try:
+            return eval(code, _NAMESPACE, locals)
+        except Exception as e:
+            raise ValueError(f'Error evaluating expression: {expression_text(code)} {e.args}') from e
+
+    def __post(self, transaction_type: TransactionType, value_date: date, mask: np.ndarray, amount):
+        amount = np.where(mask, amount, 0.0)
+
+        if np.isnan(amount).any():
+            raise ValueError(f'Error calculating {transaction_type.name} on {value_date} for accounts '
+                             f'{np.flatnonzero(np.isnan(amount)).tolist()}')
+
+        plan = self.account_type.valuation_plan()
+
+        for position_type_name, operation in plan.position_rules[transaction_type.name]:
+            if operation == TransactionOperation.CREDIT:
+                self.positions[position_type_name] += amount
+            elif operation == TransactionOperation.DEBIT:
+                self.positions[position_type_name] -= amount
+            else:  # Replace
+                self.positions[position_type_name][mask] = amount[mask]
+
+        self.postings += int(np.count_nonzero(mask))
+
+        triggered_transaction = plan.triggers.get(transaction_type.name)
+
+        if triggered_transaction:
+            trigger_amount = self.__evaluate(triggered_transaction.amount_code, value_date,
+                                             _TransactionColumns(transaction_type.name, value_date, amount))
+            self.__post(triggered_transaction.generated_transaction_type, value_date, mask, trigger_amount)
+
+    def __scheduled(self, value_date: date, active: np.ndarray, scheduled_transactions):
+        for scheduled_transaction in scheduled_transactions:
+            due = self.__is_due(scheduled_transaction.schedule_name, value_date)
+            if due is None:
+                continue
+
+            mask = due & active
+            if not mask.any():
+                continue
+
+            transaction_type = scheduled_transaction.transaction_type
+            amount = np.asarray(self.__evaluate(scheduled_transaction.amount_code, value_date), dtype=np.float64)
+
+            if not transaction_type.maximum_precision:
+                amount = np.round(amount, 2)
+
+            # NaN is kept in mask, so that missing rates and property values are reported
+            self.__post(transaction_type, value_date, mask & (amount != 0), amount)
+
+    def __by_date(self, external_transactions: Optional[List[Dict[date, List[ExternalTransaction]]]]):
+        # amounts grouped by date, order within account and transaction type; posted for all accounts at once
+        count = len(self.accounts)
+        grouped: Dict[date, Dict[tuple, np.ndarray]] = defaultdict(dict)
+
+        for index, transactions_by_date in enumerate(external_transactions or []):
+            for value_date, transactions in transactions_by_date.items():
+                for order, external_transaction in enumerate(transactions):
+                    key = (order, external_transaction.transaction_type_name)
+                    if key not in grouped[value_date]:
+                        grouped[value_date][key] = np.full(count, np.nan)
+                    grouped[value_date][key][index] = float(external_transaction.amount)
+
+        return grouped
+
+    def __instalments(self):
+        count = len(self.accounts)
+        grouped: Dict[date, np.ndarray] = defaultdict(lambda: np.full(count, np.nan))
+
+        for index, account in enumerate(self.accounts):
+            for key, instalment in account.instalments.items():
+                grouped[date.fromisoformat(key)][index] = float(instalment.amount)
+
+        return grouped
+
+    def forecast(self, to_value_date: date,
+                 external_transactions: Optional[List[Dict[date, List[ExternalTransaction]]]] = None):
+        # external transactions are given per account, in the same order as accounts
+        if not self.accounts:
+            return
+
+        plan = self.account_type.valuation_plan()
+        from_date = date.fromordinal(int(self.__start_dates.min()))
+
+        self.__schedule_masks(from_date, to_value_date)
+        external_by_date = self.__by_date(external_transactions)
+        instalments = self.__instalments() if plan.instalment_timing == ScheduledTransactionTiming.START_OF_DAY \
+            else {}
+
+        for value_date in calendar_dates(from_date, to_value_date):
+            active = self.__start_dates <= value_date.toordinal()
+
+            self.__scheduled(value_date, active, plan.start_of_day)
+
+            if value_date in instalments:
+                amount = instalments[value_date]
+                self.__post(plan.instalment_transaction_type, value_date, active & ~np.isnan(amount), amount)
+
+            for (_, transaction_type_name), amount in sorted(external_by_date.get(value_date, {}).items()):
+                self.__post(plan.transaction_types[transaction_type_name], value_date,
+                            active & ~np.isnan(amount), amount)
+
+            if value_date < to_value_date:
+                self.__scheduled(value_date, active, plan.end_of_day)
+
+    def to_accounts(self, decimals: int = 6) -> List[Account]:
+        # reconcile float positions to Decimal amounts on the accounts
+        for name, column in self.positions.items():
+            for account, amount in zip(self.accounts, column.tolist()):
+                account.positions[name].amount = Decimal(repr(round(amount, decimals)))
+
+        return self.accounts
@@ -0,0 +1,139 @@
+from datetime import date
+from typing import Iterable, Optional
+
+import numpy as np
+
+# date.toordinal() of datetime64 day 0 (1970-01-01)
+_EPOCH_ORDINAL = 719163
+
+
+def to_ordinals(dates: np.ndarray) -> np.ndarray:
+    return np.asarray(dates, dtype='M8[D]').astype(np.int64) + _EPOCH_ORDINAL
+
+
+def from_ordinals(ordinals: np.ndarray) -> np.ndarray:
+    return (np.asarray(ordinals, dtype=np.int64) - _EPOCH_ORDINAL).astype('M8[D]')
+
+
+def is_weekday(ordinals: np.ndarray) -> np.ndarray:
+    # date.fromordinal(1) is a monday
+    return (ordinals - 1) % 7 < 5
+
+
+class BusinessDayTable:
+    # business days of a calendar from first_date to last_date (inclusive): a bitmap with a bit per day, the number
+    # of business days before each day (counts[i] for days before first + i) and the business days as ordinals.
+    # For every day of the range its next, previous, closest (next on a tie) and next in the same month (else
+    # previous) business day as day ordinals; -1 where that business day is outside of the range
+    first: int
+    size: int
+    bits: np.ndarray
+    counts: np.ndarray
+    business_ordinals: np.ndarray
+    next: np.ndarray
+    previous: np.ndarray
+    closest: np.ndarray
+    this_month_or_previous: np.ndarray
+
+    def __init__(self, first_date: date, last_date: date, holidays: Iterable[date]):
+        self.first = first_date.toordinal()
+        self.size = max(last_date.toordinal() - self.first + 1, 0)
+
+        ordinals = np.arange(self.first, self.first + self.size, dtype=np.int64)
+        business = is_weekday(ordinals)
+        holidays = np.array([holiday.toordinal() for holiday in holidays if first_date <= holiday <= last_date],
+                            dtype=np.int64)
+        business[holidays - self.first] = False
+
+        self.bits = np.packbits(business, bitorder='little')
+        self.counts = np.zeros(self.size + 1, dtype=np.int32)
+        np.cumsum(business, out=self.counts[1:])
+        self.business_ordinals = ordinals[business].astype(np.int32)
+
+        self.next = np.empty(self.size, dtype=np.int32)
+        self.previous = np.empty(self.size, dtype=np.int32)
+        self.closest = np.empty(self.size, dtype=np.int32)
+        self.this_month_or_previous = np.empty(self.size, dtype=np.int32)
+        self.__fill(0, self.size)
+
+    def __fill(self, start: int, stop: int):
+        # adjusted business days of days first + start until first + stop (exclusive)
+        ordinals = np.arange(self.first + start, self.first + stop, dtype=np.int64)
+        business_ordinals = np.append(self.business_ordinals, -1).astype(np.int64)
+        count = len(business_ordinals) - 1
+
+        following = business_ordinals[np.searchsorted(business_ordinals[:-1], ordinals, side='left')]
+        preceding = np.searchsorted(business_ordinals[:-1], ordinals, side='right') - 1
+        preceding = np.where(preceding >= 0, business_ordinals[np.minimum(preceding, count)], -1)
+
+        found = (following >= 0) & (preceding >= 0)
+        closest = np.where(ordinals - preceding < following - ordinals, preceding, following)
+        same_month = from_ordinals(following).astype('M8[M]') == from_ordinals(ordinals).astype('M8[M]')
+
+        self.next[start:stop] = following
+        self.previous[start:stop] = preceding
+        self.closest[start:stop] = np.where(found, closest, -1)
+        self.this_month_or_previous[start:stop] = np.where(following < 0, -1,
+                                                           np.where(same_month, following, preceding))
+
+    def add_holiday(self, holiday: date):
+        # updates the table in place; only days between the business days around the holiday are adjusted again
+        index = holiday.toordinal() - self.first
+        if not 0 <= index < self.size or not self.bits[index >> 3] >> (index & 7) & 1:
+            return
+
+        self.bits[index >> 3] &= ~np.uint8(1 << (index & 7))
+        self.counts[index + 1:] -= 1
+        self.business_ordinals = np.delete(self.business_ordinals, self.counts[index])
+
+        preceding = int(self.previous[index - 1]) if index > 0 else -1
+        following = int(self.next[index + 1]) if index + 1 < self.size else -1
+        self.__fill(preceding - self.first + 1 if preceding >= 0 else 0,
+                    following - self.first if following >= 0 else self.size)
+
+    def adjust(self, value: date, column: np.ndarray) -> Optional[date]:
+        # business day of value from one of the columns, None if value or the business day is outside of the range
+        index = value.toordinal() - self.first
+        if 0 <= index < self.size:
+            adjusted = int(column[index])
+            if adjusted >= 0:
+                return date.fromordinal(adjusted)
+
+        return None
+
+    def adjust_ordinals(self, ordinals: np.ndarray, column: np.ndarray) -> np.ndarray:
+        # same as adjust for an array of day ordinals, -1 where it would return None
+        index = ordinals - self.first
+        inside = (index >= 0) & (index < self.size)
+        return np.where(inside, column[np.where(inside, index, 0)], -1).astype(np.int64)
+
+    def is_business(self, ordinals: np.ndarray) -> np.ndarray:
+        # bit of each day ordinal, False outside of the range
+        index = ordinals - self.first
+        inside = (index >= 0) & (index < self.size)
+        index = np.where(inside, index, 0)
+        return inside & (self.bits[index >> 3] >> (index & 7) & 1).astype(bool)
+
+    def contains(self, ordinals: np.ndarray) -> np.ndarray:
+        return (ordinals >= self.first) & (ordinals < self.first + self.size)
+
+    def count(self, from_date: date, to_date: date) -> Optional[int]:
+        # business days from from_date (inclusive) to to_date (exclusive), None if not within the range
+        start = from_date.toordinal() - self.first
+        stop = to_date.toordinal() - self.first
+        if 0 <= start <= stop <= self.size:
+            return int(self.counts[stop] - self.counts[start])
+
+        return None
+
+    def add(self, value: date, days: int) -> Optional[date]:
+        # business day days business days after value (before it when negative), None if not within the range
+        index = value.toordinal() - self.first
+        if not 0 <= index < self.size:
+            return None
+
+        position = int(self.counts[index + 1]) + days - 1 if days > 0 else int(self.counts[index]) + days
+        if 0 <= position < len(self.business_ordinals):
+            return date.fromordinal(int(self.business_ordinals[position]))
+
+        return None
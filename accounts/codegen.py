@@ -0,0 +1,287 @@
+import ast
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import accounts.runtime
+from accounts.expressions import analyze_expression
+from accounts.metadata import AccountType, ScheduledTransactionTiming, TransactionOperation, TransactionType, \
+    ValuationPlan
+
+# bump when generated code changes, so that sources cached on disk are not reused
+CODEGEN_VERSION = 3
+
+MAX_TRIGGER_DEPTH = 16
+
+# forecast functions of the most recently used plans, keyed by plan id; plan is kept with its function so that an id
+# reused by another plan is not matched
+MAX_COMPILED = 64
+_compiled: OrderedDict[int, Tuple[ValuationPlan, Callable]] = OrderedDict()
+
+
+def default_cache_dir() -> str:
+    return os.environ.get("TRANSACTION_ACCOUNTS_CACHE",
+                          os.path.join(os.path.expanduser("~"), ".cache", "transaction-accounts"))
+
+
+def account_type_hash(account_type: AccountType) -> str:
+    content = f"{CODEGEN_VERSION}:{account_type.json()}"
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class _ExpressionInliner(ast.NodeTransformer):
+    def __init__(self, names: Dict[Tuple[str, str], str], transaction: Optional[str], amount: Optional[str]):
+        self.names = names
+        self.transaction = transaction
+        self.amount = amount
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if isinstance(node.value, ast.Name):
+            owner = node.value.id
+
+            if (owner, node.attr) in self.names:
+                return ast.copy_location(ast.Name(id=self.names[(owner, node.attr)], ctx=ast.Load()), node)
+
+            if owner == "transaction" and self.transaction:
+                if node.attr == "amount":
+                    return ast.copy_location(ast.Name(id=self.amount, ctx=ast.Load()), node)
+
+                return ast.copy_location(ast.Attribute(value=ast.Name(id=self.transaction, ctx=ast.Load()),
+                                                       attr=node.attr, ctx=ast.Load()), node)
+
+        return self.generic_visit(node)
+
+
+class _ForecastGenerator:
+    def __init__(self, account_type: AccountType, digest: str):
+        self.account_type = account_type
+        self.plan = account_type.valuation_plan()
+        self.digest = digest
+        self.lines: List[str] = []
+        self.names: Dict[Tuple[str, str], str] = {}
+        self.schedules: Dict[str, str] = {}
+        self.positions: Dict[str, str] = {}
+
+    @staticmethod
+    def _identifier(prefix: str, index: int, name: str) -> str:
+        return f"{prefix}_{index}_{re.sub(r'[^0-9a-zA-Z_]', '_', name)}"
+
+    def emit(self, indent: int, line: str):
+        self.lines.append("    " * indent + line)
+
+    def generate(self) -> str:
+        plan = self.plan
+        account_fields = set(accounts.runtime.Account.__fields__)
+
+        position_names = sorted({name for rules in plan.position_rules.values() for name, _ in rules})
+        for index, name in enumerate(position_names):
+            self.positions[name] = self._identifier("position", index, name)
+            self.names[("account", name)] = self.positions[name]
+
+        scheduled_transactions = plan.start_of_day + plan.end_of_day
+        expressions = [st.amount_expression for st in scheduled_transactions] + \
+                      [trigger.amount_expression for trigger in plan.triggers.values()]
+
+        hoisted: List[Tuple[str, str]] = []
+        for expression in expressions:
+            dependencies = analyze_expression(expression)
+            if dependencies.opaque:
+                raise ValueError(f"Expression can not be compiled, account is used directly: {expression}")
+
+            for name in sorted(dependencies.account_attributes):
+                if ("account", name) not in self.names and name not in account_fields:
+                    self.names[("account", name)] = self._identifier("account", len(hoisted), name)
+                    hoisted.append((self.names[("account", name)], f"account.{name}"))
+
+            for name in sorted(dependencies.account_type_attributes):
+                if ("accountType", name) not in self.names and name in self.account_type.rate_types:
+                    self.names[("accountType", name)] = self._identifier("rate", len(hoisted), name)
+                    hoisted.append((self.names[("accountType", name)], f"account_type.rate_types[{name!r}]"))
+
+        for scheduled_transaction in scheduled_transactions:
+            name = scheduled_transaction.schedule_name
+            if name not in self.schedules:
+                self.schedules[name] = self._identifier("is_due", len(self.schedules), name)
+
+        self.emit(0, _header(self.account_type, self.digest))
+        self.emit(0, "")
+        self.emit(0, "")
+        self.emit(0, "def forecast(account, account_type, action_date, to_value_date, external_transactions, record):")
+        self.emit(1, "positions = account.positions")
+        for name, local in self.positions.items():
+            self.emit(1, f"{local} = positions[{name!r}].amount")
+        for local, source in hoisted:
+            self.emit(1, f"{local} = {source}")
+        for name, local in self.schedules.items():
+            self.emit(1, f"{local} = account.schedules[{name!r}].is_due")
+        if plan.instalment_timing == ScheduledTransactionTiming.START_OF_DAY:
+            self.emit(1, "instalments = {date.fromisoformat(key): instalment "
+                         "for key, instalment in account.instalments.items()}")
+        self.emit(1, "external_transactions = external_transactions or {}")
+        self.emit(1, "value_date = account.start_date")
+        self.emit(1, "try:")
+        self.emit(2, "while True:")
+
+        self.emit(3, "# start of day")
+        for scheduled_transaction in plan.start_of_day:
+            self.scheduled(3, scheduled_transaction)
+
+        if plan.instalment_timing == ScheduledTransactionTiming.START_OF_DAY:
+            self.emit(3, "instalment = instalments.get(value_date)")
+            self.emit(3, "if instalment is not None:")
+            self.emit(4, "amount_0 = instalment.amount")
+            self.posting(4, plan.instalment_transaction_type, "True", 0)
+
+        self.emit(3, "# external transactions")
+        self.emit(3, "for external_transaction in external_transactions.get(value_date, ()):")
+        self.emit(4, "amount_0 = external_transaction.amount")
+        self.emit(4, "transaction_type = external_transaction.transaction_type_name")
+        keyword = "if"
+        for transaction_type in plan.transaction_types.values():
+            self.emit(4, f"{keyword} transaction_type == {transaction_type.name!r}:")
+            self.posting(5, transaction_type, "False", 0)
+            keyword = "elif"
+        self.emit(4, "else:")
+        self.emit(5, "raise KeyError(transaction_type)")
+
+        self.emit(3, "if value_date >= to_value_date:")
+        self.emit(4, "break")
+
+        self.emit(3, "# end of day")
+        for scheduled_transaction in plan.end_of_day:
+            self.scheduled(3, scheduled_transaction)
+
+        self.emit(3, "value_date = value_date + ONE_DAY")
+
+        self.emit(1, "finally:")
+        for name, local in self.positions.items():
+            self.emit(2, f"positions[{name!r}].amount = {local}")
+        self.emit(0, "")
+        self.emit(0, _footer(self.digest))
+        self.emit(0, "")
+
+        return "\n".join(self.lines)
+
+    def expression(self, expression: str, transaction: Optional[str], amount: Optional[str]) -> str:
+        tree = ast.parse(expression, mode="eval")
+        tree = _ExpressionInliner(self.names, transaction, amount).visit(tree)
+        return ast.unparse(ast.fix_missing_locations(tree))
+
+    def scheduled(self, indent: int, scheduled_transaction):
+        transaction_type = scheduled_transaction.transaction_type
+
+        self.emit(indent, f"# {scheduled_transaction.schedule_name}: "
+                          f"{_one_line(scheduled_transaction.amount_expression)}")
+        self.emit(indent, f"if {self.schedules[scheduled_transaction.schedule_name]}(value_date):")
+        self.emit(indent + 1, f"amount_0 = {self.expression(scheduled_transaction.amount_expression, None, None)}")
+        if not transaction_type.maximum_precision:
+            self.emit(indent + 1, "amount_0 = Decimal(round(amount_0, 2))")
+        self.emit(indent + 1, "if amount_0 != ZERO:")
+        self.posting(indent + 2, transaction_type, "True", 0)
+
+    def posting(self, indent: int, transaction_type: TransactionType, system_generated: str, depth: int):
+        if depth > MAX_TRIGGER_DEPTH:
+            raise ValueError(f"Triggered transactions nested too deep at {transaction_type.name}")
+
+        amount = f"amount_{depth}"
+        transaction = f"transaction_{depth}"
+
+        # record converts the amount as the interpreter does, positions are updated with the converted amount
+        self.emit(indent, f"{amount} = record({transaction_type.name!r}, value_date, {amount}, {system_generated})")
+
+        for position_type_name, operation in self.plan.position_rules[transaction_type.name]:
+            local = self.positions[position_type_name]
+            if operation == TransactionOperation.CREDIT:
+                self.emit(indent, f"{local} = {local} + {amount}")
+            elif operation == TransactionOperation.DEBIT:
+                self.emit(indent, f"{local} = {local} - {amount}")
+            else:
+                self.emit(indent, f"{local} = {amount}")
+
+        trigger = self.plan.triggers.get(transaction_type.name)
+        if trigger:
+            expression = self.expression(trigger.amount_expression, transaction, amount)
+            self.emit(indent, f"# trigger: {_one_line(trigger.amount_expression)}")
+            # posting is created only for expressions using the transaction other than its amount
+            if any(isinstance(node, ast.Name) and node.id == transaction for node in ast.walk(ast.parse(expression))):
+                self.emit(indent, f"{transaction} = Posting(action_date, value_date, {transaction_type.name!r}, "
+                                  f"{amount}, {system_generated})")
+            self.emit(indent, f"amount_{depth + 1} = {expression}")
+            self.posting(indent, trigger.generated_transaction_type, "True", depth + 1)
+
+
+def _one_line(expression: str) -> str:
+    # expressions are written in comments, which end at a line break
+    return " ".join(expression.split())
+
+
+def _header(account_type: AccountType, digest: str) -> str:
+    return f"# Generated forecast for account type {account_type.name!r} ({digest}), do not edit."
+
+
+def _footer(digest: str) -> str:
+    return f"# End of generated forecast ({digest})"
+
+
+def _read_source(file_name: str, account_type: AccountType, digest: str) -> Optional[str]:
+    # source cached on disk, None when it is missing or is not complete source generated for digest
+    try:
+        with open(file_name, "r") as f:
+            source = f.read()
+    except OSError:
+        return None
+
+    if source.startswith(_header(account_type, digest) + "\n") and source.endswith("\n" + _footer(digest) + "\n"):
+        return source
+
+    return None
+
+
+def generate_forecast_source(account_type: AccountType, digest: Optional[str] = None) -> str:
+    return _ForecastGenerator(account_type, digest or account_type_hash(account_type)).generate()
+
+
+def _load(source: str, file_name: str) -> Callable:
+    # generated code runs with the same globals expressions are evaluated with
+    namespace = dict(vars(accounts.runtime))
+    namespace["ZERO"] = accounts.runtime.Decimal(0)
+    namespace["ONE_DAY"] = accounts.runtime.timedelta(days=1)
+    exec(compile(source, file_name, "exec"), namespace)
+    return namespace["forecast"]
+
+
+def compile_forecast(account_type: AccountType, cache_dir: Optional[str] = None) -> Callable:
+    plan = account_type.valuation_plan()
+
+    compiled = _compiled.get(id(plan))
+    if compiled is not None and compiled[0] is plan:
+        _compiled.move_to_end(id(plan))
+        return compiled[1]
+
+    digest = account_type_hash(account_type)
+    cache_dir = cache_dir or default_cache_dir()
+    file_name = os.path.join(cache_dir, f"forecast_{digest}.py")
+
+    source = _read_source(file_name, account_type, digest)
+    if source is None:
+        source = generate_forecast_source(account_type, digest)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            temporary_file_name = f"{file_name}.{os.getpid()}.tmp"
+            with open(temporary_file_name, "w") as f:
+                f.write(source)
+            os.replace(temporary_file_name, file_name)
+        except OSError:
+            # cache is an optimisation only, generated code is still used when it can not be written
+            pass
+
+    function = _load(source, file_name)
+    _compiled[id(plan)] = (plan, function)
+    _compiled.move_to_end(id(plan))
+
+    if len(_compiled) > MAX_COMPILED:
+        _compiled.popitem(last=False)
+
+    return function
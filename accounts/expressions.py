@@ -0,0 +1,132 @@
+import ast
+from collections import OrderedDict
+from functools import lru_cache
+from types import CodeType
+from typing import FrozenSet, NamedTuple, Optional, Union
+
+Expression = Union[str, CodeType]
+
+
+class ExpressionCache:
+    max_size: int
+    hits: int
+    misses: int
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__entries: OrderedDict[str, CodeType] = OrderedDict()
+
+    def compile(self, expression: Expression) -> CodeType:
+        if isinstance(expression, CodeType):
+            return expression
+
+        code = self.__entries.get(expression)
+
+        if code is not None:
+            self.hits += 1
+            self.__entries.move_to_end(expression)
+            return code
+
+        self.misses += 1
+
+        try:
+            # expression text is used as file name so that errors and tracebacks show the source
+            code = compile(expression, expression, 'eval')
+        except SyntaxError as e:
+            raise ValueError(f'Error compiling expression: {expression} {e.args}') from e
+
+        self.__entries[expression] = code
+
+        if len(self.__entries) > self.max_size:
+            self.__entries.popitem(last=False)
+
+        return code
+
+    def clear(self):
+        self.__entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, expression: str):
+        return expression in self.__entries
+
+
+expression_cache = ExpressionCache()
+
+
+def compile_expression(expression: Optional[Expression]) -> Optional[CodeType]:
+    if expression is None:
+        return None
+
+    return expression_cache.compile(expression)
+
+
+def expression_text(expression: Expression) -> str:
+    if isinstance(expression, CodeType):
+        return expression.co_filename
+
+    return expression
+
+
+class ExpressionDependencies(NamedTuple):
+    account_attributes: FrozenSet[str]
+    account_type_attributes: FrozenSet[str]
+    transaction_attributes: FrozenSet[str]
+    # value_date is used for something else than rate tier or value dated property lookup
+    date_dependent: bool
+    # account, accountType or self are used in a way that can not be analyzed (e.g. passed to a function)
+    opaque: bool
+
+
+def _is_value_date_lookup(node: ast.Name, parent: Optional[ast.AST]) -> bool:
+    # accountType.<rate>.get_rate(value_date, ...)
+    if isinstance(parent, ast.Call) and parent.args and parent.args[0] is node:
+        function = parent.func
+        return (isinstance(function, ast.Attribute) and function.attr == 'get_rate' and
+                isinstance(function.value, ast.Attribute) and
+                isinstance(function.value.value, ast.Name) and function.value.value.id == 'accountType')
+
+    # account.<property>[value_date]
+    if isinstance(parent, ast.Subscript) and parent.slice is node:
+        return (isinstance(parent.value, ast.Attribute) and
+                isinstance(parent.value.value, ast.Name) and parent.value.value.id == 'account')
+
+    return False
+
+
+@lru_cache(maxsize=1024)
+def analyze_expression(expression: str) -> ExpressionDependencies:
+    tree = ast.parse(expression, mode='eval')
+    parents = {child: node for node in ast.walk(tree) for child in ast.iter_child_nodes(node)}
+
+    attributes = {'account': set(), 'accountType': set(), 'transaction': set()}
+    date_dependent = False
+    opaque = False
+
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Name):
+            continue
+
+        parent = parents.get(node)
+
+        if node.id in attributes:
+            if isinstance(parent, ast.Attribute) and parent.value is node:
+                attributes[node.id].add(parent.attr)
+            else:
+                opaque = True
+        elif node.id == 'value_date':
+            if not _is_value_date_lookup(node, parent):
+                date_dependent = True
+        elif node.id == 'self':
+            opaque = True
+
+    return ExpressionDependencies(account_attributes=frozenset(attributes['account']),
+                                  account_type_attributes=frozenset(attributes['accountType']),
+                                  transaction_attributes=frozenset(attributes['transaction']),
+                                  date_dependent=date_dependent,
+                                  opaque=opaque)
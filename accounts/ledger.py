@@ -0,0 +1,286 @@
+from array import array
+from collections.abc import MutableSequence
+from bisect import bisect_left, bisect_right
+from datetime import date
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+# date.toordinal() of 1970-01-01, numpy datetime64 epoch
+_EPOCH_ORDINAL = 719163
+
+_MAX_UNITS = 2 ** 63
+
+
+class Ledger(MutableSequence):
+    # transactions stored as parallel arrays: value and action date ordinals, transaction type id, amount in integer
+    # units of 10 ** -digits with the exponent of the original amount, and system generated flag. Amounts that do not
+    # fit the scale are kept exactly in residuals. Entries are created with factory when the ledger is read, changes
+    # other than appending to or truncating the end rebuild the columns.
+    digits: int
+
+    def __init__(self, factory: Callable[..., Any], digits: int = 6):
+        self.factory = factory
+        self.digits = digits
+        self.types: List[str] = []
+        self.type_ids: Dict[str, int] = {}
+        self.residuals: Dict[int, Decimal] = {}
+        self.__value_dates = array('i')
+        self.__action_dates = array('i')
+        self.__transaction_types = array('H')
+        self.__units = array('q')
+        self.__exponents = array('b')
+        self.__system_generated = array('b')
+        # indexes: entry positions sorted by value date, for all entries and per transaction type id
+        self.__date_index = (array('i'), array('i'))
+        self.__type_indexes: Dict[int, Tuple[array, array]] = {}
+
+    @staticmethod
+    def __insert(index: Tuple[array, array], ordinal: int, position: int):
+        ordinals, positions = index
+        # entries are mostly recorded in value date order, so this is usually an append
+        if not ordinals or ordinals[-1] <= ordinal:
+            ordinals.append(ordinal)
+            positions.append(position)
+        else:
+            at = bisect_right(ordinals, ordinal)
+            ordinals.insert(at, ordinal)
+            positions.insert(at, position)
+
+    def append(self, entry):
+        # entry is a Transaction or any object with the same attributes
+        self.record(entry.action_date, entry.value_date, entry.transaction_type, entry.amount, entry.system_generated)
+
+    def record(self, action_date: date, value_date: date, transaction_type: str, amount: Decimal,
+               system_generated: bool):
+        type_id = self.type_ids.get(transaction_type)
+        if type_id is None:
+            type_id = self.type_ids[transaction_type] = len(self.types)
+            self.types.append(transaction_type)
+
+        sign, _, exponent = amount.as_tuple()
+
+        if isinstance(exponent, int) and -self.digits <= exponent <= 18 and (amount or not sign):
+            units = int(amount.scaleb(self.digits))
+        else:
+            units = _MAX_UNITS
+
+        if not -_MAX_UNITS < units < _MAX_UNITS:
+            self.residuals[len(self.__units)] = amount
+            units = 0
+            exponent = 0
+
+        ordinal = value_date.toordinal()
+        self.__insert(self.__date_index, ordinal, len(self.__units))
+        if type_id not in self.__type_indexes:
+            self.__type_indexes[type_id] = (array('i'), array('i'))
+        self.__insert(self.__type_indexes[type_id], ordinal, len(self.__units))
+
+        self.__value_dates.append(ordinal)
+        self.__action_dates.append(action_date.toordinal())
+        self.__transaction_types.append(type_id)
+        self.__units.append(units)
+        self.__exponents.append(exponent)
+        self.__system_generated.append(system_generated)
+
+    def extend(self, entries: Iterable):
+        for entry in entries:
+            self.append(entry)
+
+    def clear(self):
+        self.residuals.clear()
+        for column in (self.__value_dates, self.__action_dates, self.__transaction_types, self.__units,
+                       self.__exponents, self.__system_generated, *self.__date_index):
+            del column[:]
+        self.__type_indexes.clear()
+
+    def truncate(self, length: int):
+        # removes entries from position length on
+        if length >= len(self):
+            return
+
+        for column in (self.__value_dates, self.__action_dates, self.__transaction_types, self.__units,
+                       self.__exponents, self.__system_generated):
+            del column[length:]
+
+        for index in [index for index in self.residuals if index >= length]:
+            del self.residuals[index]
+
+        # removed entries are at the end of indexes when they were recorded in value date order
+        for ordinals, positions in (self.__date_index, *self.__type_indexes.values()):
+            while positions and positions[-1] >= length:
+                positions.pop()
+                ordinals.pop()
+
+        if len(self.__date_index[1]) != length or \
+                sum(len(positions) for _, positions in self.__type_indexes.values()) != length:
+            self.__rebuild_indexes()
+
+    def __rebuild_indexes(self):
+        for column in self.__date_index:
+            del column[:]
+        self.__type_indexes.clear()
+
+        for position, (ordinal, type_id) in enumerate(zip(self.__value_dates, self.__transaction_types)):
+            self.__insert(self.__date_index, ordinal, position)
+            if type_id not in self.__type_indexes:
+                self.__type_indexes[type_id] = (array('i'), array('i'))
+            self.__insert(self.__type_indexes[type_id], ordinal, position)
+
+    def __len__(self):
+        return len(self.__units)
+
+    def amount(self, index: int) -> Decimal:
+        if index in self.residuals:
+            return self.residuals[index]
+
+        return Decimal(self.__units[index]).scaleb(-self.digits).quantize(Decimal(1).scaleb(self.__exponents[index]))
+
+    def entry(self, index: int):
+        return self.factory(action_date=date.fromordinal(self.__action_dates[index]),
+                            value_date=date.fromordinal(self.__value_dates[index]),
+                            transaction_type=self.types[self.__transaction_types[index]],
+                            amount=self.amount(index),
+                            system_generated=bool(self.__system_generated[index]))
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self.entry(i) for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ledger index out of range")
+
+        return self.entry(index)
+
+    def __iter__(self) -> Iterator:
+        for index in range(len(self)):
+            yield self.entry(index)
+
+    def __replace(self, entries: List):
+        self.clear()
+        self.extend(entries)
+
+    def __setitem__(self, index: Union[int, slice], entry):
+        entries = self[:]
+        entries[index] = entry
+        self.__replace(entries)
+
+    def __delitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice) and index.step is None and index.stop is None:
+            self.truncate(index.indices(len(self))[0])
+            return
+
+        entries = self[:]
+        del entries[index]
+        self.__replace(entries)
+
+    def insert(self, index: int, entry):
+        if index >= len(self):
+            self.append(entry)
+            return
+
+        entries = self[:]
+        entries.insert(index, entry)
+        self.__replace(entries)
+
+    def __eq__(self, other):
+        if not isinstance(other, (Ledger, list, tuple)):
+            return NotImplemented
+
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __add__(self, other: Iterable) -> List:
+        return self[:] + list(other)
+
+    def __radd__(self, other: Iterable) -> List:
+        return list(other) + self[:]
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self)!r})"
+
+    def __column(self, column: array, dtype) -> np.ndarray:
+        # copy, so that the array is not exporting its buffer when more entries are appended
+        return np.frombuffer(column, dtype=dtype).copy() if len(column) else np.empty(0, dtype=dtype)
+
+    def __sum(self, indexes: np.ndarray, units: np.ndarray) -> Decimal:
+        total = Decimal(int(units[indexes].sum())).scaleb(-self.digits)
+
+        if self.residuals:
+            for index in self.residuals.keys() & set(indexes.tolist()):
+                total += self.residuals[index]
+
+        return total
+
+    def indexes(self, transaction_type: Optional[str] = None, from_date: Optional[date] = None,
+                to_date: Optional[date] = None) -> array:
+        # positions of entries of transaction type (all if None) with value date between from_date and to_date
+        # (inclusive), ordered by value date and then by ledger order
+        if transaction_type is None:
+            ordinals, positions = self.__date_index
+        elif transaction_type in self.type_ids:
+            ordinals, positions = self.__type_indexes[self.type_ids[transaction_type]]
+        else:
+            return array('i')
+
+        start = bisect_left(ordinals, from_date.toordinal()) if from_date else 0
+        end = bisect_right(ordinals, to_date.toordinal()) if to_date else len(ordinals)
+
+        return positions[start:end]
+
+    def query(self, transaction_type: Optional[str] = None, from_date: Optional[date] = None,
+              to_date: Optional[date] = None) -> List:
+        return [self.entry(index) for index in self.indexes(transaction_type, from_date, to_date)]
+
+    def total(self, transaction_type: Optional[str] = None, from_date: Optional[date] = None,
+              to_date: Optional[date] = None) -> Decimal:
+        units = self.__units
+        indexes = self.indexes(transaction_type, from_date, to_date)
+        total = Decimal(sum(units[index] for index in indexes)).scaleb(-self.digits)
+
+        if self.residuals:
+            for index in indexes:
+                if index in self.residuals:
+                    total += self.residuals[index]
+
+        return total
+
+    def in_range(self, from_date: date, to_date: date) -> List:
+        return self.query(None, from_date, to_date)
+
+    def last(self, count: int) -> List:
+        return self[max(len(self) - count, 0):]
+
+    def sum_by_type(self) -> Dict[str, Decimal]:
+        transaction_types = self.__column(self.__transaction_types, np.uint16)
+        units = self.__column(self.__units, np.int64)
+
+        return {self.types[type_id]: self.__sum(np.flatnonzero(transaction_types == type_id), units)
+                for type_id in np.unique(transaction_types).tolist()}
+
+    def sum_by_type_per_month(self) -> Dict[Tuple[str, date], Decimal]:
+        # totals keyed by transaction type and first day of value date month
+        transaction_types = self.__column(self.__transaction_types, np.uint16)
+        units = self.__column(self.__units, np.int64)
+        months = (self.__column(self.__value_dates, np.int32) - _EPOCH_ORDINAL).astype('M8[D]').astype('M8[M]')
+
+        keys, inverse = np.unique(months.astype(np.int64) * len(self.types) + transaction_types,
+                                  return_inverse=True)
+        totals = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(totals, inverse, units)
+
+        result: Dict[Tuple[str, date], Decimal] = {}
+        for key, total in zip(keys.tolist(), totals.tolist()):
+            month = np.datetime64(key // len(self.types), 'M').astype(date)
+            result[(self.types[key % len(self.types)], month)] = Decimal(total).scaleb(-self.digits)
+
+        for index, amount in self.residuals.items():
+            value_date = date.fromordinal(self.__value_dates[index])
+            key = (self.types[self.__transaction_types[index]], value_date.replace(day=1))
+            result[key] = result.get(key, Decimal(0)) + amount
+
+        return result
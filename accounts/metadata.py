@@ -2,9 +2,11 @@ from calendar import monthrange
 from datetime import date
 from decimal import Decimal
 from enum import Enum
-from typing import List, Optional, Dict
-from pydantic import BaseModel
+from types import CodeType, MappingProxyType
+from typing import List, Optional, Dict, FrozenSet, Mapping, NamedTuple, Tuple
+from pydantic import BaseModel, PrivateAttr, validator
 
+from accounts.expressions import analyze_expression, compile_expression
 from accounts.utility import CustomEncoder
 
 
@@ -154,9 +156,13 @@ class TransactionType(BaseModel):
     label: str
     position_rules: List[PositionRule] = []
     maximum_precision: bool = False
+    # account type the transaction type belongs to, its valuation plan is invalidated when rules are added
+    _account_type: Optional['AccountType'] = PrivateAttr(default=None)
 
     def add_position_rule(self, transaction_operation: TransactionOperation, position_type: PositionType):
         self.position_rules.append(PositionRule(operation=transaction_operation, position_type_name=position_type.name))
+        if self._account_type is not None:
+            self._account_type.invalidate_valuation_plan()
         return self
 
 
@@ -174,18 +180,38 @@ class ScheduleType(BaseModel):
     exclude_dates_expression: Optional[str] = None
     editable: bool = True
 
+    @validator('interval_expression', 'start_date_expression', 'end_date_expression',
+               'number_of_repeats_expression', 'include_dates_expression', 'exclude_dates_expression')
+    def validate_expression(cls, value: Optional[str]) -> Optional[str]:
+        compile_expression(value)
+        return value
+
 
 class ScheduledTransaction(BaseModel):
     schedule_name: str
     timing: ScheduledTransactionTiming
     generated_transaction_type: str
     amount_expression: str
+    # result changes with value date in a way not visible to dependency analysis, never reuse previous result
+    date_dependent: bool = False
+
+    @validator('amount_expression')
+    def validate_expression(cls, value: str) -> str:
+        compile_expression(value)
+        return value
 
 
 class TriggeredTransaction(BaseModel):
     trigger_transaction_type_name: str
     generated_transaction_type: str
     amount_expression: str
+    # result changes with value date in a way not visible to dependency analysis, never reuse previous result
+    date_dependent: bool = False
+
+    @validator('amount_expression')
+    def validate_expression(cls, value: str) -> str:
+        compile_expression(value)
+        return value
 
 
 class PropertyType(BaseModel):
@@ -207,6 +233,153 @@ class InstalmentType(BaseModel):
     solve_for_date: str
 
 
+PositionRules = Tuple[Tuple[str, TransactionOperation], ...]
+
+
+class ExpressionNode(NamedTuple):
+    name: str
+    transaction_type: str
+    expression: str
+    positions: FrozenSet[str]
+    properties: FrozenSet[str]
+    dates: FrozenSet[str]
+    rate_types: FrozenSet[str]
+    transaction_attributes: FrozenSet[str]
+    writes: FrozenSet[str]
+    date_dependent: bool
+    # all inputs are known, so result can be reused for as long as they do not change
+    cacheable: bool
+
+    @classmethod
+    def build(cls, name: str, transaction_type: str, expression: str, date_dependent: bool,
+              account_type: 'AccountType', position_rules: Mapping[str, PositionRules]) -> 'ExpressionNode':
+        dependencies = analyze_expression(expression)
+
+        position_names = {position_type_name for rules in position_rules.values()
+                          for position_type_name, _ in rules}
+        position_names.update(position_type.name for position_type in account_type.position_types)
+        property_names = {property_type.name for property_type in account_type.property_types}
+        date_names = {date_type.name for date_type in account_type.date_types}
+
+        # start_date is the only account field that can be used, others change during valuation
+        unknown = dependencies.account_attributes - position_names - property_names - date_names - {"start_date"}
+        date_dependent = date_dependent or dependencies.date_dependent
+
+        return cls(name=name, transaction_type=transaction_type, expression=expression,
+                   positions=dependencies.account_attributes & position_names,
+                   properties=dependencies.account_attributes & property_names,
+                   dates=dependencies.account_attributes & date_names,
+                   rate_types=dependencies.account_type_attributes,
+                   transaction_attributes=dependencies.transaction_attributes,
+                   writes=frozenset(position_type_name for position_type_name, _ in position_rules[transaction_type]),
+                   date_dependent=date_dependent,
+                   cacheable=not (date_dependent or dependencies.opaque or unknown or
+                                  not dependencies.account_type_attributes.issubset(account_type.rate_types.keys())))
+
+
+class DependencyGraph(NamedTuple):
+    nodes: Mapping[str, ExpressionNode]
+    # for each node, transaction types whose postings change positions it reads
+    depends_on: Mapping[str, FrozenSet[str]]
+
+    @classmethod
+    def build(cls, nodes: List[ExpressionNode], position_rules: Mapping[str, PositionRules]) -> 'DependencyGraph':
+        writers: Dict[str, set] = {}
+        for transaction_type, rules in position_rules.items():
+            for position_type_name, _ in rules:
+                writers.setdefault(position_type_name, set()).add(transaction_type)
+
+        depends_on = {node.name: frozenset(transaction_type for position_type_name in node.positions
+                                           for transaction_type in writers.get(position_type_name, ()))
+                      for node in nodes}
+
+        return cls(nodes=MappingProxyType({node.name: node for node in nodes}),
+                   depends_on=MappingProxyType(depends_on))
+
+
+class PlannedTrigger(NamedTuple):
+    generated_transaction_type: TransactionType
+    amount_expression: str
+    amount_code: CodeType
+    node: ExpressionNode
+
+
+class PlannedScheduledTransaction(NamedTuple):
+    schedule_name: str
+    transaction_type: TransactionType
+    amount_expression: str
+    amount_code: CodeType
+    node: ExpressionNode
+
+
+class ValuationPlan(NamedTuple):
+    transaction_types: Mapping[str, TransactionType]
+    position_rules: Mapping[str, PositionRules]
+    triggers: Mapping[str, PlannedTrigger]
+    start_of_day: Tuple[PlannedScheduledTransaction, ...]
+    end_of_day: Tuple[PlannedScheduledTransaction, ...]
+    instalment_timing: Optional[ScheduledTransactionTiming]
+    instalment_transaction_type: Optional[TransactionType]
+    dependency_graph: DependencyGraph
+
+    @classmethod
+    def build(cls, account_type: 'AccountType') -> 'ValuationPlan':
+        transaction_types = {tt.name: tt for tt in account_type.transaction_types}
+
+        position_rules = {tt.name: tuple((rule.position_type_name, rule.operation) for rule in tt.position_rules)
+                          for tt in account_type.transaction_types}
+
+        nodes: List[ExpressionNode] = []
+
+        triggers: Dict[str, PlannedTrigger] = {}
+        for triggered_transaction in account_type.triggered_transactions:
+            # only first trigger for transaction type is used, same as get_trigger_transaction
+            if triggered_transaction.trigger_transaction_type_name in triggers:
+                continue
+
+            node = ExpressionNode.build(f"{triggered_transaction.trigger_transaction_type_name}"
+                                        f"->{triggered_transaction.generated_transaction_type}",
+                                        triggered_transaction.generated_transaction_type,
+                                        triggered_transaction.amount_expression,
+                                        triggered_transaction.date_dependent, account_type, position_rules)
+            nodes.append(node)
+
+            triggers[triggered_transaction.trigger_transaction_type_name] = \
+                PlannedTrigger(transaction_types[triggered_transaction.generated_transaction_type],
+                               triggered_transaction.amount_expression,
+                               compile_expression(triggered_transaction.amount_expression),
+                               node)
+
+        scheduled = {ScheduledTransactionTiming.START_OF_DAY: [], ScheduledTransactionTiming.END_OF_DAY: []}
+        for index, scheduled_transaction in enumerate(account_type.scheduled_transactions):
+            # index keeps nodes of scheduled transactions with the same schedule and transaction type apart
+            node = ExpressionNode.build(f"{index}:{scheduled_transaction.schedule_name}"
+                                        f"/{scheduled_transaction.generated_transaction_type}",
+                                        scheduled_transaction.generated_transaction_type,
+                                        scheduled_transaction.amount_expression,
+                                        scheduled_transaction.date_dependent, account_type, position_rules)
+            nodes.append(node)
+
+            scheduled[scheduled_transaction.timing].append(
+                PlannedScheduledTransaction(scheduled_transaction.schedule_name,
+                                            transaction_types[scheduled_transaction.generated_transaction_type],
+                                            scheduled_transaction.amount_expression,
+                                            compile_expression(scheduled_transaction.amount_expression),
+                                            node))
+
+        instalment_type = account_type.instalment_type
+
+        return cls(transaction_types=MappingProxyType(transaction_types),
+                   position_rules=MappingProxyType(position_rules),
+                   triggers=MappingProxyType(triggers),
+                   start_of_day=tuple(scheduled[ScheduledTransactionTiming.START_OF_DAY]),
+                   end_of_day=tuple(scheduled[ScheduledTransactionTiming.END_OF_DAY]),
+                   instalment_timing=instalment_type.timing if instalment_type else None,
+                   instalment_transaction_type=transaction_types[instalment_type.transaction_type]
+                   if instalment_type else None,
+                   dependency_graph=DependencyGraph.build(nodes, position_rules))
+
+
 class AccountType(BaseModel):
     name: str
     label: str
@@ -219,48 +392,90 @@ class AccountType(BaseModel):
     property_types: List[PropertyType] = []
     scheduled_transactions: List[ScheduledTransaction] = []
     instalment_type: InstalmentType = None
+    _valuation_plan: Optional[ValuationPlan] = PrivateAttr(default=None)
+
+    class Config:
+        # account type is shared definition, models referencing it (e.g. AccountValuation) keep the same instance
+        copy_on_model_validation = 'none'
+
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        for transaction_type in self.transaction_types:
+            transaction_type._account_type = self
+
+    def valuation_plan(self) -> ValuationPlan:
+        if self._valuation_plan is None:
+            self._valuation_plan = ValuationPlan.build(self)
+
+        return self._valuation_plan
+
+    def __getstate__(self):
+        # plan holds code objects and read-only mappings, it is rebuilt after unpickling
+        state = super().__getstate__()
+        state["__private_attribute_values__"] = {**state["__private_attribute_values__"], "_valuation_plan": None}
+        return state
+
+    def dependency_graph(self) -> DependencyGraph:
+        return self.valuation_plan().dependency_graph
+
+    def invalidate_valuation_plan(self):
+        # plan is rebuilt on next use; needed only when lists are modified directly instead of using add methods
+        self._valuation_plan = None
 
     def add_property_type(self, name: str, label: str, data_type: DataType, required: bool = True) -> PropertyType:
         property_type = PropertyType(name=name, label=label, data_type=data_type.value, required=required)
         self.property_types.append(property_type)
+        self.invalidate_valuation_plan()
         return property_type
 
     def add_date_type(self, name: str, label: str) -> DateType:
         date_type = DateType(name=name, label=label)
         self.date_types.append(date_type)
+        self.invalidate_valuation_plan()
         return date_type
 
     def add_transaction_type(self, name: str, label: str, maximum_precision: bool = False) -> TransactionType:
         transaction_type = TransactionType(name=name, label=label, maximum_precision=maximum_precision)
+        transaction_type._account_type = self
         self.transaction_types.append(transaction_type)
+        self.invalidate_valuation_plan()
         return transaction_type
 
     def add_position_type(self, name: str, label: str) -> PositionType:
         position_type = PositionType(name=name, label=label)
         self.position_types.append(position_type)
+        self.invalidate_valuation_plan()
         return position_type
 
     def add_rate_type(self, name: str, label: str) -> RateType:
         rate_type = RateType(name=name, label=label)
         self.rate_types[name] = rate_type
+        self.invalidate_valuation_plan()
         return rate_type
 
     def add_trigger_transaction(self, trigger_transaction_type: TransactionType,
-                                generated_transaction_type: TransactionType, amount_expression: str):
+                                generated_transaction_type: TransactionType, amount_expression: str,
+                                date_dependent: bool = False):
         trigger_transaction = TriggeredTransaction(trigger_transaction_type_name=trigger_transaction_type.name,
                                                    generated_transaction_type=generated_transaction_type.name,
-                                                   amount_expression=amount_expression)
+                                                   amount_expression=amount_expression,
+                                                   date_dependent=date_dependent)
         self.triggered_transactions.append(trigger_transaction)
+        self.invalidate_valuation_plan()
 
     def add_schedule_type(self, schedule_type: ScheduleType):
         self.schedule_types.append(schedule_type)
+        self.invalidate_valuation_plan()
 
     def add_scheduled_transaction(self, schedule_type: ScheduleType, timing: ScheduledTransactionTiming,
-                                  generated_transaction_type: TransactionType, amount_expression: str):
+                                  generated_transaction_type: TransactionType, amount_expression: str,
+                                  date_dependent: bool = False):
         scheduled_transaction = ScheduledTransaction(schedule_name=schedule_type.name, timing=timing,
                                                      generated_transaction_type=generated_transaction_type.name,
-                                                     amount_expression=amount_expression)
+                                                     amount_expression=amount_expression,
+                                                     date_dependent=date_dependent)
         self.scheduled_transactions.append(scheduled_transaction)
+        self.invalidate_valuation_plan()
 
     def get_transaction_type(self, transaction_type_name: str) -> TransactionType:
         return next(tt for tt in self.transaction_types if tt.name == transaction_type_name)
@@ -284,6 +499,7 @@ class AccountType(BaseModel):
                                          solve_for_zero_position=solve_for_zero_position,
                                          solve_for_date=solve_for_date)
         self.instalment_type = instalment_type
+        self.invalidate_valuation_plan()
 
     def __getattr__(self, method_name):
         if method_name in self.rate_types:
@@ -0,0 +1,151 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+from itertools import islice
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+from accounts.metadata import AccountType
+from accounts.runtime import Account, AccountValuation, ExternalTransaction, ForecastMode
+
+ExternalTransactions = Dict[date, List[ExternalTransaction]]
+PortfolioTask = Tuple[Hashable, Account, ExternalTransactions]
+AccountProcessor = Callable[[Account, Mapping[str, AccountType], date, ExternalTransactions, date, ForecastMode, bool],
+                            Account]
+
+# account types of the portfolio, set once per worker process by the pool initializer
+_account_types: Dict[str, AccountType] = {}
+
+
+def _init_worker(account_types: Dict[str, AccountType]):
+    global _account_types
+    _account_types = account_types
+
+
+def _value_account(account: Account, account_types: Mapping[str, AccountType], to_date: date,
+                   external_transactions: ExternalTransactions, action_date: date,
+                   forecast_mode: ForecastMode, materialize_transactions: bool) -> Account:
+    account_type = account_types[account.account_type_name]
+    valuation = AccountValuation(account=account, account_type=account_type, action_date=action_date,
+                                 forecast_mode=forecast_mode, materialize_transactions=materialize_transactions)
+    valuation.forecast(to_date, external_transactions)
+
+    return valuation.account
+
+
+def _advance_account(account: Account, account_types: Mapping[str, AccountType], to_date: date,
+                     external_transactions: ExternalTransactions, action_date: date,
+                     forecast_mode: ForecastMode, materialize_transactions: bool) -> Account:
+    account_type = account_types[account.account_type_name]
+    valuation = AccountValuation(account=account, account_type=account_type, action_date=action_date,
+                                 forecast_mode=forecast_mode, materialize_transactions=materialize_transactions)
+    valuation.advance(to_date, external_transactions)
+
+    return valuation.account
+
+
+def _value_chunk(processor: AccountProcessor, chunk: List[PortfolioTask], to_date: date, action_date: date,
+                 forecast_mode: ForecastMode, materialize_transactions: bool) -> List[Tuple[Hashable, Account]]:
+    return [(key, processor(account, _account_types, to_date, external_transactions, action_date,
+                            forecast_mode, materialize_transactions))
+            for key, account, external_transactions in chunk]
+
+
+def _update_account(account: Account, valued: Account) -> Account:
+    # account valued in a worker process is copied back, so that accounts are valued in place with any workers
+    for name in valued.__fields__:
+        setattr(account, name, getattr(valued, name))
+
+    return account
+
+
+def _tasks(accounts: Union[Mapping[Hashable, Account], Iterable[Account]],
+           external_transactions_by_account: Mapping[Hashable, ExternalTransactions]) -> Iterator[PortfolioTask]:
+    items = accounts.items() if isinstance(accounts, Mapping) else enumerate(accounts)
+
+    for key, account in items:
+        yield key, account, external_transactions_by_account.get(key, {})
+
+
+def _chunks(tasks: Iterator[PortfolioTask], chunk_size: int) -> Iterator[List[PortfolioTask]]:
+    while True:
+        chunk = list(islice(tasks, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _process_portfolio(processor: AccountProcessor,
+                       accounts: Union[Mapping[Hashable, Account], Iterable[Account]],
+                       account_types: Mapping[str, AccountType],
+                       to_date: date,
+                       external_transactions_by_account: Optional[Mapping[Hashable, ExternalTransactions]],
+                       workers: Optional[int],
+                       chunk_size: int,
+                       action_date: Optional[date],
+                       forecast_mode: ForecastMode,
+                       materialize_transactions: bool) -> Iterator[Tuple[Hashable, Account]]:
+    external_transactions_by_account = external_transactions_by_account or {}
+    action_date = action_date or to_date
+    workers = workers or os.cpu_count() or 1
+    tasks = _tasks(accounts, external_transactions_by_account)
+
+    if workers <= 1:
+        for key, account, external_transactions in tasks:
+            yield key, processor(account, account_types, to_date, external_transactions, action_date,
+                                 forecast_mode, materialize_transactions)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(dict(account_types),)) as executor:
+        chunks = _chunks(tasks, chunk_size)
+        pending = {}
+
+        # keep a bounded number of chunks in flight, so large books are not pickled up front
+        for chunk in islice(chunks, workers * 2):
+            pending[executor.submit(_value_chunk, processor, chunk, to_date, action_date, forecast_mode,
+                                    materialize_transactions)] = chunk
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                chunk = pending.pop(future)
+                for (key, account, _), (_, valued) in zip(chunk, future.result()):
+                    yield key, _update_account(account, valued)
+
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    pending[executor.submit(_value_chunk, processor, chunk, to_date, action_date,
+                                            forecast_mode, materialize_transactions)] = chunk
+
+
+def value_portfolio(accounts: Union[Mapping[Hashable, Account], Iterable[Account]],
+                    account_types: Mapping[str, AccountType],
+                    to_date: date,
+                    external_transactions_by_account: Optional[Mapping[Hashable, ExternalTransactions]] = None,
+                    workers: Optional[int] = None,
+                    chunk_size: int = 64,
+                    action_date: Optional[date] = None,
+                    forecast_mode: ForecastMode = ForecastMode.DAILY,
+                    materialize_transactions: bool = True) -> Iterator[Tuple[Hashable, Account]]:
+    # accounts are keyed by mapping key, or by position when a sequence is given; results are yielded as
+    # (key, valued account) in order of completion. Accounts are valued in place, those valued in worker processes
+    # are updated from the worker's copy.
+    # Without materialize_transactions only positions are projected, and no transactions are sent back.
+    return _process_portfolio(_value_account, accounts, account_types, to_date, external_transactions_by_account,
+                              workers, chunk_size, action_date, forecast_mode, materialize_transactions)
+
+
+def advance_portfolio(accounts: Union[Mapping[Hashable, Account], Iterable[Account]],
+                      account_types: Mapping[str, AccountType],
+                      to_date: date,
+                      external_transactions_by_account: Optional[Mapping[Hashable, ExternalTransactions]] = None,
+                      workers: Optional[int] = None,
+                      chunk_size: int = 64,
+                      action_date: Optional[date] = None,
+                      forecast_mode: ForecastMode = ForecastMode.DAILY,
+                      materialize_transactions: bool = True) -> Iterator[Tuple[Hashable, Account]]:
+    # end of day batch: each account is processed from the day after its processed_date up to and including
+    # to_date, results are yielded as in value_portfolio and should be persisted by the caller
+    return _process_portfolio(_advance_account, accounts, account_types, to_date, external_transactions_by_account,
+                              workers, chunk_size, action_date, forecast_mode, materialize_transactions)
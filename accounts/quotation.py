@@ -0,0 +1,153 @@
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+from decimal import Decimal
+from itertools import islice
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+from accounts.metadata import AccountType
+from accounts.runtime import Account, AccountValuation, ForecastMode, Schedule
+
+
+class QuoteRequest(BaseModel):
+    start_date: date
+    dates: Dict[str, date] = {}
+    properties: Dict[str, Any] = {}
+    schedules: Dict[str, Schedule] = {}
+
+
+class Quote(NamedTuple):
+    # method is "solved" when instalment was solved for the quote, "scaled" when it was derived from solved
+    # quotes of the same group; elapsed is time spent on the quote
+    instalment: Decimal
+    method: str
+    elapsed: float
+
+
+QuoteTask = Tuple[Hashable, QuoteRequest]
+
+# account type of the quotes, set once per worker process by the pool initializer
+_account_type: Optional[AccountType] = None
+
+
+def _init_worker(account_type: AccountType):
+    global _account_type
+    _account_type = account_type
+
+
+def _structure_key(request: QuoteRequest, scale_property: Optional[str]) -> str:
+    # quotes that differ only in scale property share the key
+    return repr((request.start_date, sorted(request.dates.items()),
+                 sorted((name, repr(value)) for name, value in request.properties.items() if name != scale_property),
+                 sorted((name, repr(schedule.dict(exclude={"cached_dates"})))
+                        for name, schedule in request.schedules.items())))
+
+
+def _solve(account_type: AccountType, request: QuoteRequest, action_date: Optional[date],
+           forecast_mode: ForecastMode) -> Quote:
+    started = time.perf_counter()
+    account = Account(start_date=request.start_date, account_type_name=account_type.name, account_type=account_type,
+                      dates=request.dates, properties=request.properties, schedules=request.schedules)
+    valuation = AccountValuation(account=account, account_type=account_type,
+                                 action_date=action_date or request.start_date, forecast_mode=forecast_mode,
+                                 materialize_transactions=False)
+
+    return Quote(instalment=valuation.solve_instalment(), method="solved", elapsed=time.perf_counter() - started)
+
+
+def _quote_group(account_type: AccountType, group: List[QuoteTask], scale_property: Optional[str],
+                 action_date: Optional[date], forecast_mode: ForecastMode) -> List[Tuple[Hashable, Quote]]:
+    if scale_property is None or len(group) < 3:
+        return [(key, _solve(account_type, request, action_date, forecast_mode)) for key, request in group]
+
+    group = sorted(group, key=lambda task: Decimal(task[1].properties[scale_property]))
+    amounts = [Decimal(request.properties[scale_property]) for _, request in group]
+    middle, last = len(group) // 2, len(group) - 1
+    solved = {index: _solve(account_type, group[index][1], action_date, forecast_mode)
+              for index in (0, middle, last)}
+    high = solved[last]
+
+    # instalment is proportional to scale property when rates do not depend on it in the range of the group;
+    # checked on the smallest and middle quote against the largest (rates can differ between the ends only),
+    # allowing for the rounding of the smaller one to cents
+    def proportional(index: int) -> bool:
+        ratio = amounts[last] / amounts[index]
+        return abs(solved[index].instalment * ratio - high.instalment) <= Decimal("0.005") * ratio + Decimal("0.01")
+
+    linear = amounts[0] > 0 and proportional(0) and proportional(middle)
+    quotes = []
+
+    for index, (key, request) in enumerate(group):
+        if index in solved:
+            quotes.append((key, solved[index]))
+        elif not linear:
+            quotes.append((key, _solve(account_type, request, action_date, forecast_mode)))
+        else:
+            started = time.perf_counter()
+            instalment = round(high.instalment * amounts[index] / amounts[last], 2)
+            quotes.append((key, Quote(instalment=instalment, method="scaled", elapsed=time.perf_counter() - started)))
+
+    return quotes
+
+
+def _quote_groups(groups: List[List[QuoteTask]], scale_property: Optional[str], action_date: Optional[date],
+                  forecast_mode: ForecastMode) -> List[Tuple[Hashable, Quote]]:
+    return [quote for group in groups
+            for quote in _quote_group(_account_type, group, scale_property, action_date, forecast_mode)]
+
+
+def _groups(requests: Union[Mapping[Hashable, QuoteRequest], Iterable[QuoteRequest]],
+            scale_property: Optional[str]) -> List[List[QuoteTask]]:
+    items = requests.items() if isinstance(requests, Mapping) else enumerate(requests)
+    groups: Dict[Hashable, List[QuoteTask]] = defaultdict(list)
+
+    for key, request in items:
+        if scale_property is not None and scale_property not in request.properties:
+            # can not be scaled, solved on its own
+            groups[(None, key)].append((key, request))
+        else:
+            groups[_structure_key(request, scale_property)].append((key, request))
+
+    return list(groups.values())
+
+
+def quote_loans(account_type: AccountType,
+                requests: Union[Mapping[Hashable, QuoteRequest], Iterable[QuoteRequest]],
+                scale_property: Optional[str] = None,
+                workers: Optional[int] = None,
+                groups_per_task: int = 4,
+                action_date: Optional[date] = None,
+                forecast_mode: ForecastMode = ForecastMode.DAILY) -> Iterator[Tuple[Hashable, Quote]]:
+    # solves instalment for each quote request, keyed by mapping key or by position when a sequence is given;
+    # results are yielded as (key, quote) in order of completion. Requests that differ only in scale_property
+    # (e.g. advance amount) are grouped, and when instalment is found to be proportional to it only the smallest,
+    # middle and largest quote of the group are solved, others are scaled (to within a cent of solved instalment).
+    groups = _groups(requests, scale_property)
+    workers = workers or os.cpu_count() or 1
+
+    if workers <= 1:
+        for group in groups:
+            yield from _quote_group(account_type, group, scale_property, action_date, forecast_mode)
+        return
+
+    # largest groups first, so that they do not finish last
+    groups.sort(key=len, reverse=True)
+    tasks = iter([groups[start:start + groups_per_task] for start in range(0, len(groups), groups_per_task)])
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(account_type,)) as executor:
+        pending = {executor.submit(_quote_groups, task, scale_property, action_date, forecast_mode)
+                   for task in islice(tasks, workers * 2)}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                yield from future.result()
+
+                task = next(tasks, None)
+                if task is not None:
+                    pending.add(executor.submit(_quote_groups, task, scale_property, action_date, forecast_mode))
@@ -1,13 +1,49 @@
+import copy
+import heapq
+import time
+from bisect import bisect_left, bisect_right
+from calendar import monthrange
+from concurrent.futures import ProcessPoolExecutor
+from decimal import ROUND_CEILING, ROUND_FLOOR, Context, Inexact, Rounded, getcontext
 from datetime import timedelta
 from itertools import groupby
-from typing import Mapping, Any
+from typing import Mapping, Any, Callable, Iterable, Iterator, Union
 from dateutil.relativedelta import *
-from pydantic import Field
+from pydantic import Field, PrivateAttr
+from pydantic.validators import decimal_validator
 
+from accounts.business_days import BusinessDayTable, from_ordinals, is_weekday, to_ordinals
+from accounts.expressions import Expression, analyze_expression, compile_expression, expression_text
+from accounts.ledger import Ledger
+from accounts.schedule_cache import schedule_dates
 from accounts.metadata import *
+import numpy as np
 import scipy.optimize
 
 
+def repeated_balance(balance: Decimal, operation: TransactionOperation, amount: Decimal, times: int) -> Decimal:
+    # balance after applying operation times in a row. Every partial balance lies between balance and the result,
+    # so when neither is rounded at the exponent of the sum no step is, and amount is multiplied instead
+    if operation not in (TransactionOperation.CREDIT, TransactionOperation.DEBIT):  # Replace
+        return amount
+    if times <= 0:
+        return balance
+
+    exact = Context(prec=getcontext().prec, traps=[Inexact, Rounded])
+    try:
+        exact.add(balance, exact.multiply(amount, 0))
+        if operation == TransactionOperation.CREDIT:
+            return exact.add(balance, exact.multiply(amount, times))
+        return exact.subtract(balance, exact.multiply(amount, times))
+    except (Inexact, Rounded):
+        pass
+
+    for _ in range(times):
+        balance = balance + amount if operation == TransactionOperation.CREDIT else balance - amount
+
+    return balance
+
+
 class Position(BaseModel):
     amount: Decimal = Decimal(0)
 
@@ -19,12 +55,35 @@ class Position(BaseModel):
         else:  # Replace
             self.amount = amount
 
+    def apply_repeated(self, operation: TransactionOperation, amount: Decimal, times: int):
+        # same result as calling apply_operation times in a row, without model overhead on each step
+        self.amount = repeated_balance(self.amount, operation, amount, times)
+
     def copy(self):
         position = Position()
         position.amount = self.amount
         return position
 
 
+class DecimalPosition:
+    # position used during valuation, without model overhead on each posting
+    __slots__ = ("amount",)
+
+    def __init__(self, amount: Decimal):
+        self.amount = amount
+
+    def apply_operation(self, operation: TransactionOperation, amount: Decimal):
+        if operation == TransactionOperation.CREDIT:
+            self.amount = self.amount + amount
+        elif operation == TransactionOperation.DEBIT:
+            self.amount = self.amount - amount
+        else:  # Replace
+            self.amount = amount
+
+    def apply_repeated(self, operation: TransactionOperation, amount: Decimal, times: int):
+        self.amount = repeated_balance(self.amount, operation, amount, times)
+
+
 class Transaction(BaseModel):
     amount = Decimal(0)
     action_date: date
@@ -40,31 +99,203 @@ class Transaction(BaseModel):
             value_date=self.value_date
         )
 
+    @classmethod
+    def posted(cls, action_date: date, value_date: date, transaction_type: str, amount: Decimal,
+               system_generated: bool) -> 'Transaction':
+        # same as construct for values already of field types; all fields are set, so instances share one set of
+        # set fields instead of each allocating its own
+        transaction = cls.__new__(cls)
+        object.__setattr__(transaction, "__dict__", {"amount": amount, "action_date": action_date,
+                                                     "value_date": value_date, "transaction_type": transaction_type,
+                                                     "system_generated": system_generated})
+        object.__setattr__(transaction, "__fields_set__", _TRANSACTION_FIELDS)
+        return transaction
+
+
+_TRANSACTION_FIELDS = set(Transaction.__fields__)
+
+
+class Posting:
+    # posting made during valuation, as yielded by iter_forecast and given to trigger expressions; account transactions
+    # store its fields, Transaction is created only when they are read
+    __slots__ = ("action_date", "value_date", "transaction_type", "amount", "system_generated")
+
+    def __init__(self, action_date: date, value_date: date, transaction_type: str, amount: Decimal,
+                 system_generated: bool):
+        self.action_date = action_date
+        self.value_date = value_date
+        self.transaction_type = transaction_type
+        self.amount = amount
+        self.system_generated = system_generated
+
+    def to_transaction(self) -> Transaction:
+        return Transaction.posted(self.action_date, self.value_date, self.transaction_type, self.amount,
+                                  self.system_generated)
+
+
+class Transactions(Ledger):
+    # account transactions, kept in ledger columns; Transaction models are created when entries are read
+    def __init__(self, entries: Iterable = ()):
+        super().__init__(Transaction.posted)
+        self.extend(entries)
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, value) -> 'Transactions':
+        if isinstance(value, Transactions):
+            return copy.deepcopy(value)
+        if isinstance(value, dict) or not isinstance(value, Iterable):
+            raise TypeError("transactions must be a list")
+
+        return cls(entry if isinstance(entry, (Transaction, Posting)) else Transaction.parse_obj(entry)
+                   for entry in value)
+
+
+def add_months(value: date, months: int) -> date:
+    # same as value + relativedelta(months=months), day is clamped to the end of month
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, monthrange(year, month)[1]))
+
+
+def _contains(sorted_dates: List[date], value: date) -> bool:
+    index = bisect_left(sorted_dates, value)
+    return index < len(sorted_dates) and sorted_dates[index] == value
+
 
 class Schedule(BaseModel):
     start_date: date
     end_type: ScheduleEndType
     frequency: ScheduleFrequency
-    interval: int = 0,
+    interval: int = 0
     adjustment: BusinessDayAdjustment = BusinessDayAdjustment.NO_ADJUSTMENT
     end_date: Optional[date]
     number_of_repeats: int = 0
     include_dates: list[date] = []
     exclude_dates: list[date] = []
+    # no longer filled, due dates are calculated
     cached_dates: dict[date, date] = Field(default_factory=dict, exclude=True)
+    # sorted include dates that are not excluded, sorted exclude dates and last date of the rule
+    _exceptions: Optional[Tuple[List[date], List[date], date]] = PrivateAttr(default=None)
+    # copies of include and exclude dates the exceptions were built from, to notice lists changed in place
+    _exception_dates: Optional[Tuple[List[date], List[date]]] = PrivateAttr(default=None)
+    # due dates until last date of the rule, shared with schedules having the same fields (see schedule_cache)
+    _due_dates: Optional[Tuple[date, ...]] = PrivateAttr(default=None)
+    # calendar key the due dates were adjusted with, they are calculated again when holidays are added
+    _calendar_key: Optional[Tuple[date, ...]] = PrivateAttr(default=None)
+    # calendar used to move dates of the rule to business days according to adjustment, not adjusted without one.
+    # Not a field, so that it is not serialized with every schedule; given again when account is parsed (see Account)
+    _calendar: Optional['Calendar'] = PrivateAttr(default=None)
 
     class Config:
         # exclude the "cached_dates" field from JSON serialization
         exclude = {"cached_dates"}
 
+    def __init__(self, calendar: Optional['Calendar'] = None, **kw):
+        super().__init__(**kw)
+        self._calendar = calendar
+
+    @property
+    def calendar(self) -> Optional['Calendar']:
+        return self._calendar
+
+    def __setattr__(self, name, value):
+        if name not in ("_exceptions", "_exception_dates", "_due_dates", "_calendar_key"):
+            self._exceptions = None
+            self._due_dates = None
+
+        if name == "calendar":
+            name = "_calendar"
+
+        super().__setattr__(name, value)
+
+    def __exceptions(self) -> Tuple[List[date], List[date], date]:
+        if self._exceptions is None or self._exception_dates != (self.include_dates, self.exclude_dates):
+            excludes = sorted(set(self.exclude_dates))
+            self._exceptions = (sorted(set(self.include_dates).difference(excludes)), excludes, self.__last_date())
+            self._exception_dates = (list(self.include_dates), list(self.exclude_dates))
+            self._due_dates = None
+
+        return self._exceptions
+
     def __is_simple_daily_schedule(self):
         return (self.frequency == ScheduleFrequency.DAILY and
                 self.interval == 1 and
                 self.adjustment == BusinessDayAdjustment.NO_ADJUSTMENT)
 
+    def __is_adjusted(self) -> bool:
+        return self.calendar is not None and self.adjustment != BusinessDayAdjustment.NO_ADJUSTMENT
+
     def __last_date(self):
         return self.start_date + relativedelta(years=+50)
 
+    def is_daily(self) -> bool:
+        # due on every day from start date, until end date if there is one
+        return self.__is_simple_daily_schedule() and self.end_type != ScheduleEndType.END_REPEATS
+
+    def __occurrence(self, repeat: int) -> date:
+        # repeat-th date of the rule, counted from 0 at start date
+        if self.frequency == ScheduleFrequency.DAILY:
+            return self.start_date + timedelta(days=self.interval * repeat)
+
+        return add_months(self.start_date, self.interval * repeat)
+
+    def __is_active(self, repeat: int, value: date, last_date: date) -> bool:
+        if value > last_date:
+            return False
+        if self.end_type == ScheduleEndType.END_DATE:
+            return self.end_date is None or value <= self.end_date
+        if self.end_type == ScheduleEndType.END_REPEATS:
+            return repeat < self.number_of_repeats
+
+        return True
+
+    def __repeat(self, test_date: date, last_date: date) -> Optional[int]:
+        # repeat of the rule falling on test_date, if any
+        if test_date < self.start_date:
+            return None
+
+        start_day = self.start_date.day
+
+        if self.frequency == ScheduleFrequency.DAILY:
+            offset = (test_date - self.start_date).days
+        elif start_day <= 28 and test_date.day != start_day or start_day > 28 and test_date.day < 28:
+            return None
+        else:
+            offset = (test_date.year - self.start_date.year) * 12 + test_date.month - self.start_date.month
+
+        if self.interval <= 0:
+            repeat = 0 if offset == 0 else None
+        else:
+            repeat = offset // self.interval if offset % self.interval == 0 else None
+
+        # day of month is clamped only for start days after 28
+        if repeat is None or start_day > 28 and self.frequency == ScheduleFrequency.MONTHLY and \
+                self.__occurrence(repeat) != test_date:
+            return None
+
+        return repeat if self.__is_active(repeat, test_date, last_date) else None
+
+    def __next_repeat(self, after: date, last_date: date) -> Optional[date]:
+        # first date of the rule after given date
+        if after < self.start_date:
+            repeat = 0
+        elif self.interval <= 0:
+            return None
+        elif self.frequency == ScheduleFrequency.DAILY:
+            repeat = (after - self.start_date).days // self.interval + 1
+        else:
+            repeat = ((after.year - self.start_date.year) * 12 + after.month - self.start_date.month) // self.interval
+            if self.__occurrence(repeat) <= after:
+                repeat += 1
+
+        value = self.__occurrence(repeat)
+        return value if self.__is_active(repeat, value, last_date) else None
+
     def is_due(self, test_date: date) -> bool:
         if self.__is_simple_daily_schedule():
             if self.end_type == ScheduleEndType.NO_END:
@@ -72,60 +303,112 @@ class Schedule(BaseModel):
             elif self.end_type == ScheduleEndType.END_DATE:
                 return self.start_date <= test_date <= self.end_date
 
-        if not self.cached_dates:
-            # create dictionary of dates for each date
-            self.cached_dates = {date: date for date in self.get_all_dates(self.__last_date())}
+        if self.__is_adjusted():
+            return _contains(self.due_dates(), test_date)
+
+        includes, excludes, last_date = self.__exceptions()
+
+        if excludes and _contains(excludes, test_date):
+            return False
+        if includes and _contains(includes, test_date):
+            return True
+
+        return self.__repeat(test_date, last_date) is not None
 
-        # check if test_date is in dictionary
-        return test_date in self.cached_dates
+    def next_due_date(self, after: date) -> Optional[date]:
+        # first date after given date on which is_due is True, None if there is none
+        if self.__is_simple_daily_schedule() and self.end_type != ScheduleEndType.END_REPEATS:
+            value = max(after + timedelta(days=1), self.start_date)
+            if self.end_type == ScheduleEndType.END_DATE and value > self.end_date:
+                return None
+            return value
+
+        if self.__is_adjusted():
+            due_dates = self.due_dates()
+            index = bisect_right(due_dates, after)
+            return due_dates[index] if index < len(due_dates) else None
+
+        includes, excludes, last_date = self.__exceptions()
+
+        value = self.__next_repeat(after, last_date)
+        while value is not None and excludes and _contains(excludes, value):
+            value = self.__next_repeat(value, last_date)
+
+        index = bisect_right(includes, after)
+        if index < len(includes) and (value is None or includes[index] < value):
+            return includes[index]
 
-    def get_all_dates(self, to_date: date):
-        if self.cached_dates:
-            return self.cached_dates.keys()
+        return value
 
-        dates: list[date] = []
-        repeats: int = 1
-        iterator: date = self.start_date
-        adjusted_date = self.__get_adjusted(iterator)
+    def due_dates(self) -> Tuple[date, ...]:
+        # all due dates until last date of the rule (and include dates after it)
+        includes, excludes, last_date = self.__exceptions()
+        calendar_key = self.calendar.key() if self.__is_adjusted() else None
 
-        while not self.__is_completed(repeats, adjusted_date, to_date):
-            dates.append(adjusted_date)
+        if self._due_dates is None or calendar_key is not self._calendar_key:
+            key = (self.start_date, self.end_type, self.frequency, self.interval, self.adjustment, self.end_date,
+                   self.number_of_repeats, tuple(includes), tuple(excludes), calendar_key)
+            self._due_dates = schedule_dates.get(key, lambda: self.__calculate_dates(last_date))
+            self._calendar_key = calendar_key
 
-            iterator = self.__next(repeats)
-            adjusted_date = self.__get_adjusted(iterator)
-            repeats += 1
+        return self._due_dates
 
-        dates.extend(include_date for include_date in self.include_dates if include_date not in dates)
+    def get_due_dates(self, from_date: date, to_date: date) -> List[date]:
+        # sorted due dates between from_date and to_date (inclusive)
+        if self.is_daily():
+            first_date = max(from_date, self.start_date)
+            last_date = to_date if self.end_type == ScheduleEndType.NO_END else min(to_date, self.end_date)
+            return [first_date + timedelta(days=days) for days in range((last_date - first_date).days + 1)]
 
-        dates = [keep_date for keep_date in dates if keep_date not in self.exclude_dates]
+        if to_date <= self.__exceptions()[2]:
+            due_dates = self.due_dates()
+            return list(due_dates[bisect_left(due_dates, from_date):bisect_right(due_dates, to_date)])
 
-        self.cached_dates = {iter: iter for iter in dates}
+        dates: List[date] = []
+        value = from_date if self.is_due(from_date) else self.next_due_date(from_date)
+
+        while value is not None and value <= to_date:
+            dates.append(value)
+            value = self.next_due_date(value)
 
         return dates
 
-    def __next(self, repeats: int) -> date:
-        if self.frequency == ScheduleFrequency.DAILY:
-            return self.start_date + relativedelta(days=+ self.interval * repeats)
+    def get_all_dates(self, to_date: date) -> List[date]:
+        # sorted dates of the rule until to_date, and all include dates, without exclude dates
+        includes, _, last_date = self.__exceptions()
 
-        return self.start_date + relativedelta(months=+ self.interval * repeats)
+        if to_date > last_date:
+            return self.__calculate_dates(to_date)
 
-    def __is_completed(self, repeats: int, test_date: date, last_date: date) -> bool:
-        if test_date > last_date:
-            return True
-        elif self.end_type == ScheduleEndType.END_DATE and test_date > self.end_date:
-            return True
-        elif self.end_type == ScheduleEndType.NO_END:
-            return False
+        due_dates = self.due_dates()
+        index = bisect_right(due_dates, to_date)
+        return list(due_dates[:index]) + includes[bisect_right(includes, to_date):]
+
+    def __calculate_dates(self, to_date: date) -> List[date]:
+        includes, excludes, _ = self.__exceptions()
+        dates: List[date] = []
+
+        repeat = 0
+        value = self.start_date
+        while self.__is_active(repeat, value, to_date) and (self.interval > 0 or repeat == 0):
+            dates.append(value)
+
+            repeat += 1
+            value = self.__occurrence(repeat)
+
+        if self.__is_adjusted():
+            adjustment = ADJUSTMENT_CALCULATIONS[self.adjustment]
+            ordinals = np.fromiter((value.toordinal() for value in dates), dtype=np.int64, count=len(dates))
+            dates = [date.fromordinal(ordinal)
+                     for ordinal in np.unique(self.calendar.adjust_ordinals(ordinals, adjustment)).tolist()]
 
-        return (self.end_type == ScheduleEndType.END_REPEATS and
-                repeats > self.number_of_repeats)
+        if excludes:
+            dates = [value for value in dates if not _contains(excludes, value)]
 
-    def __get_adjusted(self, test_date: date):
-        if self.adjustment == BusinessDayAdjustment.NO_ADJUSTMENT:
-            return test_date
+        if includes:
+            dates = sorted(set(dates).union(includes))
 
-        # TODO add calendar and call get_adjusted()
-        return test_date
+        return dates
 
 
 class ExternalTransaction(BaseModel):
@@ -159,16 +442,26 @@ class Account(BaseModel):
     properties: dict[str, Any] = {}
     dates: dict[str, date] = {}
     schedules: dict[str, Schedule] = {}
-    transactions: list[Transaction] = []
+    transactions: Transactions = Field(default_factory=Transactions)
     instalments: dict[str, Instalment] = {}
+    # last value date for which end of day was run by AccountValuation.advance, positions are as at end of that date
+    processed_date: Optional[date] = None
+    # incremented on every posting to a position, used to detect positions changed since an expression was evaluated
+    _position_versions: dict[str, int] = PrivateAttr(default_factory=dict)
 
-    def __init__(self, **kw):
+    def __init__(self, calendar: Optional['Calendar'] = None, **kw):
+        # calendar is given to schedules without one, it is not serialized: pass it again when account is parsed
         super().__init__(**kw)
+        if calendar is not None:
+            for schedule in self.schedules.values():
+                if schedule.calendar is None:
+                    schedule.calendar = calendar
+
         if "account_type" in kw:
             account_type: AccountType = kw["account_type"]
             self.__validate_properties(account_type)
             self.__initialize_positions(account_type)
-            self.__initialize_schedules(account_type)
+            self.__initialize_schedules(account_type, calendar)
             self.__initialize_instalment(account_type)
 
     def __validate_properties(self, account_type: AccountType):
@@ -181,7 +474,7 @@ class Account(BaseModel):
                 if property_type.name not in self.properties:
                     raise ValueError(f"Property {property_type.name} is required for account type {account_type.name}")
 
-    def __initialize_schedules(self, account_type: AccountType):
+    def __initialize_schedules(self, account_type: AccountType, calendar: Optional['Calendar']):
         for schedule_type in account_type.schedule_types:
             # skip if schedule already exists
             if schedule_type.name in self.schedules:
@@ -196,7 +489,8 @@ class Account(BaseModel):
                 interval=self.evaluate(schedule_type.interval_expression, {"accountType": account_type,
                                                                            "account": self,
                                                                            "value_date": self.start_date}),
-                adjustment=schedule_type.business_day_adjustment)
+                adjustment=schedule_type.business_day_adjustment,
+                calendar=calendar)
 
             if schedule_type.end_date_expression:
                 schedule.end_date = self.evaluate(schedule_type.end_date_expression,
@@ -205,7 +499,10 @@ class Account(BaseModel):
                                                    "value_date": self.start_date})
 
             if schedule_type.number_of_repeats_expression:
-                schedule.number_of_repeats = self.evaluate(schedule_type.number_of_repeats_expression)
+                schedule.number_of_repeats = self.evaluate(schedule_type.number_of_repeats_expression,
+                                                           {"accountType": account_type,
+                                                            "account": self,
+                                                            "value_date": self.start_date})
 
             self.schedules[schedule_type.name] = schedule
 
@@ -231,21 +528,77 @@ class Account(BaseModel):
                 instalment.amount = amount
 
     def add_transaction(self, transaction: Transaction, transaction_type: TransactionType) -> dict[str, Decimal]:
+        return self.post_transaction(transaction, tuple((rule.position_type_name, rule.operation)
+                                                        for rule in transaction_type.position_rules))
+
+    def post_transaction(self, transaction: Transaction, position_rules: PositionRules) -> dict[str, Decimal]:
         updated_positions: dict[str, Decimal] = {}
-        for rule in transaction_type.position_rules:
-            position = self.positions[rule.position_type_name]
-            position.apply_operation(rule.operation, transaction.amount)
-            updated_positions[rule.position_type_name] = position.amount
+        versions = self._position_versions
+        for position_type_name, operation in position_rules:
+            position = self.positions[position_type_name]
+            position.apply_operation(operation, transaction.amount)
+            updated_positions[position_type_name] = position.amount
+            versions[position_type_name] = versions.get(position_type_name, 0) + 1
 
-        self.transactions.append(transaction)
+        self.record(transaction)
 
         return updated_positions
 
-    def evaluate(self, expression: str, locals: Optional[Mapping[str, Any]]) -> Any:
+    def post_amount(self, amount: Decimal, position_rules: PositionRules):
+        # positions only, nothing is added to the ledger
+        versions = self._position_versions
+        for position_type_name, operation in position_rules:
+            self.positions[position_type_name].apply_operation(operation, amount)
+            versions[position_type_name] = versions.get(position_type_name, 0) + 1
+
+    def record(self, entry: Union[Transaction, Posting]):
+        self.transactions.append(entry)
+
+    def truncate_transactions(self, length: int):
+        # removes transactions from position length on
+        self.transactions.truncate(length)
+
+    def ledger(self) -> Ledger:
+        # transactions are stored in the ledger, for aggregate queries
+        return self.transactions
+
+    def find_transactions(self, transaction_type: Optional[str] = None, from_date: Optional[date] = None,
+                          to_date: Optional[date] = None) -> list[Transaction]:
+        # uses ledger indexes, in value date order
+        return self.ledger().query(transaction_type, from_date, to_date)
+
+    def transaction_total(self, transaction_type: Optional[str] = None, from_date: Optional[date] = None,
+                          to_date: Optional[date] = None) -> Decimal:
+        return self.ledger().total(transaction_type, from_date, to_date)
+
+    def __setattr__(self, name, value):
+        # a list assigned to transactions is stored in a ledger as well
+        if name == "transactions" and not isinstance(value, Transactions):
+            value = Transactions.validate(value)
+        super().__setattr__(name, value)
+
+    def dict(self, **kwargs) -> Dict[str, Any]:
+        # transactions are given as a list, as they would be by a list field
+        result = super().dict(**kwargs)
+        if isinstance(result.get("transactions"), Transactions):
+            result["transactions"] = [transaction.dict() for transaction in result["transactions"]]
+        return result
+
+    def post_repeated(self, amount: Decimal, position_rules: PositionRules, times: int):
+        # positions only, transactions for repeated postings are not added to the ledger
+        versions = self._position_versions
+        for position_type_name, operation in position_rules:
+            self.positions[position_type_name].apply_repeated(operation, amount, times)
+            versions[position_type_name] = versions.get(position_type_name, 0) + 1
+
+    def position_version(self, position_type_name: str) -> int:
+        return self._position_versions.get(position_type_name, 0)
+
+    def evaluate(self, expression: Expression, locals: Optional[Mapping[str, Any]]) -> Any:
         try:
-            value = eval(expression, None, locals)
+            value = eval(compile_expression(expression), None, locals)
         except Exception as e:
-            raise ValueError(f'Error evaluating expression: {expression} {e.args}') from e
+            raise ValueError(f'Error evaluating expression: {expression_text(expression)} {e.args}') from e
         else:
             return value
 
@@ -261,6 +614,18 @@ class Account(BaseModel):
 
     class Config:
         exclude = {"config"}
+        # models referencing the account (e.g. AccountValuation) value the same instance
+        copy_on_model_validation = 'none'
+        json_encoders = {Transactions: list}
+
+
+def calendar_dates(from_date: date, to_date: date) -> Iterator[date]:
+    value_date = from_date
+    yield value_date
+
+    while value_date < to_date:
+        value_date = value_date + timedelta(days=1)
+        yield value_date
 
 
 def group_by_date(external_transactions: List[ExternalTransaction]) -> Dict[date, List[ExternalTransaction]]:
@@ -329,12 +694,86 @@ class TransactionTrace(BaseModel):
         return f" {self.transaction.value_date} {self.transaction.transaction_type} {self.transaction.amount} {self.positions}"
 
 
+class ForecastMode(Enum):
+    # visit every calendar day between account start and forecast date
+    DAILY = "daily"
+    # visit only dates on which a schedule is due, an instalment is paid or an external transaction exists
+    EVENT_DRIVEN = "event_driven"
+    # as event driven, but days on which only daily schedules are due are posted as one run per transaction type
+    # when amounts can not change during the run. Transactions of a run are not added to account transactions, the
+    # run is kept in accrual_runs instead (AccrualRun.transactions creates them when needed)
+    COLLAPSED = "collapsed"
+    # visit every calendar day with a forecast function generated for the account type (see accounts.codegen)
+    COMPILED = "compiled"
+
+
+class AccrualRun(BaseModel):
+    transaction_type: str
+    from_date: date
+    days: int
+    amount: Decimal
+
+    def transactions(self, action_date: date) -> Iterator[Transaction]:
+        for day in range(self.days):
+            yield Transaction(action_date=action_date, value_date=self.from_date + timedelta(days=day),
+                              transaction_type=self.transaction_type, amount=self.amount, system_generated=True)
+
+
+class BalanceSnapshot(NamedTuple):
+    value_date: date
+    positions: Dict[str, Decimal]
+
+
+ForecastEvent = Union[Posting, AccrualRun, BalanceSnapshot]
+
+
+class SolverReport(NamedTuple):
+    # method is "linear" when the secant solution was verified, "bracketed" when the bracketed fallback was used,
+    # or name of the root finder used by Solver.goal_seek
+    method: str
+    iterations: int
+    elapsed: float
+    residual: Decimal
+
+
+class Checkpoint(BaseModel):
+    # state before start of day on value_date: positions and number of entries recorded until then
+    value_date: date
+    positions: Dict[str, Decimal]
+    transaction_count: int
+    # account processed date in that state: day before value_date when the account is being advanced
+    processed_date: Optional[date]
+    accrual_run_count: int
+    trace_count: int
+    posting_count: int
+
+
 class AccountValuation(BaseModel):
     account: Account
     account_type: AccountType
     action_date: date
     trace: bool = False
     trace_list: List[TransactionTrace] = []
+    forecast_mode: ForecastMode = ForecastMode.DAILY
+    accrual_runs: List[AccrualRun] = []
+    memoize: bool = True
+    # when False only positions are updated, postings are counted but not added to account transactions
+    materialize_transactions: bool = True
+    # positions are saved every checkpoint_interval days or months of forecast (none if checkpoint_frequency is not
+    # set), so that reforecast can continue from the latest checkpoint before a back-dated change
+    checkpoint_frequency: Optional[ScheduleFrequency] = None
+    checkpoint_interval: int = 1
+    checkpoints: List[Checkpoint] = []
+    _collapsible: Dict[tuple, bool] = PrivateAttr(default_factory=dict)
+    _memo: Dict[str, tuple] = PrivateAttr(default_factory=dict)
+    _change_dates: Optional[List[date]] = PrivateAttr(default=None)
+    _posting_count: int = PrivateAttr(default=0)
+    # postings made since last visited date, collected while iter_forecast yields postings
+    _events: Optional[List[ForecastEvent]] = PrivateAttr(default=None)
+    _solver_report: Optional[SolverReport] = PrivateAttr(default=None)
+    _solver_iterations: int = PrivateAttr(default=0)
+    # state before the first date on which calculated instalments are used, shared by iterations of a solve
+    _instalment_prefix: Optional[Checkpoint] = PrivateAttr(default=None)
 
     def init_account(self):
         # reset all positions to zero
@@ -342,55 +781,387 @@ class AccountValuation(BaseModel):
             position.amount = Decimal(0)
 
         self.account.transactions = []
+        self.account.processed_date = None
 
         self.trace_list = []
+        self.accrual_runs = []
+        self.checkpoints = []
+        self._posting_count = 0
+        self.reset_memo()
+
+    @property
+    def posting_count(self) -> int:
+        # postings made since account was initialized, including those not added to transactions
+        return self._posting_count
+
+    @property
+    def solver_report(self) -> Optional[SolverReport]:
+        # iterations and elapsed time of the last solve_instalment
+        return self._solver_report
+
+    def reset_memo(self):
+        # forget previously calculated amounts, needed when properties or rates are changed between valuations
+        self._memo.clear()
+        self._change_dates = None
+
+    def reforecast(self, change_date: date, to_value_date: date,
+                   external_transactions: dict[date, List[ExternalTransaction]]):
+        # forecast again after a change with value date change_date (external transaction, property value), starting
+        # from the latest checkpoint on or before change_date; later transactions and checkpoints are discarded
+        index = bisect_right([checkpoint.value_date for checkpoint in self.checkpoints], change_date) - 1
+
+        if index < 0:
+            self.init_account()
+            self.forecast(to_value_date, external_transactions)
+            return
+
+        checkpoint = self.checkpoints[index]
+        advanced = self.account.processed_date is not None
+        self.__restore(checkpoint)
+
+        # an advanced account is advanced again, so that it can be advanced further afterwards
+        if advanced:
+            self.advance(to_value_date, external_transactions)
+        else:
+            self.forecast(to_value_date, external_transactions, from_date=checkpoint.value_date)
+
+    def __restore(self, checkpoint: Checkpoint):
+        # state before start of day on checkpoint date, later checkpoints are discarded
+        for name, position in self.account.positions.items():
+            position.amount = checkpoint.positions[name]
+
+        self.account.truncate_transactions(checkpoint.transaction_count)
+        self.account.processed_date = checkpoint.processed_date
+        del self.accrual_runs[checkpoint.accrual_run_count:]
+        del self.trace_list[checkpoint.trace_count:]
+        del self.checkpoints[bisect_right([c.value_date for c in self.checkpoints], checkpoint.value_date):]
+        self._posting_count = checkpoint.posting_count
+
+    def advance(self, to_value_date: date, external_transactions: dict[date, List[ExternalTransaction]]):
+        # processes days after account.processed_date (from start date for a new account) up to and including
+        # to_value_date, end of day is run for to_value_date as well
+        if self.account.processed_date:
+            from_date = self.account.processed_date + timedelta(days=1)
+        else:
+            from_date = self.account.start_date
+
+        if to_value_date < from_date:
+            return
+
+        for _ in self.iter_forecast(to_value_date, external_transactions, postings=False, from_date=from_date,
+                                    end_of_day=True):
+            pass
 
-    def forecast(self, to_value_date: date, external_transactions: dict[date, List[ExternalTransaction]]):
-        value_date = self.account.start_date
+        self.account.processed_date = to_value_date
 
-        self.start_of_day(value_date)
-        self.process_external_transactions(value_date, external_transactions)
+    def forecast(self, to_value_date: date, external_transactions: dict[date, List[ExternalTransaction]],
+                 from_date: Optional[date] = None):
+        for _ in self.iter_forecast(to_value_date, external_transactions, postings=False, from_date=from_date):
+            pass
 
-        while value_date < to_value_date:
-            self.end_of_day(value_date)
+    def iter_forecast(self, to_value_date: date, external_transactions: dict[date, List[ExternalTransaction]],
+                      postings: bool = True, snapshots: bool = False,
+                      from_date: Optional[date] = None, end_of_day: bool = False) -> Iterator[ForecastEvent]:
+        # after each visited date yields postings made since previous one (Posting, or AccrualRun for collapsed
+        # runs), followed by positions at the end of the date if snapshots is set. Forecast continues only when next
+        # event is requested; positions are written back to the account when generator is exhausted or closed.
+        # from_date is used to continue from a checkpoint, positions must be as they were before that date.
+        # Last day is started but not ended, unless end_of_day is set.
+        # position models are replaced with plain objects while forecast is running
+        positions = self.account.positions
+        originals = dict(positions)
 
-            value_date = value_date + timedelta(days=1)
+        for name, position in originals.items():
+            positions[name] = DecimalPosition(position.amount)
+
+        self._events = [] if postings else None
+
+        try:
+            for value_date in self.__forecast(to_value_date, external_transactions, postings or snapshots,
+                                              from_date or self.account.start_date, end_of_day):
+                if self._events:
+                    yield from self._events
+                    self._events.clear()
+
+                if snapshots:
+                    yield BalanceSnapshot(value_date, {name: position.amount for name, position in positions.items()})
+        finally:
+            self._events = None
+
+            for name, position in originals.items():
+                position.amount = positions[name].amount
+                positions[name] = position
+
+    def _can_compile(self, streaming: bool, from_date: date, end_of_last_day: bool) -> bool:
+        # compiled forecast runs a whole forecast from the account start, posting and recording only
+        if self.forecast_mode != ForecastMode.COMPILED:
+            return False
+        if self.trace or self.checkpoint_frequency:
+            return False
+
+        return not (streaming or end_of_last_day) and from_date == self.account.start_date
+
+    def __forecast(self, to_value_date: date, external_transactions: dict[date, List[ExternalTransaction]],
+                   streaming: bool, from_date: date, end_of_last_day: bool) -> Iterator[date]:
+        # yields each visited date after it is processed
+        collapse = self.forecast_mode == ForecastMode.COLLAPSED
+        self.reset_memo()
+
+        if self._can_compile(streaming, from_date, end_of_last_day):
+            # imported here as generated code is executed with this module's globals
+            from accounts.codegen import compile_forecast
+
+            compiled_forecast = compile_forecast(self.account_type)
+            compiled_forecast(self.account, self.account_type, self.action_date, to_value_date,
+                              external_transactions, self.__record)
+            return
+
+        if self.forecast_mode == ForecastMode.DAILY:
+            value_dates = calendar_dates(from_date, to_value_date)
+        else:
+            value_dates = self.event_dates(from_date, to_value_date, external_transactions, collapse_daily=collapse)
+
+        previous_date = None
+        next_checkpoint = None
+        if self.checkpoint_frequency:
+            next_checkpoint = self.__next_checkpoint_date(self.checkpoints[-1].value_date) if self.checkpoints \
+                else from_date
+
+        # unless end_of_last_day is set, last day is started but not ended, so that forecast can be continued with
+        # external transactions
+        for value_date in value_dates:
+            if collapse and previous_date and (value_date - previous_date).days > 1:
+                self.__process_daily_run(previous_date + timedelta(days=1), value_date)
+
+            previous_date = value_date
+
+            if next_checkpoint and value_date >= next_checkpoint:
+                self.checkpoints.append(self.__checkpoint(value_date, end_of_last_day))
+                next_checkpoint = self.__next_checkpoint_date(value_date)
 
             self.start_of_day(value_date)
             self.process_external_transactions(value_date, external_transactions)
 
+            if value_date < to_value_date or end_of_last_day:
+                self.end_of_day(value_date)
+
+            yield value_date
+
+    def __checkpoint(self, value_date: date, advancing: bool = False) -> Checkpoint:
+        # days before value_date are ended when it is reached by advance, which sets processed date afterwards
+        processed_date = self.account.processed_date
+        if advancing and value_date > self.account.start_date:
+            processed_date = value_date - timedelta(days=1)
+
+        return Checkpoint(value_date=value_date,
+                          positions={name: position.amount for name, position in self.account.positions.items()},
+                          transaction_count=len(self.account.transactions),
+                          processed_date=processed_date,
+                          accrual_run_count=len(self.accrual_runs),
+                          trace_count=len(self.trace_list),
+                          posting_count=self._posting_count)
+
+    def __next_checkpoint_date(self, value_date: date) -> date:
+        if self.checkpoint_frequency == ScheduleFrequency.DAILY:
+            return value_date + relativedelta(days=+self.checkpoint_interval)
+
+        return value_date + relativedelta(months=+self.checkpoint_interval)
+
+    def event_dates(self, from_date: date, to_value_date: date, external_transactions: Iterable[date],
+                    collapse_daily: bool = False) -> Iterator[date]:
+        to_value_date = max(from_date, to_value_date)
+        plan = self.account_type.valuation_plan()
+
+        timeline: List[List[date]] = [[from_date, to_value_date]]
+
+        schedule_names = {st.schedule_name for st in plan.start_of_day + plan.end_of_day}
+        for schedule_name in sorted(schedule_names):
+            schedule = self.account.schedules[schedule_name]
+
+            if collapse_daily and schedule.is_daily():
+                continue
+
+            timeline.append(schedule.get_due_dates(from_date, to_value_date))
+
+        if collapse_daily:
+            timeline.append(sorted(change_date for change_date in self.__value_change_dates()
+                                   if from_date <= change_date <= to_value_date))
+
+        if plan.instalment_timing:
+            timeline.append(sorted(instalment_date for instalment_date in
+                                   (date.fromisoformat(key) for key in self.account.instalments)
+                                   if from_date <= instalment_date <= to_value_date))
+
+        timeline.append(sorted(value_date for value_date in external_transactions
+                               if from_date <= value_date <= to_value_date))
+
+        last_date = None
+        for value_date in heapq.merge(*timeline):
+            if value_date != last_date:
+                yield value_date
+                last_date = value_date
+
+    def __value_change_dates(self) -> List[date]:
+        # dates on which result of an expression that does not depend on value date otherwise can change
+        change_dates = []
+
+        for rate_type in self.account_type.rate_types.values():
+            change_dates.extend(date.fromisoformat(key) for key in rate_type.rate_tiers)
+
+        for value in self.account.properties.values():
+            if isinstance(value, PropertyValue):
+                change_dates.extend(value.value.keys())
+
+        for schedule in self.account.schedules.values():
+            if schedule.is_daily():
+                change_dates.append(schedule.start_date)
+                if schedule.end_type == ScheduleEndType.END_DATE:
+                    change_dates.append(schedule.end_date + timedelta(days=1))
+
+        return change_dates
+
+    def __process_daily_run(self, from_date: date, to_date: date):
+        # days from from_date until (not including) to_date, on which only daily schedules can be due
+        plan = self.account_type.valuation_plan()
+        days = (to_date - from_date).days
+
+        due = [scheduled_transaction for scheduled_transaction in plan.start_of_day + plan.end_of_day
+               if self.account.schedules[scheduled_transaction.schedule_name].is_due(from_date)]
+
+        if not self.__is_collapsible(due):
+            for value_date in calendar_dates(from_date, to_date - timedelta(days=1)):
+                self.start_of_day(value_date)
+                self.end_of_day(value_date)
+            return
+
+        for scheduled_transaction in due:
+            transaction_type = scheduled_transaction.transaction_type
+            amount = self.__calculate_amount(from_date, transaction_type, scheduled_transaction.amount_code)
+
+            if amount != Decimal(0):
+                self.account.post_repeated(amount, plan.position_rules[transaction_type.name], days)
+                self._posting_count += days
+
+                if self.materialize_transactions or self._events is not None:
+                    accrual_run = AccrualRun(transaction_type=transaction_type.name, from_date=from_date, days=days,
+                                             amount=amount)
+                    if self.materialize_transactions:
+                        self.accrual_runs.append(accrual_run)
+                    if self._events is not None:
+                        self._events.append(accrual_run)
+
+    def __is_collapsible(self, scheduled_transactions: List[PlannedScheduledTransaction]) -> bool:
+        key = tuple(st.node.name for st in scheduled_transactions)
+
+        if key not in self._collapsible:
+            self._collapsible[key] = not self.trace and self.__inputs_not_changed_by(scheduled_transactions)
+
+        return self._collapsible[key]
+
+    def __inputs_not_changed_by(self, scheduled_transactions: List[PlannedScheduledTransaction]) -> bool:
+        # amounts stay the same for a run if no transaction in the run changes a position read by any of them
+        plan = self.account_type.valuation_plan()
+        read_positions = set()
+        written_positions = set()
+
+        for scheduled_transaction in scheduled_transactions:
+            node = scheduled_transaction.node
+
+            if scheduled_transaction.transaction_type.name in plan.triggers or not node.cacheable:
+                return False
+
+            read_positions.update(node.positions)
+            written_positions.update(node.writes)
+
+        return read_positions.isdisjoint(written_positions)
+
+    def __signature(self, node: ExpressionNode, value_date: date, transaction: Optional[Transaction]):
+        # inputs of expression: versions of positions it reads, value change period and transaction it reacts to
+        if not self.memoize or not node.cacheable:
+            return None
+
+        if self._change_dates is None:
+            self._change_dates = sorted(set(self.__value_change_dates()))
+
+        return (tuple(self.account.position_version(position_type_name) for position_type_name in node.positions),
+                bisect_right(self._change_dates, value_date),
+                tuple(getattr(transaction, name) for name in node.transaction_attributes) if transaction else None)
+
+    def __scheduled_amount(self, value_date: date, scheduled_transaction: PlannedScheduledTransaction) -> Decimal:
+        node = scheduled_transaction.node
+        signature = self.__signature(node, value_date, None)
+
+        if signature is not None:
+            previous = self._memo.get(node.name)
+            if previous is not None and previous[0] == signature:
+                return previous[1]
+
+        amount = self.__calculate_amount(value_date, scheduled_transaction.transaction_type,
+                                         scheduled_transaction.amount_code)
+
+        if signature is not None:
+            self._memo[node.name] = (signature, amount)
+
+        return amount
+
+    def __trigger_amount(self, value_date: date, triggered_transaction: PlannedTrigger,
+                         transaction: Transaction) -> Decimal:
+        node = triggered_transaction.node
+        signature = self.__signature(node, value_date, transaction)
+
+        if signature is not None:
+            previous = self._memo.get(node.name)
+            if previous is not None and previous[0] == signature:
+                return previous[1]
+
+        amount = self.account.evaluate(triggered_transaction.amount_code,
+                                       {"transaction": transaction,
+                                        "accountType": self.account_type,
+                                        "account": self.account,
+                                        "value_date": value_date})
+
+        if signature is not None:
+            self._memo[node.name] = (signature, amount)
+
+        return amount
+
+    def expand_accrual_runs(self) -> Iterator[Transaction]:
+        # daily transactions represented by collapsed runs, in value date order of the runs
+        for accrual_run in self.accrual_runs:
+            yield from accrual_run.transactions(self.action_date)
+
     def process_external_transactions(self, value_date: date,
                                       external_transactions: dict[date, List[ExternalTransaction]]):
         if value_date in external_transactions:
+            transaction_types = self.account_type.valuation_plan().transaction_types
             for external_transaction in external_transactions[value_date]:
-                transaction_type = self.account_type.get_transaction_type(external_transaction.transaction_type_name)
+                transaction_type = transaction_types[external_transaction.transaction_type_name]
                 self.__create_transaction(transaction_type, value_date, external_transaction.amount, False)
 
     def start_of_day(self, value_date):
-        for scheduled_transaction in self.account_type.scheduled_transactions:
-            if scheduled_transaction.timing == ScheduledTransactionTiming.START_OF_DAY:
-                self.__create_transaction_if_due(value_date, scheduled_transaction)
+        plan = self.account_type.valuation_plan()
+
+        for scheduled_transaction in plan.start_of_day:
+            self.__create_transaction_if_due(value_date, scheduled_transaction)
 
-        value_date_str = value_date.strftime('%Y-%m-%d')
+        if plan.instalment_timing == ScheduledTransactionTiming.START_OF_DAY:
+            value_date_str = value_date.strftime('%Y-%m-%d')
 
-        if self.account_type.instalment_type:
-            if self.account_type.instalment_type.timing == ScheduledTransactionTiming.START_OF_DAY \
-                    and value_date_str in self.account.instalments:
+            if value_date_str in self.account.instalments:
                 instalment = self.account.instalments[value_date_str]
-                transaction_type = self.account_type.get_transaction_type(
-                    self.account_type.instalment_type.transaction_type)
-                self.__create_transaction(transaction_type, value_date, instalment.amount, True)
+                self.__create_transaction(plan.instalment_transaction_type, value_date, instalment.amount, True)
 
-    def __create_transaction_if_due(self, value_date: date, scheduled_transaction: ScheduledTransaction):
+    def __create_transaction_if_due(self, value_date: date, scheduled_transaction: PlannedScheduledTransaction):
         schedule = self.account.schedules[scheduled_transaction.schedule_name]
 
         if schedule.is_due(value_date):
-            transaction_type = self.account_type.get_transaction_type(scheduled_transaction.generated_transaction_type)
+            amount = self.__scheduled_amount(value_date, scheduled_transaction)
 
-            self.__create_calculated_transaction(value_date, transaction_type, scheduled_transaction.amount_expression)
+            if amount != Decimal(0):
+                self.__create_transaction(scheduled_transaction.transaction_type, value_date, amount, True)
 
-    def __create_calculated_transaction(self, value_date: date, transaction_type: TransactionType,
-                                        amount_expression: str):
+    def __calculate_amount(self, value_date: date, transaction_type: TransactionType,
+                           amount_expression: Expression) -> Decimal:
         try:
             amount = self.account.evaluate(amount_expression,
                                            {"accountType": self.account_type,
@@ -402,66 +1173,439 @@ class AccountValuation(BaseModel):
 
         except Exception as e:
             raise Exception(
-                f'Error calculating {transaction_type.name} on {value_date} expression : {amount_expression} {e.args}') from e
+                f'Error calculating {transaction_type.name} on {value_date} expression : '
+                f'{expression_text(amount_expression)} {e.args}') from e
         else:
-            if amount != Decimal(0):
-                self.__create_transaction(transaction_type, value_date, amount, True)
+            return amount
 
     def __create_transaction(self, transaction_type: TransactionType, value_date: date,
                              amount: Decimal, system_generated: bool):
+        if not isinstance(amount, Decimal):
+            amount = decimal_validator(amount)
 
-        transaction = Transaction(action_date=self.action_date, value_date=value_date,
-                                  transaction_type=transaction_type.name,
-                                  amount=amount, system_generated=system_generated)
+        plan = self.account_type.valuation_plan()
+        position_rules = plan.position_rules[transaction_type.name]
+        triggered_transaction = plan.triggers.get(transaction_type.name)
+        self._posting_count += 1
 
-        positions = self.account.add_transaction(transaction, transaction_type)
+        if not (self.trace or triggered_transaction or self._events is not None):
+            self.account.post_amount(amount, position_rules)
+            if self.materialize_transactions:
+                self.account.transactions.record(self.action_date, value_date, transaction_type.name, amount,
+                                                 system_generated)
+            return
 
-        if self.trace:
-            self.trace_list.append(TransactionTrace(transaction=transaction, positions=positions))
+        transaction = Posting(self.action_date, value_date, transaction_type.name, amount, system_generated)
 
-        triggered_transaction = self.account_type.get_trigger_transaction(transaction_type.name)
+        if self._events is not None:
+            self._events.append(transaction)
+
+        if self.materialize_transactions:
+            positions = self.account.post_transaction(transaction, position_rules)
+        else:
+            self.account.post_amount(amount, position_rules)
+            positions = {name: self.account.positions[name].amount for name, _ in position_rules}
+
+        if self.trace:
+            self.trace_list.append(TransactionTrace(transaction=transaction.to_transaction(), positions=positions))
 
         if triggered_transaction:
-            trigger_amount = self.account.evaluate(triggered_transaction.amount_expression,
-                                                   {"transaction": transaction,
-                                                    "accountType": self.account_type,
-                                                    "account": self.account,
-                                                    "value_date": value_date})
+            trigger_amount = self.__trigger_amount(value_date, triggered_transaction, transaction)
 
-            generated_transaction_type = self.account_type.get_transaction_type(
-                triggered_transaction.generated_transaction_type)
-            self.__create_transaction(generated_transaction_type, value_date, trigger_amount, True)
+            self.__create_transaction(triggered_transaction.generated_transaction_type, value_date,
+                                      trigger_amount, True)
+
+    def __record(self, transaction_type_name: str, value_date: date, amount: Decimal,
+                 system_generated: bool) -> Decimal:
+        # used by compiled forecast, which applies position rules itself with the returned amount
+        if not isinstance(amount, Decimal):
+            amount = decimal_validator(amount)
+
+        self._posting_count += 1
+        if self.materialize_transactions:
+            self.account.transactions.record(self.action_date, value_date, transaction_type_name, amount,
+                                             system_generated)
+        return amount
 
     def end_of_day(self, value_date):
-        for scheduled_transaction in self.account_type.scheduled_transactions:
-            if scheduled_transaction.timing == ScheduledTransactionTiming.END_OF_DAY:
-                self.__create_transaction_if_due(value_date, scheduled_transaction)
+        for scheduled_transaction in self.account_type.valuation_plan().end_of_day:
+            self.__create_transaction_if_due(value_date, scheduled_transaction)
 
     def __calculate_for_instalment(self, value: Decimal) -> Decimal:
-        self.init_account()
+        self._solver_iterations += 1
+        solve_for_date = self.account.dates[self.account_type.instalment_type.solve_for_date]
+        prefix = self._instalment_prefix
+
+        if prefix is not None:
+            self.__restore(prefix)
+        else:
+            self.init_account()
 
         self.account.apply_calculated_installment(value)
-        self.forecast(self.account.dates[self.account_type.instalment_type.solve_for_date], {})
-        result = self.account.positions[self.account_type.instalment_type.solve_for_zero_position].amount
-        print(f'instalment {value} -> {self.account_type.instalment_type.solve_for_zero_position} {result}')
-        return result
+        self.forecast(solve_for_date, {}, from_date=prefix.value_date if prefix else None)
+        return self.account.positions[self.account_type.instalment_type.solve_for_zero_position].amount
+
+    def __prepare_instalment_prefix(self):
+        # days before the first instalment that is not fixed do not depend on the solved amount, they are
+        # forecast once and each iteration continues from there
+        self._instalment_prefix = None
+        solve_for_date = self.account.dates[self.account_type.instalment_type.solve_for_date]
+        first_date = min((date.fromisoformat(key) for key, instalment in self.account.instalments.items()
+                          if not instalment.is_fixed), default=None)
+
+        if first_date is None or not self.account.start_date < first_date <= solve_for_date:
+            return
+
+        self.init_account()
+        for _ in self.iter_forecast(first_date - timedelta(days=1), {}, postings=False, end_of_day=True):
+            pass
+
+        self._instalment_prefix = self.__checkpoint(first_date)
+
+    def __instalment_residual(self, value: float) -> float:
+        return float(self.__calculate_for_instalment(Decimal(repr(value))))
+
+    def __solve_linear(self, xtol: Decimal, max_iterations: int) -> Tuple[bool, Decimal, Decimal, Decimal]:
+        # secant steps from 0 and 1, position is affine in the instalment amount for a standard amortizing loan.
+        # Solution is accepted when position at the cent rounded amount is within xtol of the root at that slope.
+        # Returns whether last amount was verified, last amount, its position and slope
+        x0, f0 = Decimal(0), self.__calculate_for_instalment(Decimal(0))
+        x1, f1 = Decimal(1), self.__calculate_for_instalment(Decimal(1))
+        slope = f1 - f0
+
+        for _ in range(max_iterations):
+            if slope == 0:
+                return False, x1, f1, slope
+
+            x2 = round(x1 - f1 / slope, 2)
+            f2 = self.__calculate_for_instalment(x2)
+
+            if abs(f2) <= abs(slope) * xtol:
+                return True, x2, f2, slope
+
+            if x2 == x1:
+                return False, x2, f2, slope
+
+            x0, f0, x1, f1 = x1, f1, x2, f2
+            slope = (f1 - f0) / (x1 - x0)
 
-    def solve_instalment(self) -> Decimal:
-        amount = scipy.optimize.brentq(self.__calculate_for_instalment, Decimal(-100000000), Decimal(100000000),
-                                       xtol=Decimal(0.01))
+        return False, x1, f1, slope
+
+    def __bracket(self, estimate: Decimal, residual: Decimal, slope: Decimal) -> Tuple[float, float]:
+        # bracket around estimate, widened until position changes sign
+        step = float(abs(residual / slope)) * 2 if slope else 1.0
+        step = max(step, 1.0)
+
+        while step <= 1e9:
+            low, high = float(estimate) - step, float(estimate) + step
+            if self.__instalment_residual(low) * self.__instalment_residual(high) <= 0:
+                return low, high
+            step *= 10
+
+        raise ValueError(f'No instalment bracket found around {estimate}')
+
+    def solve_instalment(self, xtol: Decimal = Decimal("0.01"), max_iterations: int = 4) -> Decimal:
+        # only the solved position is needed from each iteration
+        materialize_transactions = self.materialize_transactions
+        self.materialize_transactions = False
+        started = time.perf_counter()
+        self._solver_iterations = 0
+
+        try:
+            self.__prepare_instalment_prefix()
+            verified, amount, residual, slope = self.__solve_linear(xtol, max_iterations)
+            method = "linear"
+
+            if not verified:
+                method = "bracketed"
+                low, high = self.__bracket(amount, residual, slope)
+                amount = round(Decimal(repr(scipy.optimize.brentq(self.__instalment_residual, low, high,
+                                                                  xtol=float(xtol)))), 2)
+                residual = self.__calculate_for_instalment(amount)
+        finally:
+            self.materialize_transactions = materialize_transactions
+            self._instalment_prefix = None
+
+        self._solver_report = SolverReport(method=method, iterations=self._solver_iterations,
+                                           elapsed=time.perf_counter() - started, residual=residual)
+
+        if materialize_transactions:
+            # iterations only updated positions, forecast for the solved amount is run again to record transactions
+            self.__calculate_for_instalment(amount)
 
-        amount = Decimal(round(amount, 2))
         # apply amount to instalments
         self.account.apply_calculated_installment(amount)
 
         return amount
 
 
+class PropertyVariable(NamedTuple):
+    # property of the account, value dated properties get the value from start date
+    name: str
+    digits: int = 2
+
+    def apply(self, valuation: AccountValuation, value: Decimal):
+        account = valuation.account
+        if isinstance(account.properties.get(self.name), PropertyValue):
+            account.properties[self.name] = PropertyValue(value={account.start_date: value})
+        else:
+            account.properties[self.name] = value
+
+
+class RateVariable(NamedTuple):
+    # all tiers of a rate type get the same rate; rate types are part of the account type, which is shared by all
+    # accounts of it, so the solver restores the rates once a value is evaluated
+    name: str
+    digits: int = 6
+
+    def rate_tiers(self, valuation: AccountValuation) -> List[RateTier]:
+        return [rate_tier for rate_tiers in valuation.account_type.rate_types[self.name].rate_tiers.values()
+                for rate_tier in rate_tiers]
+
+    def apply(self, valuation: AccountValuation, value: Decimal):
+        for rate_tier in self.rate_tiers(valuation):
+            rate_tier.rate = value
+
+    def restore(self, valuation: AccountValuation, rates: List[Decimal]):
+        for rate_tier, rate in zip(self.rate_tiers(valuation), rates):
+            rate_tier.rate = rate
+
+
+class TermVariable(NamedTuple):
+    # date (e.g. end date) as number of months from account start date; schedule include dates and instalment on
+    # the previous date are moved to the new one, end dates of schedules derived from the date are evaluated again
+    # and instalments are added for due dates of a longer term
+    date_name: str
+    digits: int = 0
+
+    def apply(self, valuation: AccountValuation, value: Decimal):
+        account = valuation.account
+        account_type = valuation.account_type
+        previous_date = account.dates[self.date_name]
+        new_date = account.start_date + relativedelta(months=+int(value))
+
+        if new_date == previous_date:
+            return
+
+        account.dates[self.date_name] = new_date
+
+        for schedule in account.schedules.values():
+            if previous_date in schedule.include_dates:
+                schedule.include_dates = [new_date if include_date == previous_date else include_date
+                                          for include_date in schedule.include_dates]
+
+        for schedule_type in account_type.schedule_types:
+            schedule = account.schedules.get(schedule_type.name)
+            if schedule is not None and schedule_type.end_date_expression and \
+                    self.__depends_on_date(schedule_type.end_date_expression):
+                schedule.end_date = account.evaluate(schedule_type.end_date_expression,
+                                                     {"accountType": account_type, "account": account,
+                                                      "value_date": account.start_date})
+
+        previous_key, new_key = previous_date.strftime("%Y-%m-%d"), new_date.strftime("%Y-%m-%d")
+        previous_instalment = account.instalments.get(previous_key)
+        if previous_instalment is not None and new_key not in account.instalments:
+            account.instalments[new_key] = account.instalments.pop(previous_key)
+
+        instalment_type = account_type.instalment_type
+        if instalment_type and instalment_type.schedule_name in account.schedules:
+            amount = previous_instalment.amount if previous_instalment is not None else Decimal(0)
+            for due_date in account.schedules[instalment_type.schedule_name].get_all_dates(new_date):
+                key = due_date.strftime("%Y-%m-%d")
+                if due_date <= new_date and key not in account.instalments:
+                    account.instalments[key] = Instalment(amount=amount, is_fixed=False)
+
+    def __depends_on_date(self, expression: str) -> bool:
+        dependencies = analyze_expression(expression)
+        return dependencies.opaque or self.date_name in dependencies.account_attributes
+
+
+SolverVariable = Union[PropertyVariable, RateVariable, TermVariable]
+
+
+class PositionTarget(NamedTuple):
+    # position at the end of forecast to date of the account
+    position_type_name: str
+    date_name: str
+
+    def evaluate(self, valuation: AccountValuation) -> Decimal:
+        valuation.init_account()
+        valuation.forecast(valuation.account.dates[self.date_name], {})
+        return valuation.account.positions[self.position_type_name].amount
+
+
+class InstalmentTarget(NamedTuple):
+    # calculated instalment, see AccountValuation.solve_instalment
+    def evaluate(self, valuation: AccountValuation) -> Decimal:
+        return valuation.solve_instalment()
+
+
+SolverTarget = Union[PositionTarget, InstalmentTarget]
+
+# called as root_finder(f, low, high, xtol=xtol), e.g. scipy.optimize.brentq, bisect, ridder or toms748
+RootFinder = Callable[..., float]
+
+# valuation of the solver, set once per worker process by the pool initializer
+_solver_valuer: Optional[AccountValuation] = None
+
+
+def _init_solver_worker(valuer: AccountValuation):
+    global _solver_valuer
+    _solver_valuer = valuer
+
+
+def _evaluate_goal(valuer: AccountValuation, variable: SolverVariable, target: SolverTarget,
+                   value: Decimal) -> Decimal:
+    rates = [rate_tier.rate for rate_tier in variable.rate_tiers(valuer)] \
+        if isinstance(variable, RateVariable) else None
+
+    try:
+        variable.apply(valuer, value)
+        return target.evaluate(valuer)
+    finally:
+        if rates is not None:
+            variable.restore(valuer, rates)
+
+
+def _evaluate_goal_in_worker(variable: SolverVariable, target: SolverTarget, value: Decimal) -> Decimal:
+    return _evaluate_goal(_solver_valuer, variable, target, value)
+
+
 class Solver:
+    # goal seek: finds value of a variable for which target evaluates to target value. Values are rounded to digits
+    # of the variable, and results of evaluated values are kept until the next goal seek (or clear_memo). With
+    # workers > 1 candidates for bracket are evaluated in worker processes, on copies of valuation made when pool is
+    # started; pool is started again by every goal seek, so it sees changes to account made in between.
     valuer: AccountValuation
+    root_finder: RootFinder
+    workers: int
+    report: Optional[SolverReport]
 
-    def __init__(self, valuer: AccountValuation):
+    def __init__(self, valuer: AccountValuation, root_finder: RootFinder = scipy.optimize.brentq, workers: int = 1):
         self.valuer = valuer
+        self.root_finder = root_finder
+        self.workers = workers
+        self.report = None
+        self.__memo: Dict[Tuple[SolverVariable, SolverTarget, Decimal], Decimal] = {}
+        self.__executor: Optional[ProcessPoolExecutor] = None
+        self.__evaluations = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+
+    def clear_memo(self):
+        # needed when account or account type is changed between evaluations outside of goal seek
+        self.__memo.clear()
+
+    @staticmethod
+    def __round(variable: SolverVariable, value: float, rounding=None) -> Decimal:
+        return Decimal(repr(value)).quantize(Decimal(1).scaleb(-variable.digits), rounding=rounding)
+
+    def evaluate(self, variable: SolverVariable, target: SolverTarget, value: Decimal) -> Decimal:
+        key = (variable, target, value)
+
+        if key not in self.__memo:
+            self.__evaluations += 1
+            self.__memo[key] = _evaluate_goal(self.valuer, variable, target, value)
+
+        return self.__memo[key]
+
+    def evaluate_many(self, variable: SolverVariable, target: SolverTarget,
+                      values: Iterable[Decimal]) -> List[Decimal]:
+        values = list(values)
+        missing = list(dict.fromkeys(value for value in values if (variable, target, value) not in self.__memo))
+
+        if self.workers > 1 and len(missing) > 1:
+            if self.__executor is None:
+                self.__executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_solver_worker,
+                                                      initargs=(self.valuer,))
+
+            futures = [self.__executor.submit(_evaluate_goal_in_worker, variable, target, value) for value in missing]
+            for value, future in zip(missing, futures):
+                self.__evaluations += 1
+                self.__memo[(variable, target, value)] = future.result()
+
+        return [self.evaluate(variable, target, value) for value in values]
+
+    def find_bracket(self, variable: SolverVariable, target: SolverTarget, target_value: Decimal, guess: Decimal,
+                     step: Decimal, lower: Optional[Decimal] = None, upper: Optional[Decimal] = None,
+                     max_expansions: int = 30) -> Tuple[Decimal, Decimal]:
+        # values guess -/+ step * 2 ** k are evaluated, a batch of k per round when evaluated in parallel, until
+        # target crosses target value; bracket closest to guess is returned
+        points: Dict[Decimal, Decimal] = {guess: self.evaluate(variable, target, guess) - target_value}
+        batch = max(1, self.workers // 2)
+
+        for first in range(0, max_expansions, batch):
+            candidates = []
+            for k in range(first, min(first + batch, max_expansions)):
+                for sign in (-1, 1):
+                    candidate = self.__round(variable, float(guess + sign * step * 2 ** k))
+                    if lower is not None:
+                        candidate = max(candidate, lower)
+                    if upper is not None:
+                        candidate = min(candidate, upper)
+                    candidates.append(candidate)
+
+            for candidate, result in zip(candidates, self.evaluate_many(variable, target, candidates)):
+                points[candidate] = result - target_value
+
+            below = sorted(value for value in points if value <= guess)
+            above = sorted(value for value in points if value >= guess)
+
+            for low, high in zip(reversed(below[:-1]), reversed(below[1:])):
+                if points[low] * points[high] <= 0:
+                    return low, high
+
+            for low, high in zip(above[:-1], above[1:]):
+                if points[low] * points[high] <= 0:
+                    return low, high
+
+        raise ValueError(f'No bracket found for {variable} around {guess}')
+
+    def goal_seek(self, variable: SolverVariable, target: SolverTarget, target_value: Decimal = Decimal(0),
+                  guess: Decimal = Decimal(0), step: Decimal = Decimal(1),
+                  bracket: Optional[Tuple[Decimal, Decimal]] = None,
+                  lower: Optional[Decimal] = None, upper: Optional[Decimal] = None) -> Decimal:
+        # solved value is applied to the valuation (rates excepted, see RateVariable), which is left with target
+        # evaluated for it
+        started = time.perf_counter()
+        self.__evaluations = 0
+        self.clear_memo()
+        self.close()
+        materialize_transactions = self.valuer.materialize_transactions
+        self.valuer.materialize_transactions = False
+
+        try:
+            low, high = bracket or self.find_bracket(variable, target, target_value, guess, step, lower, upper)
+
+            xtol = float(Decimal(1).scaleb(-variable.digits)) / 2
+            root = self.root_finder(lambda value: float(self.evaluate(variable, target,
+                                                                      self.__round(variable, value))
+                                                        - target_value),
+                                    float(low), float(high), xtol=xtol)
+
+            # target can be a step function of the rounded variable, value closest to target value is used
+            candidates = {self.__round(variable, root, ROUND_FLOOR), self.__round(variable, root, ROUND_CEILING)}
+            value = min(sorted(candidates), key=lambda candidate: abs(self.evaluate(variable, target, candidate)
+                                                                      - target_value))
+
+            residual = _evaluate_goal(self.valuer, variable, target, value) - target_value
+        finally:
+            self.valuer.materialize_transactions = materialize_transactions
+
+        self.report = SolverReport(method=getattr(self.root_finder, "__name__", "root_finder"),
+                                   iterations=self.__evaluations, elapsed=time.perf_counter() - started,
+                                   residual=residual)
+
+        return value
 
 
 class HolidayDate(BaseModel):
@@ -477,40 +1621,150 @@ class BusinessDayCalculation(Enum):
     NEXT_BUSINESS_DAY_THIS_MONTH_OR_PREVIOUS = "NextBusinessDayThisMonthOrPrevious"
 
 
+# business day calculation of each schedule adjustment
+ADJUSTMENT_CALCULATIONS = {
+    BusinessDayAdjustment.NO_ADJUSTMENT: BusinessDayCalculation.ANY_DAY,
+    BusinessDayAdjustment.NEXT_WORKING_DAY: BusinessDayCalculation.NEXT_BUSINESS_DAY,
+    BusinessDayAdjustment.PREVIOUS_WORKING_DAY: BusinessDayCalculation.PREVIOUS_BUSINESS_DAY,
+    BusinessDayAdjustment.CLOSEST_WORKING_DAY: BusinessDayCalculation.CLOSEST_BUSINESS_DAY_OR_NEXT,
+}
+
+
 class Calendar(BaseModel):
     name: str
     is_default: bool
     holidays: List[HolidayDate] = []
     holidays_map: Dict[date, HolidayDate] = None
+    # range of the business day table, days outside of it are adjusted by stepping day by day
+    table_from_date: date = date(1970, 1, 1)
+    table_to_date: date = date(2100, 12, 31)
+    _table: Optional[BusinessDayTable] = PrivateAttr(default=None)
+    _key: Optional[Tuple[date, ...]] = PrivateAttr(default=None)
+
+    class Config:
+        # schedules share the calendar (and its table) instead of copying it
+        copy_on_model_validation = 'none'
+
+    def __setattr__(self, name, value):
+        if name in ("holidays", "table_from_date", "table_to_date"):
+            self._table = None
+            self._key = None
+        if name == "holidays":
+            super().__setattr__("holidays_map", None)
+
+        super().__setattr__(name, value)
 
     def add(self, description: str, value: date) -> 'Calendar':
-        self.holidays.append(HolidayDate(description=description, value=value))
+        holiday = HolidayDate(description=description, value=value)
+        self.holidays.append(holiday)
+
+        # built map and table are updated rather than built again
+        if self.holidays_map is not None:
+            self.holidays_map[value] = holiday
+        if self._table is not None:
+            self._table.add_holiday(value)
+        self._key = None
         return self
 
+    def key(self) -> Tuple[date, ...]:
+        # holidays of the calendar, calendars with the same key adjust dates the same way
+        if self._key is None:
+            self._key = tuple(sorted(set(holiday.value for holiday in self.holidays)))
+
+        return self._key
+
+    def __table(self) -> BusinessDayTable:
+        if self._table is None:
+            self._table = BusinessDayTable(self.table_from_date, self.table_to_date,
+                                           (holiday.value for holiday in self.holidays))
+
+        return self._table
+
+    def __column(self, adjustment: BusinessDayCalculation) -> np.ndarray:
+        table = self.__table()
+
+        if adjustment == BusinessDayCalculation.PREVIOUS_BUSINESS_DAY:
+            return table.previous
+        if adjustment == BusinessDayCalculation.NEXT_BUSINESS_DAY:
+            return table.next
+        if adjustment == BusinessDayCalculation.CLOSEST_BUSINESS_DAY_OR_NEXT:
+            return table.closest
+
+        return table.this_month_or_previous
+
     def __holidays_map(self):
         if self.holidays_map is None:
             self.holidays_map = {holiday.value: holiday for holiday in self.holidays}
 
         return self.holidays_map
 
-    def is_business_day(self, value: date):
+    def is_business_day(self, value: Union[date, np.ndarray]):
+        # for a datetime64[D] array of dates returns a boolean array
+        if isinstance(value, np.ndarray):
+            return self.__are_business_days(to_ordinals(value))
+
         if value.weekday() == 5 or value.weekday() == 6:
             return False
 
         return value not in self.__holidays_map()
 
+    def __are_business_days(self, ordinals: np.ndarray) -> np.ndarray:
+        table = self.__table()
+        business = table.is_business(ordinals)
+
+        outside = ~table.contains(ordinals)
+        if outside.any():
+            holidays = np.array([holiday.toordinal() for holiday in self.key()], dtype=np.int64)
+            business[outside] = is_weekday(ordinals[outside]) & ~np.isin(ordinals[outside], holidays)
+
+        return business
+
+    def business_days_between(self, from_date: date, to_date: date) -> int:
+        # business days from from_date (inclusive) to to_date (exclusive), negative when to_date is before from_date
+        if to_date < from_date:
+            return -self.business_days_between(to_date, from_date)
+
+        count = self.__table().count(from_date, to_date)
+        if count is not None:
+            return count
+
+        return sum(1 for value in calendar_dates(from_date, to_date - timedelta(days=1))
+                   if value < to_date and self.is_business_day(value))
+
+    def add_business_days(self, value: date, days: int) -> date:
+        # business day that is days business days after value (before it when days is negative), value when 0
+        if days == 0:
+            return value
+
+        result = self.__table().add(value, days)
+        if result is not None:
+            return result
+
+        step = timedelta(days=1 if days > 0 else -1)
+        remaining = abs(days)
+        while remaining > 0:
+            value = value + step
+            if self.is_business_day(value):
+                remaining -= 1
+
+        return value
+
     def get_calculated_business_day(self, value: date, adjustment: BusinessDayCalculation):
         if adjustment == BusinessDayCalculation.ANY_DAY:
             return value
 
+        adjusted = self.__table().adjust(value, self.__column(adjustment))
+        if adjusted is not None:
+            return adjusted
+
         if adjustment == BusinessDayCalculation.PREVIOUS_BUSINESS_DAY:
-            return self.get_previous_business_day(value)
+            return self.__step_to_business_day(value, -1)
 
         if adjustment == BusinessDayCalculation.NEXT_BUSINESS_DAY:
-            return self.get_next_business_day(value)
+            return self.__step_to_business_day(value, 1)
 
-        previous_business_day = self.get_previous_business_day(value)
-        next_business_day = self.get_next_business_day(value)
+        previous_business_day = self.__step_to_business_day(value, -1)
+        next_business_day = self.__step_to_business_day(value, 1)
 
         if adjustment == BusinessDayCalculation.CLOSEST_BUSINESS_DAY_OR_NEXT:
             if (value - previous_business_day).days > (next_business_day - value).days:
@@ -527,14 +1781,31 @@ class Calendar(BaseModel):
 
         return previous_business_day
 
-    def get_previous_business_day(self, date: date):
-        while not self.is_business_day(date):
-            date = date - timedelta(days=1)
+    def adjust_dates(self, dates: np.ndarray, adjustment: BusinessDayCalculation) -> np.ndarray:
+        # get_calculated_business_day of each date of a datetime64[D] array
+        return from_ordinals(self.adjust_ordinals(to_ordinals(dates), adjustment))
+
+    def adjust_ordinals(self, ordinals: np.ndarray, adjustment: BusinessDayCalculation) -> np.ndarray:
+        # same as adjust_dates for an array of date ordinals
+        if adjustment == BusinessDayCalculation.ANY_DAY:
+            return np.asarray(ordinals, dtype=np.int64)
+
+        adjusted = self.__table().adjust_ordinals(ordinals, self.__column(adjustment))
 
-        return date
+        for index in np.flatnonzero(adjusted < 0):
+            adjusted[index] = self.get_calculated_business_day(date.fromordinal(int(ordinals[index])),
+                                                               adjustment).toordinal()
+
+        return adjusted
+
+    def get_previous_business_day(self, date: date):
+        return self.get_calculated_business_day(date, BusinessDayCalculation.PREVIOUS_BUSINESS_DAY)
 
     def get_next_business_day(self, date: date):
-        while not self.is_business_day(date):
-            date = date + timedelta(days=1)
+        return self.get_calculated_business_day(date, BusinessDayCalculation.NEXT_BUSINESS_DAY)
+
+    def __step_to_business_day(self, value: date, step: int) -> date:
+        while not self.is_business_day(value):
+            value = value + timedelta(days=step)
 
-        return date
+        return value
@@ -0,0 +1,138 @@
+from datetime import date, timedelta
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from accounts.metadata import BusinessDayAdjustment, ScheduleEndType, ScheduleFrequency
+from accounts.runtime import ADJUSTMENT_CALCULATIONS, Schedule
+
+# same as date.max, limit for schedules without end date
+_MAX_DATE = np.datetime64(date.max, 'D')
+# dates of the rule this far after to_date are generated for adjusted schedules, so that dates moved back to
+# business days until to_date are included
+_ADJUSTMENT_MARGIN = timedelta(days=31)
+
+
+class ScheduleDates(NamedTuple):
+    # due dates of many schedules as one sorted datetime64[D] array per schedule, concatenated; dates of schedule i
+    # are dates[offsets[i]:offsets[i + 1]]
+    dates: np.ndarray
+    offsets: np.ndarray
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self.dates[self.offsets[index]:self.offsets[index + 1]]
+
+    def is_due(self, index: int, value_date: date) -> bool:
+        dates = self[index]
+        position = np.searchsorted(dates, np.datetime64(value_date, 'D'))
+        return bool(position < len(dates) and dates[position] == np.datetime64(value_date, 'D'))
+
+    def get_due_dates(self, index: int, from_date: date, to_date: date) -> List[date]:
+        # same as Schedule.get_due_dates of schedule index
+        dates = self[index]
+        start = np.searchsorted(dates, np.datetime64(from_date, 'D'), side='left')
+        end = np.searchsorted(dates, np.datetime64(to_date, 'D'), side='right')
+        return dates[start:end].astype(date).tolist()
+
+
+def _add_months(start: np.ndarray, months: np.ndarray) -> np.ndarray:
+    # start + relativedelta(months=months), day clamped to the end of month
+    start_month = start.astype('M8[M]')
+    month = start_month + months
+    day = (start - start_month.astype('M8[D]')).astype(np.int64)
+    days_in_month = ((month + 1).astype('M8[D]') - month.astype('M8[D]')).astype(np.int64)
+    return month.astype('M8[D]') + np.minimum(day, days_in_month - 1)
+
+
+def generate_due_dates(start_dates: np.ndarray, frequencies: Sequence[ScheduleFrequency], intervals: np.ndarray,
+                       end_types: Sequence[ScheduleEndType], end_dates: np.ndarray, number_of_repeats: np.ndarray,
+                       to_date: Optional[date] = None) -> ScheduleDates:
+    # regular dates of the rules, without include and exclude dates; until to_date (if given) and at most 50 years
+    # from start date as in Schedule. end_dates are used for END_DATE end type only, NaT if not set
+    start_dates = np.asarray(start_dates, dtype='M8[D]')
+    intervals = np.asarray(intervals, dtype=np.int64)
+    number_of_repeats = np.asarray(number_of_repeats, dtype=np.int64)
+    end_dates = np.asarray(end_dates, dtype='M8[D]')
+    monthly = np.array([frequency == ScheduleFrequency.MONTHLY for frequency in frequencies], dtype=bool)
+    end_type_values = np.array([end_type.value for end_type in end_types])
+
+    last_dates = _add_months(start_dates, np.full(len(start_dates), 600))
+    if to_date is not None:
+        last_dates = np.minimum(last_dates, np.datetime64(to_date, 'D'))
+
+    has_end_date = (end_type_values == ScheduleEndType.END_DATE.value) & ~np.isnat(end_dates)
+    last_dates = np.where(has_end_date, np.minimum(last_dates, end_dates), last_dates)
+
+    # number of regular dates per schedule
+    step = np.maximum(intervals, 1)
+    days = (last_dates - start_dates).astype(np.int64)
+    months = (last_dates.astype('M8[M]') - start_dates.astype('M8[M]')).astype(np.int64)
+    last_repeat = np.where(monthly, months // step, days // step)
+    last_repeat = np.where(monthly & (_add_months(start_dates, last_repeat * step) > last_dates),
+                           last_repeat - 1, last_repeat)
+    last_repeat = np.where(intervals <= 0, 0, last_repeat)
+
+    counts = np.where(days < 0, 0, last_repeat + 1)
+    counts = np.where(end_type_values == ScheduleEndType.END_REPEATS.value,
+                      np.minimum(counts, np.maximum(number_of_repeats, 0)), counts)
+
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    index = np.repeat(np.arange(len(counts)), counts)
+    repeat = np.arange(offsets[-1]) - offsets[:-1][index]
+    start = start_dates[index]
+    offset = repeat * intervals[index]
+
+    dates = np.where(monthly[index], _add_months(start, offset), start + offset)
+
+    return ScheduleDates(dates=dates, offsets=offsets)
+
+
+def schedule_due_dates(schedules: List[Schedule], to_date: Optional[date] = None) -> ScheduleDates:
+    # due dates of schedules, business day adjustment and include and exclude dates are applied for schedules that
+    # have them; with to_date same as Schedule.get_due_dates(start_date, to_date), otherwise same as
+    # Schedule.due_dates()
+    adjusted = [index for index, schedule in enumerate(schedules)
+                if schedule.calendar is not None and schedule.adjustment != BusinessDayAdjustment.NO_ADJUSTMENT]
+    generate_to_date = to_date + _ADJUSTMENT_MARGIN if adjusted and to_date is not None else to_date
+
+    generated = generate_due_dates(
+        np.array([schedule.start_date for schedule in schedules], dtype='M8[D]'),
+        [schedule.frequency for schedule in schedules],
+        np.array([schedule.interval for schedule in schedules], dtype=np.int64),
+        [schedule.end_type for schedule in schedules],
+        np.array([schedule.end_date if schedule.end_date else 'NaT' for schedule in schedules], dtype='M8[D]'),
+        np.array([schedule.number_of_repeats for schedule in schedules], dtype=np.int64),
+        generate_to_date)
+
+    exceptions = [index for index, schedule in enumerate(schedules)
+                  if schedule.include_dates or schedule.exclude_dates]
+    if not exceptions and not adjusted:
+        return generated
+
+    segments: List[np.ndarray] = [generated[index] for index in range(len(schedules))]
+    limit = np.datetime64(to_date, 'D') if to_date is not None else _MAX_DATE
+
+    for index in adjusted:
+        schedule = schedules[index]
+        segments[index] = np.unique(
+            schedule.calendar.adjust_dates(segments[index], ADJUSTMENT_CALCULATIONS[schedule.adjustment]))
+
+    for index in exceptions:
+        schedule = schedules[index]
+        includes = np.array(schedule.include_dates, dtype='M8[D]')
+        segment = np.union1d(segments[index], includes[includes <= limit])
+        segments[index] = np.setdiff1d(segment, np.array(schedule.exclude_dates, dtype='M8[D]'))
+
+    if adjusted and to_date is not None:
+        segments = [segment[:np.searchsorted(segment, limit, side='right')] for segment in segments]
+
+    offsets = np.zeros(len(segments) + 1, dtype=np.int64)
+    np.cumsum([len(segment) for segment in segments], out=offsets[1:])
+
+    return ScheduleDates(dates=np.concatenate(segments) if segments else np.empty(0, dtype='M8[D]'),
+                         offsets=offsets)
@@ -0,0 +1,77 @@
+import sys
+from collections import OrderedDict
+from datetime import date
+from threading import Lock
+from typing import Callable, Hashable, Iterable, Tuple
+
+_DATE_SIZE = sys.getsizeof(date(2000, 1, 1))
+
+
+class ScheduleDateCache:
+    # due dates of schedules keyed by the fields that define them, shared by all schedules with the same key.
+    # Date sets are tuples, so they can not be changed by a schedule. Least recently used sets are evicted when
+    # size (approximate bytes of tuples and their dates) would exceed max_size.
+    max_size: int
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, max_size: int = 64 * 2 ** 20):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__entries: OrderedDict[Hashable, Tuple[date, ...]] = OrderedDict()
+        self.__lock = Lock()
+
+    @staticmethod
+    def entry_size(dates: Tuple[date, ...]) -> int:
+        return sys.getsizeof(dates) + len(dates) * _DATE_SIZE
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key: Hashable, factory: Callable[[], Iterable[date]]) -> Tuple[date, ...]:
+        with self.__lock:
+            dates = self.__entries.get(key)
+            if dates is not None:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return dates
+
+        # calculated outside of the lock, if two threads miss the same key the first one stored is kept
+        dates = tuple(factory())
+
+        with self.__lock:
+            self.misses += 1
+            if key in self.__entries:
+                return self.__entries[key]
+
+            self.__entries[key] = dates
+            self.size += self.entry_size(dates)
+            self.__evict()
+
+        return dates
+
+    def __evict(self):
+        # most recently added set is kept even if it alone exceeds max_size
+        while self.size > self.max_size and len(self.__entries) > 1:
+            _, dates = self.__entries.popitem(last=False)
+            self.size -= self.entry_size(dates)
+            self.evictions += 1
+
+    def resize(self, max_size: int):
+        with self.__lock:
+            self.max_size = max_size
+            self.__evict()
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+
+
+# process-wide cache used by Schedule
+schedule_dates = ScheduleDateCache()
@@ -0,0 +1,47 @@
+# run from repository root: python -m benchmarks.bench_batch
+
+import time
+from datetime import date
+from decimal import Decimal
+
+from accounts.batch import BatchValuation
+from accounts.runtime import Account, AccountValuation, ExternalTransaction, PropertyValue, group_by_date
+from tests.test_config import create_savings_account
+
+ACCOUNTS = 1000
+TO_DATE = date(2020, 1, 1)
+
+
+def create_accounts(account_type):
+    start_date = date(2019, 1, 1)
+    return [Account(start_date=start_date, account_type_name=account_type.name, account_type=account_type,
+                    properties={"monthlyFee": PropertyValue(value={start_date: Decimal(index % 3)}),
+                                "withholdingTax": PropertyValue(value={start_date: Decimal("0.2")})})
+            for index in range(ACCOUNTS)]
+
+
+def external_transactions(index: int):
+    return group_by_date([ExternalTransaction(transaction_type_name="deposit", amount=Decimal(50 * (index + 1)),
+                                              value_date=date(2019, 1, 1))])
+
+
+def main():
+    account_type = create_savings_account()
+
+    accounts = create_accounts(account_type)
+    started = time.perf_counter()
+    for index, account in enumerate(accounts):
+        AccountValuation(account=account, account_type=account_type, action_date=TO_DATE) \
+            .forecast(TO_DATE, external_transactions(index))
+    print(f"account valuation {ACCOUNTS} accounts, 1 year: {(time.perf_counter() - started) * 1000:8.1f} ms")
+
+    accounts = create_accounts(account_type)
+    started = time.perf_counter()
+    batch = BatchValuation(account_type, accounts, TO_DATE)
+    batch.forecast(TO_DATE, [external_transactions(index) for index in range(ACCOUNTS)])
+    batch.to_accounts()
+    print(f"batch valuation   {ACCOUNTS} accounts, 1 year: {(time.perf_counter() - started) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
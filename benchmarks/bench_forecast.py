@@ -0,0 +1,54 @@
+# run from repository root: python -m benchmarks.bench_forecast
+
+import timeit
+from datetime import date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+
+from accounts.runtime import Account, AccountValuation, ExternalTransaction, ForecastMode, PropertyValue, \
+    group_by_date
+from tests.test_config import create_loan_given_account, create_savings_account
+from tests.test_loanGiven import create_loan_account
+
+REPEAT = 5
+
+
+def savings_forecast(account_type, forecast_mode: ForecastMode):
+    start_date = date(2019, 1, 1)
+    account = Account(start_date=start_date, account_type_name=account_type.name, account_type=account_type,
+                      properties={"monthlyFee": PropertyValue(value={start_date: Decimal(1)}),
+                                  "withholdingTax": PropertyValue(value={start_date: Decimal("0.2")})})
+    valuation = AccountValuation(account=account, account_type=account_type, action_date=start_date,
+                                 forecast_mode=forecast_mode)
+    external_transactions = group_by_date([
+        ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000), value_date=start_date)])
+
+    return lambda: (valuation.init_account(), valuation.forecast(date(2029, 1, 1), external_transactions))
+
+
+def loan_forecast(account_type, forecast_mode: ForecastMode):
+    account, end_date = create_loan_account(account_type, date(2013, 3, 8))
+    account.apply_calculated_installment(Decimal("2964.37"))
+    valuation = AccountValuation(account=account, account_type=account_type, action_date=end_date,
+                                 forecast_mode=forecast_mode)
+
+    return lambda: (valuation.init_account(), valuation.forecast(end_date + relativedelta(days=1), {}))
+
+
+def main():
+    products = {"savings, 10 years": (create_savings_account, savings_forecast),
+                "loan, 25 years": (create_loan_given_account, loan_forecast)}
+
+    for product, (create_account_type, create_forecast) in products.items():
+        account_type = create_account_type()
+        print(product)
+        for forecast_mode in ForecastMode:
+            run = create_forecast(account_type, forecast_mode)
+            run()  # warm up caches and generated code
+            seconds = min(timeit.repeat(run, number=1, repeat=REPEAT))
+            print(f"  {forecast_mode.value:<14} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
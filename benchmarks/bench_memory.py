@@ -0,0 +1,47 @@
+# run from repository root: python -m benchmarks.bench_memory
+
+import gc
+import tracemalloc
+from datetime import date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+
+from accounts.runtime import AccountValuation
+from tests.test_config import create_loan_given_account
+from tests.test_loanGiven import create_loan_account
+
+
+def bytes_per_transaction(materialize: bool) -> (float, int):
+    account_type = create_loan_given_account()
+    account, end_date = create_loan_account(account_type, date(2013, 3, 8))
+    account.apply_calculated_installment(Decimal("2964.37"))
+    valuation = AccountValuation(account=account, account_type=account_type, action_date=end_date)
+
+    # warm up schedule and expression caches, so that only the ledger is measured
+    valuation.forecast(end_date + relativedelta(days=1), {})
+    count = len(account.transactions)
+    valuation.init_account()
+    valuation.materialize_transactions = materialize
+
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+
+    valuation.forecast(end_date + relativedelta(days=1), {})
+
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return (after - before) / count, count
+
+
+def main():
+    for label, materialize in (("ledger", True), ("positions only", False)):
+        size, count = bytes_per_transaction(materialize)
+        print(f"loan, 25 years, {count} transactions, {label:<20} {size:8.1f} bytes per transaction")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# run from repository root: python -m benchmarks.bench_schedules
+
+import time
+from datetime import date, timedelta
+
+from accounts.runtime import BusinessDayAdjustment, Calendar, Schedule, ScheduleEndType, ScheduleFrequency
+from accounts.schedule_arrays import schedule_due_dates
+from accounts.schedule_cache import schedule_dates
+from tests.test_config import get_euro_calendar
+
+SCHEDULES = 10000
+TO_DATE = date(2050, 1, 1)
+
+
+def create_schedules():
+    # monthly schedules of 25 years, with different start dates
+    return [Schedule(start_date=date(2020, 1, 1) + timedelta(days=index % 3650), end_type=ScheduleEndType.END_DATE,
+                     frequency=ScheduleFrequency.MONTHLY, interval=1,
+                     end_date=date(2045, 1, 1) + timedelta(days=index % 3650))
+            for index in range(SCHEDULES)]
+
+
+def create_adjusted_schedules(calendar: Calendar):
+    # monthly schedules of 30 years moved to next working day
+    return [Schedule(start_date=date(2000, 1, 1) + timedelta(days=index % 3650), end_type=ScheduleEndType.END_REPEATS,
+                     frequency=ScheduleFrequency.MONTHLY, interval=1, number_of_repeats=360,
+                     adjustment=BusinessDayAdjustment.NEXT_WORKING_DAY, calendar=calendar)
+            for index in range(SCHEDULES)]
+
+
+def adjust(label: str, calendar: Calendar):
+    schedules = create_adjusted_schedules(calendar)
+    schedule_dates.clear()
+    started = time.perf_counter()
+    count = sum(len(schedule.due_dates()) for schedule in schedules)
+    print(f"{label:12} {SCHEDULES} schedules, {count} dates: {(time.perf_counter() - started) * 1000:8.1f} ms")
+
+
+def main():
+    schedules = create_schedules()
+    schedule_dates.clear()
+    started = time.perf_counter()
+    count = sum(len(schedule.get_due_dates(schedule.start_date, TO_DATE)) for schedule in schedules)
+    print(f"per schedule {SCHEDULES} schedules, {count} dates: {(time.perf_counter() - started) * 1000:8.1f} ms")
+
+    schedules = create_schedules()
+    started = time.perf_counter()
+    due = schedule_due_dates(schedules, TO_DATE)
+    print(f"bulk         {SCHEDULES} schedules, {len(due.dates)} dates: "
+          f"{(time.perf_counter() - started) * 1000:8.1f} ms")
+
+    # business day adjustment by stepping day by day (empty table range) and by table lookup
+    calendar = get_euro_calendar()
+    calendar.table_from_date = calendar.table_to_date = date(1970, 1, 1)
+    adjust("adjust steps", calendar)
+    adjust("adjust table", get_euro_calendar())
+
+    schedules = create_adjusted_schedules(get_euro_calendar())
+    started = time.perf_counter()
+    due = schedule_due_dates(schedules)
+    print(f"adjust bulk  {SCHEDULES} schedules, {len(due.dates)} dates: "
+          f"{(time.perf_counter() - started) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
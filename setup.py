@@ -164,7 +164,8 @@ Given configuration, we can create an account:
     install_requires=[
         'python-dateutil',
         'pydantic',
-        'scipy'
+        'scipy',
+        'numpy'
     ],
     classifiers=[
         'Development Status :: 4 - Beta',
@@ -0,0 +1,68 @@
+import unittest
+
+from accounts.batch import BatchValuation
+from accounts.runtime import *
+from tests.test_config import create_savings_account
+
+
+def create_account(account_type: AccountType, start_date: date, monthly_fee: Decimal, withholding_tax: Decimal,
+                   tax_change_date: Optional[date] = None) -> Account:
+    withholding = {start_date: withholding_tax}
+    if tax_change_date:
+        withholding[tax_change_date] = withholding_tax * 2
+
+    return Account(start_date=start_date, account_type_name=account_type.name, account_type=account_type,
+                   properties={"monthlyFee": PropertyValue(value={start_date: monthly_fee}),
+                               "withholdingTax": PropertyValue(value=withholding)})
+
+
+class TestBatchValuation(unittest.TestCase):
+    def test_matches_account_valuation(self):
+        account_type = create_savings_account()
+        deposit_tt = account_type.get_transaction_type("deposit")
+        to_date = date(2020, 6, 30)
+
+        parameters = [(date(2019, 1, 1), Decimal(1), Decimal("0.2"), None, Decimal(1000)),
+                      (date(2019, 1, 1), Decimal(2), Decimal("0.1"), date(2019, 7, 1), Decimal(25000)),
+                      (date(2019, 3, 15), Decimal(0), Decimal("0.2"), None, Decimal(60000)),
+                      (date(2019, 2, 1), Decimal("1.5"), Decimal("0.15"), date(2020, 1, 1), Decimal("9999.99"))]
+
+        def external_transactions(start_date: date, deposit: Decimal):
+            return group_by_date([
+                ExternalTransaction(transaction_type_name=deposit_tt.name, amount=deposit, value_date=start_date),
+                ExternalTransaction(transaction_type_name=deposit_tt.name, amount=deposit / 2,
+                                    value_date=date(2019, 8, 20))])
+
+        expected = []
+        for start_date, monthly_fee, withholding_tax, tax_change_date, deposit in parameters:
+            account = create_account(account_type, start_date, monthly_fee, withholding_tax, tax_change_date)
+            valuation = AccountValuation(account=account, account_type=account_type, action_date=to_date)
+            valuation.forecast(to_date, external_transactions(start_date, deposit))
+            expected.append(account)
+
+        accounts = [create_account(account_type, start_date, monthly_fee, withholding_tax, tax_change_date)
+                    for start_date, monthly_fee, withholding_tax, tax_change_date, _ in parameters]
+
+        batch = BatchValuation(account_type, accounts, to_date)
+        batch.forecast(to_date, [external_transactions(start_date, deposit)
+                                 for start_date, _, _, _, deposit in parameters])
+
+        for account, expected_account in zip(batch.to_accounts(), expected):
+            for name, position in expected_account.positions.items():
+                self.assertAlmostEqual(position.amount, account.positions[name].amount, places=6)
+
+        self.assertEqual(sum(len(account.transactions) for account in expected), batch.postings)
+
+    def test_missing_property_value(self):
+        account_type = create_savings_account()
+        account = create_account(account_type, date(2019, 1, 1), Decimal(1), Decimal("0.2"))
+        account.properties["monthlyFee"] = PropertyValue(value={date(2019, 6, 1): Decimal(1)})
+
+        batch = BatchValuation(account_type, [account], date(2019, 3, 1))
+
+        with self.assertRaises(ValueError):
+            batch.forecast(date(2019, 3, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 from datetime import date
 
+import numpy as np
+
 from accounts.runtime import BusinessDayCalculation
 from tests.test_config import get_euro_calendar
 
@@ -48,3 +50,74 @@ class TestCalendar(unittest.TestCase):
                          calendar.get_calculated_business_day(date(2019, 9, 29),
                                                               BusinessDayCalculation.
                                                               ANY_DAY))  # no adjustment, non-working day is ok
+
+    def test_outside_of_table(self):
+        calendar = get_euro_calendar()
+        calendar.table_from_date = date(2019, 4, 20)
+        calendar.table_to_date = date(2019, 4, 21)
+
+        # business days outside of the table range are found by stepping day by day
+        self.assertEqual(date(2019, 4, 23), calendar.get_next_business_day(date(2019, 4, 19)))
+        self.assertEqual(date(2019, 4, 18), calendar.get_previous_business_day(date(2019, 4, 22)))
+        self.assertEqual(date(2019, 4, 23),
+                         calendar.get_calculated_business_day(date(2019, 4, 21),
+                                                              BusinessDayCalculation.CLOSEST_BUSINESS_DAY_OR_NEXT))
+        self.assertEqual(date(2000, 1, 3), calendar.get_next_business_day(date(2000, 1, 1)))
+
+    def test_adjust_dates(self):
+        calendar = get_euro_calendar()
+        # no table, business days are found by stepping day by day
+        stepping = get_euro_calendar()
+        stepping.table_from_date = date(2019, 1, 1)
+        stepping.table_to_date = date(2018, 12, 31)
+        dates = np.concatenate([np.arange('2018-12-01', '2020-02-01', dtype='M8[D]'),
+                                np.array([date(1900, 1, 6), date(2100, 12, 31)], dtype='M8[D]')])
+
+        for holiday in (None, date(2019, 4, 23)):
+            if holiday:
+                calendar.add("HOLIDAY", holiday)
+                stepping.add("HOLIDAY", holiday)
+
+            for adjustment in BusinessDayCalculation:
+                self.assertEqual([stepping.get_calculated_business_day(value, adjustment)
+                                  for value in dates.astype(date).tolist()],
+                                 calendar.adjust_dates(dates, adjustment).astype(date).tolist())
+
+    def test_business_days_between(self):
+        calendar = get_euro_calendar()
+
+        # easter friday and monday are not counted, end date is not included
+        self.assertEqual(2, calendar.business_days_between(date(2019, 4, 17), date(2019, 4, 23)))
+        self.assertEqual(-2, calendar.business_days_between(date(2019, 4, 23), date(2019, 4, 17)))
+        self.assertEqual(0, calendar.business_days_between(date(2019, 4, 19), date(2019, 4, 19)))
+        self.assertEqual(262, calendar.business_days_between(date(1968, 1, 1), date(1969, 1, 1)))
+
+    def test_add_business_days(self):
+        calendar = get_euro_calendar()
+
+        self.assertEqual(date(2019, 4, 23), calendar.add_business_days(date(2019, 4, 18), 1))
+        self.assertEqual(date(2019, 4, 24), calendar.add_business_days(date(2019, 4, 20), 2))
+        self.assertEqual(date(2019, 4, 17), calendar.add_business_days(date(2019, 4, 23), -2))
+        self.assertEqual(date(2019, 4, 20), calendar.add_business_days(date(2019, 4, 20), 0))
+        self.assertEqual(date(2101, 1, 3), calendar.add_business_days(date(2100, 12, 30), 2))
+
+    def test_business_days_of_array(self):
+        calendar = get_euro_calendar()
+        dates = np.array([date(2019, 4, 18), date(2019, 4, 19), date(2019, 4, 20), date(1960, 1, 4)], dtype='M8[D]')
+
+        self.assertEqual([True, False, False, True], calendar.is_business_day(dates).tolist())
+
+    def test_add_holiday_after_use(self):
+        calendar = get_euro_calendar()
+        self.assertTrue(calendar.is_business_day(date(2019, 4, 23)))
+        self.assertEqual(3, calendar.business_days_between(date(2019, 4, 17), date(2019, 4, 24)))
+
+        calendar.add("HOLIDAY", date(2019, 4, 23))
+
+        self.assertFalse(calendar.is_business_day(date(2019, 4, 23)))
+        self.assertEqual(2, calendar.business_days_between(date(2019, 4, 17), date(2019, 4, 24)))
+        self.assertEqual(date(2019, 4, 24), calendar.add_business_days(date(2019, 4, 18), 1))
+        self.assertEqual(date(2019, 4, 24),
+                         calendar.get_calculated_business_day(date(2019, 4, 21),
+                                                              BusinessDayCalculation.CLOSEST_BUSINESS_DAY_OR_NEXT))
+        self.assertEqual([False], calendar.is_business_day(np.array([date(2019, 4, 23)], dtype='M8[D]')).tolist())
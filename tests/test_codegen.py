@@ -0,0 +1,149 @@
+import os
+import tempfile
+import unittest
+
+import accounts.codegen
+from accounts.codegen import compile_forecast, generate_forecast_source, account_type_hash
+from accounts.runtime import *
+from tests.test_config import create_savings_account, create_loan_given_account
+from tests.test_loanGiven import create_loan_account
+
+
+class TestCodegen(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.previous_cache_dir = os.environ.get("TRANSACTION_ACCOUNTS_CACHE")
+        os.environ["TRANSACTION_ACCOUNTS_CACHE"] = self.cache_dir.name
+
+    def tearDown(self):
+        if self.previous_cache_dir is None:
+            del os.environ["TRANSACTION_ACCOUNTS_CACHE"]
+        else:
+            os.environ["TRANSACTION_ACCOUNTS_CACHE"] = self.previous_cache_dir
+        self.cache_dir.cleanup()
+
+    @staticmethod
+    def __savings(account_type: AccountType, forecast_mode: ForecastMode) -> Account:
+        start_date = date(2019, 1, 1)
+        account = Account(start_date=start_date, account_type_name=account_type.name,
+                          account_type=account_type,
+                          properties={"monthlyFee": PropertyValue(value={start_date: Decimal(1)}),
+                                      "withholdingTax": PropertyValue(value={start_date: Decimal(0.2),
+                                                                             date(2019, 7, 1): Decimal(0.1)})})
+
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=start_date,
+                                     forecast_mode=forecast_mode)
+        valuation.forecast(date(2020, 1, 1), group_by_date([
+            ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000), value_date=start_date),
+            ExternalTransaction(transaction_type_name="deposit", amount=Decimal(250), value_date=date(2019, 3, 5))]))
+
+        return account
+
+    @staticmethod
+    def __loan(account_type: AccountType, forecast_mode: ForecastMode) -> Account:
+        account, end_date = create_loan_account(account_type, date(2013, 3, 8))
+        account.apply_calculated_installment(Decimal("2964.37"))
+
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=end_date,
+                                     forecast_mode=forecast_mode)
+        valuation.forecast(end_date + relativedelta(days=1), [])
+
+        return account
+
+    def test_savings_same_as_interpreter(self):
+        account_type = create_savings_account()
+
+        interpreted = self.__savings(account_type, ForecastMode.DAILY)
+        compiled = self.__savings(account_type, ForecastMode.COMPILED)
+
+        self.assertEqual(interpreted.transactions, compiled.transactions)
+        self.assertEqual(interpreted.positions, compiled.positions)
+
+    def test_loan_same_as_interpreter(self):
+        account_type = create_loan_given_account()
+
+        interpreted = self.__loan(account_type, ForecastMode.DAILY)
+        compiled = self.__loan(account_type, ForecastMode.COMPILED)
+
+        self.assertEqual(interpreted.transactions, compiled.transactions)
+        self.assertEqual(interpreted.positions, compiled.positions)
+
+    def test_cached_on_disk(self):
+        account_type = create_savings_account()
+
+        compile_forecast(account_type)
+
+        file_name = os.path.join(self.cache_dir.name, f"forecast_{account_type_hash(account_type)}.py")
+        self.assertTrue(os.path.exists(file_name))
+
+        with open(file_name) as f:
+            self.assertEqual(generate_forecast_source(account_type), f.read())
+
+    def test_incomplete_source_on_disk_generated_again(self):
+        account_type = create_savings_account()
+        source = generate_forecast_source(account_type)
+        file_name = os.path.join(self.cache_dir.name, f"forecast_{account_type_hash(account_type)}.py")
+
+        with open(file_name, "w") as f:
+            f.write(source[:len(source) // 2])
+
+        compiled = self.__savings(account_type, ForecastMode.COMPILED)
+
+        self.assertEqual(self.__savings(account_type, ForecastMode.DAILY).positions, compiled.positions)
+        with open(file_name) as f:
+            self.assertEqual(source, f.read())
+
+    def test_compiled_forecasts_bounded(self):
+        for _ in range(accounts.codegen.MAX_COMPILED + 1):
+            compile_forecast(create_savings_account())
+
+        self.assertEqual(accounts.codegen.MAX_COMPILED, len(accounts.codegen._compiled))
+
+    def test_multi_line_expression(self):
+        account_type = create_savings_account()
+        fee_tt = account_type.get_transaction_type("fee")
+        account_type.add_scheduled_transaction(account_type.schedule_types[1], ScheduledTransactionTiming.END_OF_DAY,
+                                               fee_tt, "(account.monthlyFee[value_date]\n + 1)")
+
+        compile_forecast(account_type)
+        interpreted = self.__savings(account_type, ForecastMode.DAILY)
+        compiled = self.__savings(account_type, ForecastMode.COMPILED)
+
+        self.assertEqual(interpreted.transactions, compiled.transactions)
+        self.assertEqual(interpreted.positions, compiled.positions)
+
+    def test_float_expression(self):
+        # amounts are converted to Decimal before positions are updated, as by the interpreter
+        account_type = create_savings_account()
+        interest_accrued_tt = account_type.get_transaction_type("interestAccrued")
+        account_type.add_scheduled_transaction(account_type.schedule_types[0], ScheduledTransactionTiming.END_OF_DAY,
+                                               interest_accrued_tt, "float(account.current) * 0.03 / 365")
+
+        interpreted = self.__savings(account_type, ForecastMode.DAILY)
+        compiled = self.__savings(account_type, ForecastMode.COMPILED)
+
+        self.assertEqual(interpreted.transactions, compiled.transactions)
+        self.assertEqual(interpreted.positions, compiled.positions)
+
+    def test_trigger_reads_transaction(self):
+        account_type = create_savings_account()
+        account_type.triggered_transactions[0].amount_expression = \
+            "transaction.amount * account.withholdingTax[transaction.value_date]"
+
+        interpreted = self.__savings(account_type, ForecastMode.DAILY)
+        compiled = self.__savings(account_type, ForecastMode.COMPILED)
+
+        self.assertEqual(interpreted.transactions, compiled.transactions)
+        self.assertEqual(interpreted.positions, compiled.positions)
+
+    def test_opaque_expression_not_compiled(self):
+        account_type = create_savings_account()
+        fee_tt = account_type.get_transaction_type("fee")
+        account_type.add_scheduled_transaction(account_type.schedule_types[0], ScheduledTransactionTiming.END_OF_DAY,
+                                               fee_tt, "helper(account)")
+
+        self.assertRaises(ValueError, generate_forecast_source, account_type)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,6 +19,68 @@ class TestConfiguration(unittest.TestCase):
         self.assertEqual(text, text2)
 
 
+class ValuationPlanTest(unittest.TestCase):
+    def test_plan(self):
+        account_type = create_savings_account()
+
+        plan = account_type.valuation_plan()
+
+        self.assertIs(plan, account_type.valuation_plan())
+        self.assertEqual("fee", plan.transaction_types["fee"].name)
+        self.assertEqual((("current", TransactionOperation.CREDIT), ("accrued", TransactionOperation.DEBIT)),
+                         plan.position_rules["capitalized"])
+        self.assertEqual("withholdingTax", plan.triggers["capitalized"].generated_transaction_type.name)
+        self.assertEqual(0, len(plan.start_of_day))
+        self.assertEqual(["fee", "interestAccrued", "capitalized"],
+                         [st.transaction_type.name for st in plan.end_of_day])
+
+    def test_dependency_graph(self):
+        account_type = create_savings_account()
+
+        graph = account_type.dependency_graph()
+
+        accrual = graph.nodes["1:accrual/interestAccrued"]
+        self.assertEqual({"current"}, accrual.positions)
+        self.assertEqual({"interest"}, accrual.rate_types)
+        self.assertEqual({"accrued"}, accrual.writes)
+        self.assertTrue(accrual.cacheable)
+        self.assertEqual({"deposit", "fee", "capitalized"}, graph.depends_on["1:accrual/interestAccrued"])
+
+        withholding = graph.nodes["capitalized->withholdingTax"]
+        self.assertEqual({"withholdingTax"}, withholding.properties)
+        self.assertEqual({"amount"}, withholding.transaction_attributes)
+
+    def test_date_dependent_not_cacheable(self):
+        account_type = create_savings_account()
+        fee_tt = account_type.get_transaction_type("fee")
+        compounding = next(st for st in account_type.schedule_types if st.name == "compounding")
+
+        account_type.add_scheduled_transaction(compounding, ScheduledTransactionTiming.END_OF_DAY, fee_tt,
+                                               "account.monthlyFee[value_date]", date_dependent=True)
+
+        nodes = [node for node in account_type.dependency_graph().nodes.values() if node.transaction_type == "fee"]
+        self.assertFalse(nodes[-1].cacheable)
+
+    def test_plan_rebuilt_after_change(self):
+        account_type = create_savings_account()
+
+        plan = account_type.valuation_plan()
+        account_type.add_transaction_type("withdrawal", "Withdrawal")
+
+        self.assertIsNot(plan, account_type.valuation_plan())
+        self.assertIn("withdrawal", account_type.valuation_plan().transaction_types)
+
+    def test_plan_rebuilt_after_position_rule(self):
+        for account_type in (create_savings_account(), AccountType.parse_raw(create_savings_account().json())):
+            plan = account_type.valuation_plan()
+            current = next(position_type for position_type in account_type.position_types
+                           if position_type.name == "current")
+            account_type.get_transaction_type("fee").add_position_rule(TransactionOperation.DEBIT, current)
+
+            self.assertIsNot(plan, account_type.valuation_plan())
+            self.assertEqual(2, len(account_type.valuation_plan().position_rules["fee"]))
+
+
 class RateTest(unittest.TestCase):
     def test_get_max_when_empy(self):
         rate_type = RateType(name='rates', label='Rates')
@@ -0,0 +1,85 @@
+import unittest
+
+from accounts.expressions import ExpressionCache, expression_cache, analyze_expression
+from accounts.runtime import *
+from tests.test_config import create_savings_account
+
+
+class TestExpressionCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = ExpressionCache()
+
+        first = cache.compile("account.current * Decimal(2)")
+        second = cache.compile("account.current * Decimal(2)")
+
+        self.assertIs(first, second)
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(1, cache.hits)
+
+    def test_bounded(self):
+        cache = ExpressionCache(max_size=2)
+
+        cache.compile("1")
+        cache.compile("2")
+        cache.compile("1")
+        cache.compile("3")
+
+        self.assertEqual(2, len(cache))
+        self.assertIn("1", cache)
+        self.assertNotIn("2", cache)
+
+    def test_compile_error_on_load(self):
+        account_type = create_savings_account()
+        fee_tt = account_type.get_transaction_type("fee")
+        schedule_type = account_type.schedule_types[0]
+
+        with self.assertRaises(ValueError):
+            account_type.add_scheduled_transaction(schedule_type, ScheduledTransactionTiming.END_OF_DAY, fee_tt,
+                                                   "account.monthlyFee[value_date")
+
+        json = account_type.json().replace("account.accrued", "account.accrued +")
+
+        with self.assertRaises(ValueError):
+            AccountType.parse_raw(json)
+
+    def test_forecast_reuses_compiled_expressions(self):
+        account_type = create_savings_account()
+        start_date = date(2019, 1, 1)
+        account = Account(start_date=start_date, account_type_name=account_type.name,
+                          account_type=account_type,
+                          properties={"monthlyFee": PropertyValue(value={start_date: Decimal(1)}),
+                                      "withholdingTax": PropertyValue(value={start_date: Decimal(0.2)})})
+
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=start_date)
+
+        misses = expression_cache.misses
+        valuation.forecast(date(2019, 3, 1), {})
+
+        self.assertEqual(misses, expression_cache.misses)
+
+
+class TestExpressionDependencies(unittest.TestCase):
+    def test_accrual(self):
+        dependencies = analyze_expression(
+            "account.current * accountType.interest.get_rate(value_date, account.current) / Decimal(365)")
+
+        self.assertEqual({"current"}, dependencies.account_attributes)
+        self.assertEqual({"interest"}, dependencies.account_type_attributes)
+        self.assertFalse(dependencies.date_dependent)
+        self.assertFalse(dependencies.opaque)
+
+    def test_value_dated_property(self):
+        dependencies = analyze_expression("transaction.amount * account.withholdingTax[value_date]")
+
+        self.assertEqual({"withholdingTax"}, dependencies.account_attributes)
+        self.assertEqual({"amount"}, dependencies.transaction_attributes)
+        self.assertFalse(dependencies.date_dependent)
+
+    def test_date_dependent(self):
+        self.assertTrue(analyze_expression("account.current * value_date.day").date_dependent)
+        self.assertFalse(analyze_expression("len(account.transactions) + 1").opaque)
+        self.assertTrue(analyze_expression("sum(t.amount for t in self.transactions)").opaque)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import pickle
+import unittest
+
+from accounts.ledger import Ledger
+from accounts.runtime import *
+from tests.test_runtime import evaluate_account
+from tests.test_config import create_savings_account
+
+
+class TestLedger(unittest.TestCase):
+    def setUp(self):
+        account_type = create_savings_account()
+        self.account = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                        withholding_tax=Decimal(0.2))
+        self.transactions = list(self.account.transactions)
+        self.ledger = self.account.ledger()
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.transactions), len(self.ledger))
+        self.assertEqual(self.transactions, list(self.ledger))
+        self.assertEqual(str(self.transactions[0].amount), str(self.ledger[0].amount))
+        self.assertEqual(self.transactions, self.account.transactions)
+
+    def test_exact_amounts(self):
+        ledger = Ledger(Transaction.construct, digits=2)
+        amounts = [Decimal("1.25"), Decimal("1E+3"), Decimal("0.125"), Decimal("-0"), Decimal(1) / Decimal(3)]
+
+        for amount in amounts:
+            ledger.append(Transaction(action_date=date(2020, 1, 1), value_date=date(2020, 1, 1),
+                                      transaction_type="deposit", amount=amount, system_generated=False))
+
+        self.assertEqual([str(amount) for amount in amounts], [str(ledger.amount(i)) for i in range(len(ledger))])
+        self.assertEqual(sum(amounts), ledger.sum_by_type()["deposit"])
+
+    def test_sum_by_type_per_month(self):
+        expected = {}
+        for transaction in self.transactions:
+            key = (transaction.transaction_type, transaction.value_date.replace(day=1))
+            expected[key] = expected.get(key, Decimal(0)) + transaction.amount
+
+        result = self.ledger.sum_by_type_per_month()
+
+        self.assertEqual(expected.keys(), result.keys())
+        for key, amount in expected.items():
+            self.assertAlmostEqual(amount, result[key], places=20)
+
+    def test_range_and_last(self):
+        in_range = self.ledger.in_range(date(2019, 3, 1), date(2019, 3, 31))
+
+        self.assertEqual([t for t in self.transactions if date(2019, 3, 1) <= t.value_date <= date(2019, 3, 31)],
+                         in_range)
+        self.assertEqual(self.transactions[-3:], self.ledger.last(3))
+        self.assertEqual(self.transactions, self.ledger.last(len(self.transactions) + 1))
+
+    def test_indexes(self):
+        march = [t for t in self.transactions
+                 if t.transaction_type == "fee" and date(2019, 3, 1) <= t.value_date <= date(2019, 3, 31)]
+
+        self.assertEqual(1, len(march))
+        self.assertEqual(march, self.account.find_transactions("fee", date(2019, 3, 1), date(2019, 3, 31)))
+        self.assertEqual([], self.account.find_transactions("unknown"))
+
+        capitalized = sum(t.amount for t in self.transactions
+                          if t.transaction_type == "capitalized" and t.value_date <= date(2019, 6, 30))
+
+        self.assertEqual(capitalized, self.account.transaction_total("capitalized", to_date=date(2019, 6, 30)))
+
+    def test_indexes_out_of_order(self):
+        ledger = Ledger(Transaction.construct)
+        for day in (5, 1, 3, 1):
+            ledger.append(Transaction(action_date=date(2020, 1, 1), value_date=date(2020, 1, day),
+                                      transaction_type="fee" if day == 1 else "deposit", amount=Decimal(day),
+                                      system_generated=False))
+
+        self.assertEqual([1, 3, 2, 0], list(ledger.indexes()))
+        self.assertEqual([1, 3], list(ledger.indexes("fee")))
+        self.assertEqual([2], list(ledger.indexes("deposit", date(2020, 1, 2), date(2020, 1, 4))))
+        self.assertEqual(Decimal(8), ledger.total("deposit"))
+
+    def test_follows_transactions(self):
+        fee = Transaction(action_date=date(2020, 1, 1), value_date=date(2019, 3, 15), transaction_type="fee",
+                          amount=Decimal(2), system_generated=False)
+        self.account.transactions.append(fee)
+
+        self.assertIs(self.ledger, self.account.ledger())
+        self.assertEqual(2, len(self.account.find_transactions("fee", date(2019, 3, 1), date(2019, 3, 31))))
+
+        self.account.truncate_transactions(len(self.transactions))
+        self.assertEqual(self.transactions, list(self.account.ledger()))
+
+        # entries changed before the end are stored by building the columns again
+        self.account.transactions[-1] = fee
+        self.assertEqual(fee, self.account.ledger()[-1])
+
+        self.account.transactions = [fee]
+        self.assertEqual([fee], list(self.account.ledger()))
+        self.assertIs(self.account.transactions, self.account.ledger())
+
+    def test_account_store(self):
+        # transactions are kept only in the ledger, and read back as models
+        self.assertIs(self.ledger, self.account.transactions)
+        self.assertIsInstance(self.account.transactions[0], Transaction)
+        self.assertEqual(self.transactions, self.account.dict()["transactions"])
+
+        parsed = Account.parse_obj(self.account.dict())
+        self.assertIsInstance(parsed.transactions, Ledger)
+        self.assertEqual(self.transactions, parsed.transactions)
+        self.assertIsNot(self.account.transactions, parsed.transactions)
+
+    def test_pickle(self):
+        ledger = pickle.loads(pickle.dumps(self.ledger))
+
+        self.assertEqual(self.transactions, list(ledger))
+
+
+if __name__ == '__main__':
+    unittest.main()
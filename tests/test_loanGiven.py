@@ -4,7 +4,7 @@ from decimal import Decimal
 
 from dateutil.relativedelta import relativedelta
 from accounts.metadata import AccountType
-from accounts.runtime import Account, PropertyValue, AccountValuation, Schedule
+from accounts.runtime import Account, PropertyValue, AccountValuation, Schedule, ForecastMode, Position
 from tests.test_config import create_loan_given_account
 
 
@@ -118,6 +118,20 @@ class TestConfiguration(unittest.TestCase):
         self.assertAlmostEqual(Decimal(709778.93), account.positions["interest_capitalized"].amount, places=2)
         self.assertAlmostEqual(Decimal(0.005), account.positions["accrued"].amount, places=2)
 
+    def test_collapsed_forecast(self):
+        account_type = create_loan_given_account()
+
+        account, end_date = create_loan_account(account_type, date(2013, 3, 8))
+
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=end_date,
+                                     forecast_mode=ForecastMode.COLLAPSED)
+
+        valuation.forecast(end_date + relativedelta(days=1), [])
+
+        self.assertAlmostEqual(Decimal(1333778.93), account.positions["principal"].amount, places=2)
+        self.assertAlmostEqual(Decimal(709778.93), account.positions["interest_capitalized"].amount, places=2)
+        self.assertAlmostEqual(Decimal(0.005), account.positions["accrued"].amount, places=2)
+
     def test_installments(self):
         account_type = create_loan_given_account()
 
@@ -128,3 +142,59 @@ class TestConfiguration(unittest.TestCase):
         payment = valuation.solve_instalment()
 
         self.assertAlmostEqual(Decimal(2964.37), Decimal(payment), places=2)
+
+    def test_installments_transactions(self):
+        account_type = create_loan_given_account()
+
+        solved, end_date = create_loan_account(account_type, date(2013, 3, 8))
+        payment = AccountValuation(account=solved, account_type=account_type, action_date=end_date).solve_instalment()
+
+        account, _ = create_loan_account(account_type, date(2013, 3, 8))
+        account.apply_calculated_installment(payment)
+        AccountValuation(account=account, account_type=account_type, action_date=end_date).forecast(end_date, {})
+
+        self.assertGreater(len(solved.transactions), 0)
+        self.assertEqual(account.transactions, solved.transactions)
+        self.assertEqual(account.positions, solved.positions)
+
+    def test_installments_linear(self):
+        account_type = create_loan_given_account()
+
+        account, end_date = create_loan_account(account_type, date(2013, 3, 8))
+
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=end_date)
+
+        payment = valuation.solve_instalment()
+
+        self.assertEqual(Decimal("2964.37"), payment)
+        self.assertEqual("linear", valuation.solver_report.method)
+        self.assertLessEqual(valuation.solver_report.iterations, 4)
+
+    def test_installments_bracketed(self):
+        account_type = create_loan_given_account()
+
+        account, end_date = create_loan_account(account_type, date(2013, 3, 8))
+
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=end_date)
+
+        payment = valuation.solve_instalment(max_iterations=0)
+
+        self.assertEqual(Decimal("2964.37"), payment)
+        self.assertEqual("bracketed", valuation.solver_report.method)
+
+    def test_installments_after_grace_period(self):
+        account_type = create_loan_given_account()
+
+        account, end_date = create_loan_account(account_type, date(2013, 3, 8))
+        for key in sorted(account.instalments)[:24]:
+            account.instalments[key].is_fixed = True
+
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=end_date)
+        payment = valuation.solve_instalment()
+
+        # iterations continue from state before the first solved instalment, same as a full forecast
+        valuation.init_account()
+        valuation.forecast(end_date, {})
+
+        self.assertGreater(payment, Decimal("2964.37"))
+        self.assertEqual(valuation.solver_report.residual, account.positions["principal"].amount)
@@ -0,0 +1,89 @@
+import unittest
+
+from accounts.portfolio import advance_portfolio, value_portfolio
+from accounts.runtime import *
+from tests.test_config import create_savings_account
+
+
+def create_account(account_type: AccountType, start_date: date, monthly_fee: Decimal) -> Account:
+    return Account(start_date=start_date, account_type_name=account_type.name, account_type=account_type,
+                   properties={"monthlyFee": PropertyValue(value={start_date: monthly_fee}),
+                               "withholdingTax": PropertyValue(value={start_date: Decimal(0.2)})})
+
+
+class TestPortfolio(unittest.TestCase):
+    def test_parallel_matches_sequential(self):
+        account_type = create_savings_account()
+        start_date = date(2019, 1, 1)
+        deposit_tt = account_type.get_transaction_type("deposit")
+
+        def book():
+            return {f"account-{i}": create_account(account_type, start_date, Decimal(i)) for i in range(6)}
+
+        external_transactions = {
+            f"account-{i}": group_by_date([ExternalTransaction(transaction_type_name=deposit_tt.name,
+                                                               amount=Decimal(1000 * (i + 1)), value_date=start_date)])
+            for i in range(6)}
+
+        sequential = dict(value_portfolio(book(), {account_type.name: account_type}, date(2019, 6, 30),
+                                          external_transactions, workers=1))
+        parallel = dict(value_portfolio(book(), {account_type.name: account_type}, date(2019, 6, 30),
+                                        external_transactions, workers=2, chunk_size=2))
+
+        self.assertEqual(set(sequential), set(parallel))
+
+        for key, account in sequential.items():
+            self.assertNotEqual(Decimal(0), account.current)
+            self.assertEqual(account.positions, parallel[key].positions)
+            self.assertEqual(len(account.transactions), len(parallel[key].transactions))
+
+    def test_valued_in_place(self):
+        account_type = create_savings_account()
+        start_date = date(2019, 1, 1)
+        deposits = {i: group_by_date([ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000),
+                                                          value_date=start_date)]) for i in range(3)}
+
+        for workers in (1, 2):
+            book = [create_account(account_type, start_date, Decimal(1)) for _ in range(3)]
+
+            result = dict(value_portfolio(book, {account_type.name: account_type}, date(2019, 2, 1), deposits,
+                                          workers=workers))
+
+            for index, account in enumerate(book):
+                self.assertIs(account, result[index])
+                self.assertNotEqual(Decimal(0), account.current)
+                self.assertGreater(len(account.transactions), 0)
+
+    def test_sequence_is_keyed_by_position(self):
+        account_type = create_savings_account()
+        accounts = [create_account(account_type, date(2019, 1, 1), Decimal(1)) for _ in range(3)]
+
+        result = dict(value_portfolio(accounts, {account_type.name: account_type}, date(2019, 2, 1), workers=2))
+
+        self.assertEqual({0, 1, 2}, set(result))
+
+    def test_advance_book(self):
+        account_type = create_savings_account()
+        account_types = {account_type.name: account_type}
+        start_date = date(2019, 1, 1)
+        deposits = {i: group_by_date([ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000),
+                                                          value_date=start_date)]) for i in range(3)}
+
+        once = dict(advance_portfolio([create_account(account_type, start_date, Decimal(1)) for _ in range(3)],
+                                      account_types, date(2019, 2, 28), deposits, workers=1))
+
+        book = [create_account(account_type, start_date, Decimal(1)) for _ in range(3)]
+        for to_date in (date(2019, 1, 31), date(2019, 2, 1), date(2019, 2, 28)):
+            book = [account for _, account in sorted(advance_portfolio(book, account_types, to_date, deposits,
+                                                                       workers=2))]
+
+        for index, account in enumerate(book):
+            self.assertEqual(date(2019, 2, 28), account.processed_date)
+            self.assertEqual(once[index].positions, account.positions)
+            # action dates are dates of the batch runs
+            self.assertEqual([(t.value_date, t.transaction_type, t.amount) for t in once[index].transactions],
+                             [(t.value_date, t.transaction_type, t.amount) for t in account.transactions])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+
+from accounts.quotation import QuoteRequest, quote_loans
+from accounts.runtime import *
+from tests.test_config import create_loan_given_account
+from tests.test_loanGiven import create_loan_account
+
+
+def create_request(account_type: AccountType, start_date: date, advance: int) -> QuoteRequest:
+    account, _ = create_loan_account(account_type, start_date)
+    return QuoteRequest(start_date=start_date, dates=account.dates, properties={"advance": advance, "payment": 0},
+                        schedules=account.schedules)
+
+
+class TestQuotation(unittest.TestCase):
+    def test_scaled_same_as_solved(self):
+        account_type = create_loan_given_account()
+        start_date = date(2013, 3, 8)
+        requests = {advance: create_request(account_type, start_date, advance)
+                    for advance in (100000, 250000, 312000, 624000)}
+
+        scaled = dict(quote_loans(account_type, requests, scale_property="advance", workers=1,
+                                  forecast_mode=ForecastMode.COLLAPSED))
+        solved = dict(quote_loans(account_type, requests, workers=1, forecast_mode=ForecastMode.COLLAPSED))
+
+        self.assertEqual(Decimal("2964.37"), scaled[624000].instalment)
+        self.assertEqual(["solved", "scaled", "solved", "solved"], [scaled[key].method for key in sorted(scaled)])
+        self.assertEqual({"solved"}, {quote.method for quote in solved.values()})
+
+        for key, quote in solved.items():
+            self.assertAlmostEqual(quote.instalment, scaled[key].instalment, delta=Decimal("0.01"))
+
+    def test_not_scaled_across_rate_tiers(self):
+        account_type = create_loan_given_account()
+        start_date = date(2013, 3, 8)
+        requests = [create_request(account_type, start_date, advance) for advance in (624000, 1500000, 6000000)]
+
+        quotes = dict(quote_loans(account_type, requests, scale_property="advance", workers=2,
+                                  forecast_mode=ForecastMode.COLLAPSED))
+
+        self.assertEqual({0, 1, 2}, set(quotes))
+        self.assertEqual({"solved"}, {quote.method for quote in quotes.values()})
+        self.assertEqual(Decimal("2964.37"), quotes[0].instalment)
+
+    def test_not_scaled_when_middle_differs(self):
+        account_type = create_loan_given_account()
+        # a higher rate between the smallest and largest advance only
+        rate_type = account_type.rate_types["interest"]
+        rate_type.rate_tiers = {}
+        rate_type.add_tier(date(2000, 1, 1), Decimal(700000), Decimal("0.0304"))
+        rate_type.add_tier(date(2000, 1, 1), Decimal(800000), Decimal("0.06"))
+        rate_type.add_tier(date(2000, 1, 1), Decimal(1E30), Decimal("0.0304"))
+        requests = {advance: create_request(account_type, date(2013, 3, 8), advance)
+                    for advance in (600000, 650000, 750000, 100000000)}
+
+        quotes = dict(quote_loans(account_type, requests, scale_property="advance", workers=1,
+                                  forecast_mode=ForecastMode.COLLAPSED))
+
+        self.assertEqual({"solved"}, {quote.method for quote in quotes.values()})
+        self.assertEqual(Decimal("4211.96"), quotes[750000].instalment)
+
+    def test_without_scale_property(self):
+        account_type = create_loan_given_account()
+        requests = [create_request(account_type, date(2013, 3, 8), 624000) for _ in range(3)]
+        requests[1].properties["segment"] = 1
+        requests[2].properties["segment"] = 2
+
+        quotes = dict(quote_loans(account_type, requests, scale_property="segment", workers=1,
+                                  forecast_mode=ForecastMode.COLLAPSED))
+
+        self.assertEqual({0, 1, 2}, set(quotes))
+        self.assertEqual({Decimal("2964.37")}, {quote.instalment for quote in quotes.values()})
+
+    def test_grouped_by_structure(self):
+        account_type = create_loan_given_account()
+        requests = [create_request(account_type, start_date, 100000 * (index + 1))
+                    for index, start_date in enumerate([date(2013, 3, 8), date(2014, 3, 8), date(2015, 3, 8)])]
+
+        quotes = dict(quote_loans(account_type, requests, scale_property="advance", workers=1,
+                                  forecast_mode=ForecastMode.COLLAPSED))
+
+        self.assertEqual({"solved"}, {quote.method for quote in quotes.values()})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import gc
 import unittest
 
 from accounts.runtime import *
@@ -112,6 +113,230 @@ class TestAccount(unittest.TestCase):
         self.assertEqual(0, len(fee.new))
         self.assertAlmostEqual(Decimal(-0.26), withholding.amount, 2)
 
+    def test_memoized_same_as_evaluated(self):
+        account_type = create_savings_account()
+        start_date = date(2019, 1, 1)
+
+        accounts = []
+        for memoize in (False, True):
+            account = Account(start_date=start_date, account_type_name=account_type.name,
+                              account_type=account_type,
+                              properties={"monthlyFee": PropertyValue(value={start_date: Decimal(1)}),
+                                          "withholdingTax": PropertyValue(value={start_date: Decimal(0.2),
+                                                                                 date(2019, 7, 1): Decimal(0.1)})})
+
+            valuation = AccountValuation(account=account, account_type=account_type, action_date=start_date,
+                                         memoize=memoize)
+            valuation.forecast(date(2020, 1, 1), group_by_date([
+                ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000), value_date=start_date)]))
+            accounts.append(account)
+
+        self.assertEqual(accounts[0].transactions, accounts[1].transactions)
+        self.assertEqual(accounts[0].positions, accounts[1].positions)
+        self.assertGreater(accounts[1].position_version("current"), 0)
+
+    def test_memoized_same_schedule_and_type(self):
+        account_type = create_savings_account()
+        fee_tt = account_type.get_transaction_type("fee")
+        compounding = next(st for st in account_type.schedule_types if st.name == "compounding")
+        account_type.add_scheduled_transaction(compounding, ScheduledTransactionTiming.END_OF_DAY, fee_tt,
+                                               "Decimal(5)")
+
+        start_date = date(2019, 1, 1)
+        account = Account(start_date=start_date, account_type_name=account_type.name, account_type=account_type,
+                          properties={"monthlyFee": PropertyValue(value={start_date: Decimal(1)}),
+                                      "withholdingTax": PropertyValue(value={start_date: Decimal(0.2)})})
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=start_date)
+        valuation.forecast(date(2019, 4, 1), group_by_date([
+            ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000), value_date=start_date)]))
+
+        fees = [transaction.amount for transaction in account.transactions if transaction.transaction_type == "fee"]
+        self.assertEqual([Decimal(1), Decimal(5)] * 3, fees)
+
+    def test_transactions_created_when_accessed(self):
+        def created() -> int:
+            gc.collect()
+            return sum(type(o) is Transaction for o in gc.get_objects())
+
+        account_type = create_savings_account()
+        before = created()
+        account = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                   withholding_tax=Decimal(0.2))
+
+        # postings are stored as ledger rows, no Transaction exists until transactions are read
+        self.assertGreater(len(account.transactions), 0)
+        self.assertEqual(before, created())
+
+        account2 = Account.parse_obj(account.dict())
+
+        self.assertIsInstance(account.transactions[0], Transaction)
+        self.assertEqual(len(account.transactions), len(account2.transactions))
+        self.assertEqual(account.transactions, account2.transactions)
+
+        valuation = AccountValuation(account=account2, account_type=account_type, action_date=date(2020, 1, 1))
+        valuation.end_of_day(date(2020, 1, 1))
+
+        self.assertEqual(len(account.transactions) + 1, len(account2.transactions))
+        self.assertEqual("interestAccrued", account2.transactions[-1].transaction_type)
+        self.assertIsInstance(account2.positions["current"], Position)
+
+    def test_copies_post_separately(self):
+        account_type = create_savings_account()
+        account = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                   withholding_tax=Decimal(0.2))
+        count = len(account.transactions)
+        account.ledger()
+
+        copy = account.copy(deep=True)
+        for posted in (copy, account):
+            valuation = AccountValuation(account=posted, account_type=account_type, action_date=date(2020, 1, 1))
+            valuation.end_of_day(date(2020, 1, 1))
+
+        for posted in (copy, account):
+            self.assertEqual(count + 1, len(posted.transactions))
+            self.assertEqual("interestAccrued", posted.transactions[-1].transaction_type)
+            self.assertEqual(posted.transactions, list(posted.ledger()))
+
+        # shallow copy shares transactions list, both see postings made to either of them
+        shallow = account.copy()
+        AccountValuation(account=shallow, account_type=account_type,
+                         action_date=date(2020, 1, 2)).end_of_day(date(2020, 1, 2))
+
+        self.assertEqual(count + 2, len(account.transactions))
+        self.assertEqual(account.transactions, list(account.ledger()))
+        self.assertEqual(shallow.transactions, list(shallow.ledger()))
+
+    def test_positions_only(self):
+        account_type = create_savings_account()
+        start_date = date(2019, 1, 1)
+
+        valuations = []
+        for forecast_mode, materialize_transactions in ((ForecastMode.DAILY, True), (ForecastMode.DAILY, False),
+                                                        (ForecastMode.COLLAPSED, False)):
+            account = Account(start_date=start_date, account_type_name=account_type.name,
+                              account_type=account_type,
+                              properties={"monthlyFee": PropertyValue(value={start_date: Decimal(1)}),
+                                          "withholdingTax": PropertyValue(value={start_date: Decimal(0.2)})})
+
+            valuation = AccountValuation(account=account, account_type=account_type, action_date=start_date,
+                                         forecast_mode=forecast_mode,
+                                         materialize_transactions=materialize_transactions)
+            valuation.forecast(date(2020, 1, 1), group_by_date([
+                ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000), value_date=start_date)]))
+            valuations.append(valuation)
+
+        expected = valuations[0]
+        for valuation in valuations[1:]:
+            self.assertEqual(expected.account.positions, valuation.account.positions)
+            self.assertEqual(len(expected.account.transactions), valuation.posting_count)
+            self.assertEqual([], valuation.account.transactions)
+            self.assertEqual([], valuation.accrual_runs)
+
+    def test_iter_forecast(self):
+        account_type = create_savings_account()
+        start_date = date(2019, 1, 1)
+        expected = evaluate_account(account_type, monthly_fee=Decimal(1), deposit=Decimal(1000),
+                                    withholding_tax=Decimal(0.2))
+
+        account = Account(start_date=start_date, account_type_name=account_type.name, account_type=account_type,
+                          properties={"monthlyFee": PropertyValue(value={start_date: Decimal(1)}),
+                                      "withholdingTax": PropertyValue(value={start_date: Decimal(0.2)})})
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=date(2020, 1, 1),
+                                     materialize_transactions=False)
+        external_transactions = group_by_date([
+            ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000), value_date=start_date)])
+
+        events = list(valuation.iter_forecast(date(2020, 1, 1), external_transactions, snapshots=True))
+        postings = [event for event in events if isinstance(event, Posting)]
+        snapshots = [event for event in events if isinstance(event, BalanceSnapshot)]
+
+        self.assertEqual(expected.transactions, [posting.to_transaction() for posting in postings])
+        self.assertEqual(366, len(snapshots))
+        self.assertEqual(expected.positions["current"].amount, snapshots[-1].positions["current"])
+        self.assertEqual([], account.transactions)
+
+    def test_iter_forecast_stops_when_closed(self):
+        account_type = create_savings_account()
+        start_date = date(2019, 1, 1)
+        account = Account(start_date=start_date, account_type_name=account_type.name, account_type=account_type,
+                          properties={"monthlyFee": PropertyValue(value={start_date: Decimal(1)}),
+                                      "withholdingTax": PropertyValue(value={start_date: Decimal(0.2)})})
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=start_date)
+
+        events = valuation.iter_forecast(date(2029, 1, 1), {}, postings=False, snapshots=True)
+        snapshot = next(events)
+        events.close()
+
+        self.assertEqual(start_date, snapshot.value_date)
+        self.assertEqual(0, len(account.transactions))
+        self.assertIsInstance(account.positions["accrued"], Position)
+
+    def test_reforecast_from_checkpoint(self):
+        account_type = create_savings_account()
+        start_date = date(2019, 1, 1)
+        deposits = [ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000), value_date=start_date)]
+        back_dated = ExternalTransaction(transaction_type_name="deposit", amount=Decimal(250),
+                                         value_date=date(2019, 11, 20))
+
+        for advance in (False, True):
+            valuations = []
+            for checkpoint_frequency in (None, ScheduleFrequency.MONTHLY):
+                account = Account(start_date=start_date, account_type_name=account_type.name,
+                                  account_type=account_type,
+                                  properties={"monthlyFee": PropertyValue(value={start_date: Decimal(1)}),
+                                              "withholdingTax": PropertyValue(value={start_date: Decimal(0.2)})})
+                valuation = AccountValuation(account=account, account_type=account_type, action_date=start_date,
+                                             checkpoint_frequency=checkpoint_frequency)
+                run = valuation.advance if advance else valuation.forecast
+
+                if checkpoint_frequency:
+                    run(date(2020, 1, 1), group_by_date(deposits))
+                    self.assertEqual(13, len(valuation.checkpoints))
+                    count = valuation.posting_count
+
+                    valuation.reforecast(back_dated.value_date, date(2020, 1, 1),
+                                         group_by_date(deposits + [back_dated]))
+                    self.assertEqual(date(2019, 11, 1), valuation.checkpoints[-3].value_date)
+                    self.assertEqual(count + 1, valuation.posting_count)
+                else:
+                    run(date(2020, 1, 1), group_by_date(deposits + [back_dated]))
+
+                valuations.append(valuation)
+
+            if advance:
+                # processed date is restored with the checkpoint and set again, so that advance continues after it
+                for valuation in valuations:
+                    self.assertEqual(date(2020, 1, 1), valuation.account.processed_date)
+                    valuation.advance(date(2020, 2, 15), group_by_date(deposits + [back_dated]))
+
+            self.assertEqual(valuations[0].account.positions, valuations[1].account.positions)
+            self.assertEqual(valuations[0].account.transactions, valuations[1].account.transactions)
+
+    def test_advance(self):
+        account_type = create_savings_account()
+        start_date = date(2019, 1, 1)
+        external_transactions = group_by_date([
+            ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000), value_date=start_date),
+            ExternalTransaction(transaction_type_name="deposit", amount=Decimal(250), value_date=date(2019, 3, 5))])
+
+        def create():
+            account = Account(start_date=start_date, account_type_name=account_type.name, account_type=account_type,
+                              properties={"monthlyFee": PropertyValue(value={start_date: Decimal(1)}),
+                                          "withholdingTax": PropertyValue(value={start_date: Decimal(0.2)})})
+            return AccountValuation(account=account, account_type=account_type, action_date=start_date)
+
+        forecast = create()
+        forecast.forecast(date(2019, 7, 1), external_transactions)
+
+        advanced = create()
+        for to_date in (date(2019, 1, 1), date(2019, 3, 4), date(2019, 3, 5), date(2019, 6, 30), date(2019, 6, 30)):
+            advanced.advance(to_date, external_transactions)
+            self.assertEqual(to_date, advanced.account.processed_date)
+
+        self.assertEqual([transaction for transaction in forecast.account.transactions
+                          if transaction.value_date <= date(2019, 6, 30)], advanced.account.transactions)
+        self.assertEqual(forecast.account.withholding, advanced.account.withholding)
+
     def test_property_valuation(self):
         account_type = create_savings_account()
 
@@ -126,5 +351,77 @@ class TestAccount(unittest.TestCase):
         self.assertAlmostEqual(account.transactions[1].amount, Decimal(0.08219), places=4)
 
 
+class TestEventDrivenForecast(unittest.TestCase):
+    @staticmethod
+    def __forecast(account_type: AccountType, forecast_mode: ForecastMode) -> (Account, AccountValuation):
+        start_date = date(2019, 1, 1)
+        account = Account(start_date=start_date, account_type_name=account_type.name,
+                          account_type=account_type,
+                          properties={"monthlyFee": PropertyValue(value={start_date: Decimal(1)}),
+                                      "withholdingTax": PropertyValue(value={start_date: Decimal(0.2)})})
+
+        valuation = AccountValuation(account=account, account_type=account_type, action_date=start_date,
+                                     forecast_mode=forecast_mode)
+        external_transactions = group_by_date([
+            ExternalTransaction(transaction_type_name="deposit", amount=Decimal(1000), value_date=start_date),
+            ExternalTransaction(transaction_type_name="deposit", amount=Decimal(500), value_date=date(2019, 6, 12))])
+
+        valuation.forecast(date(2020, 1, 1), external_transactions)
+        return account, valuation
+
+    def test_same_as_daily(self):
+        account_type = create_savings_account()
+
+        daily, _ = self.__forecast(account_type, ForecastMode.DAILY)
+        event_driven, _ = self.__forecast(account_type, ForecastMode.EVENT_DRIVEN)
+
+        self.assertEqual(daily.transactions, event_driven.transactions)
+        self.assertEqual(daily.positions, event_driven.positions)
+
+    def test_visits_only_event_dates(self):
+        account_type = create_savings_account()
+        account_type.scheduled_transactions = [st for st in account_type.scheduled_transactions
+                                               if st.schedule_name != "accrual"]
+        account_type.invalidate_valuation_plan()
+
+        daily, _ = self.__forecast(account_type, ForecastMode.DAILY)
+        event_driven, valuation = self.__forecast(account_type, ForecastMode.EVENT_DRIVEN)
+
+        self.assertEqual(daily.transactions, event_driven.transactions)
+
+        value_dates = list(valuation.event_dates(date(2019, 1, 1), date(2020, 1, 1),
+                                                 {date(2019, 6, 12): []}))
+
+        # start, 12 month ends, one deposit and forecast date
+        self.assertEqual(15, len(value_dates))
+        self.assertEqual(date(2019, 1, 31), value_dates[1])
+        self.assertEqual(date(2020, 1, 1), value_dates[-1])
+
+    def test_collapsed_same_as_daily(self):
+        account_type = create_savings_account()
+
+        daily, _ = self.__forecast(account_type, ForecastMode.DAILY)
+        collapsed, valuation = self.__forecast(account_type, ForecastMode.COLLAPSED)
+
+        self.assertEqual(daily.positions, collapsed.positions)
+        self.assertGreater(len(valuation.accrual_runs), 0)
+
+        key = lambda t: (t.value_date, t.transaction_type)
+        self.assertEqual(sorted(daily.transactions, key=key),
+                         sorted(collapsed.transactions + list(valuation.expand_accrual_runs()), key=key))
+
+    def test_collapsed_date_dependent_expression(self):
+        account_type = create_savings_account()
+        accrual = next(st for st in account_type.scheduled_transactions if st.schedule_name == "accrual")
+        accrual.amount_expression = "account.current * Decimal(value_date.day) / Decimal(36500)"
+        account_type.invalidate_valuation_plan()
+
+        daily, _ = self.__forecast(account_type, ForecastMode.DAILY)
+        collapsed, valuation = self.__forecast(account_type, ForecastMode.COLLAPSED)
+
+        self.assertEqual(0, len(valuation.accrual_runs))
+        self.assertEqual(daily.transactions, collapsed.transactions)
+
+
 if __name__ == '__main__':
     unittest.main()
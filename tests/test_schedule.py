@@ -1,6 +1,9 @@
 import unittest
 
 from accounts.runtime import *
+from accounts.schedule_arrays import schedule_due_dates
+from accounts.schedule_cache import ScheduleDateCache
+from tests.test_config import create_savings_account, get_euro_calendar
 
 
 class TestSchedule(unittest.TestCase):
@@ -77,6 +80,152 @@ class TestSchedule(unittest.TestCase):
         self.assertEqual(len(discount_dates), 3)
         self.assertEqual(date(2020, 2, 1), discount_dates[2])
 
+    def test_monthly_next_due_date(self):
+        schedule = Schedule(start_date=date(2013, 1, 31), end_type=ScheduleEndType.END_DATE,
+                            frequency=ScheduleFrequency.MONTHLY, interval=1, end_date=date(2013, 12, 31),
+                            include_dates=[date(2013, 3, 15)], exclude_dates=[date(2013, 4, 30)])
+
+        self.assertEqual(date(2013, 1, 31), schedule.next_due_date(date(2012, 6, 1)))
+        self.assertEqual(date(2013, 2, 28), schedule.next_due_date(date(2013, 1, 31)))
+        self.assertEqual(date(2013, 3, 15), schedule.next_due_date(date(2013, 2, 28)))
+        self.assertEqual(date(2013, 3, 31), schedule.next_due_date(date(2013, 3, 15)))
+        self.assertEqual(date(2013, 5, 31), schedule.next_due_date(date(2013, 3, 31)))
+        self.assertIsNone(schedule.next_due_date(date(2013, 12, 31)))
+
+        self.assertTrue(schedule.is_due(date(2013, 2, 28)))
+        self.assertFalse(schedule.is_due(date(2013, 4, 30)))
+        self.assertFalse(schedule.is_due(date(2014, 1, 31)))
+        self.assertEqual({}, schedule.cached_dates)
+
+    def test_changed_exceptions(self):
+        schedule = Schedule(start_date=date(2013, 1, 31), end_type=ScheduleEndType.NO_END,
+                            frequency=ScheduleFrequency.MONTHLY, interval=2)
+
+        self.assertFalse(schedule.is_due(date(2013, 2, 28)))
+        self.assertTrue(schedule.is_due(date(2013, 3, 31)))
+
+        schedule.include_dates = [date(2013, 2, 28)]
+        schedule.exclude_dates = [date(2013, 3, 31)]
+
+        self.assertTrue(schedule.is_due(date(2013, 2, 28)))
+        self.assertFalse(schedule.is_due(date(2013, 3, 31)))
+        self.assertEqual([date(2013, 1, 31), date(2013, 2, 28), date(2013, 5, 31)],
+                         schedule.get_due_dates(date(2013, 1, 1), date(2013, 6, 30)))
+
+        # lists changed in place are noticed as well
+        schedule.include_dates.append(date(2013, 4, 15))
+        schedule.exclude_dates.remove(date(2013, 3, 31))
+
+        self.assertTrue(schedule.is_due(date(2013, 4, 15)))
+        self.assertEqual(date(2013, 3, 31), schedule.next_due_date(date(2013, 2, 28)))
+        self.assertEqual([date(2013, 1, 31), date(2013, 2, 28), date(2013, 3, 31), date(2013, 4, 15),
+                          date(2013, 5, 31)],
+                         list(schedule.due_dates()[:5]))
+
+    def test_shared_due_dates(self):
+        def create():
+            return Schedule(start_date=date(2013, 1, 31), end_type=ScheduleEndType.NO_END,
+                            frequency=ScheduleFrequency.MONTHLY, interval=1, include_dates=[date(2013, 2, 15)])
+
+        schedule, other = create(), create()
+
+        self.assertIs(schedule.due_dates(), other.due_dates())
+        self.assertEqual(date(2013, 2, 15), schedule.due_dates()[1])
+
+        other.include_dates = []
+        self.assertIsNot(schedule.due_dates(), other.due_dates())
+        self.assertEqual(date(2013, 2, 28), other.due_dates()[1])
+
+    def test_date_cache_eviction(self):
+        cache = ScheduleDateCache()
+        dates = [date(2013, 1, day) for day in range(1, 11)]
+        cache.resize(ScheduleDateCache.entry_size(tuple(dates)) * 2)
+
+        first = cache.get("first", lambda: dates)
+        cache.get("second", lambda: dates)
+        self.assertIs(first, cache.get("first", lambda: []))
+        cache.get("third", lambda: dates)
+
+        self.assertEqual(2, len(cache))
+        self.assertEqual((1, 3, 1), (cache.hits, cache.misses, cache.evictions))
+        self.assertEqual(ScheduleDateCache.entry_size(first) * 2, cache.size)
+        self.assertEqual((), cache.get("second", lambda: []))
+
+    def test_bulk_same_as_schedule(self):
+        schedules = [Schedule(start_date=date(2013, 1, 31), end_type=ScheduleEndType.NO_END,
+                              frequency=ScheduleFrequency.MONTHLY, interval=1),
+                     Schedule(start_date=date(2012, 2, 29), end_type=ScheduleEndType.END_DATE,
+                              frequency=ScheduleFrequency.MONTHLY, interval=12, end_date=date(2030, 1, 1)),
+                     Schedule(start_date=date(2013, 3, 8), end_type=ScheduleEndType.END_REPEATS,
+                              frequency=ScheduleFrequency.DAILY, interval=7, number_of_repeats=20,
+                              include_dates=[date(2013, 3, 9)], exclude_dates=[date(2013, 3, 15)]),
+                     Schedule(start_date=date(2013, 3, 31), end_type=ScheduleEndType.NO_END,
+                              frequency=ScheduleFrequency.MONTHLY, interval=1,
+                              include_dates=[self.end_date], exclude_dates=[date(2013, 12, 31)])]
+
+        due = schedule_due_dates(schedules)
+
+        self.assertEqual(len(schedules), len(due))
+        for index, schedule in enumerate(schedules):
+            self.assertEqual(list(schedule.due_dates()), due[index].astype(date).tolist())
+            self.assertEqual(schedule.get_due_dates(date(2013, 1, 1), date(2016, 3, 1)),
+                             due.get_due_dates(index, date(2013, 1, 1), date(2016, 3, 1)))
+
+        self.assertTrue(due.is_due(1, date(2013, 2, 28)))
+        self.assertFalse(due.is_due(3, date(2013, 12, 31)))
+
+    def test_adjusted_schedule(self):
+        calendar = get_euro_calendar()
+        schedule = Schedule(start_date=date(2019, 3, 22), end_type=ScheduleEndType.END_REPEATS,
+                            frequency=ScheduleFrequency.MONTHLY, interval=1, number_of_repeats=4,
+                            adjustment=BusinessDayAdjustment.NEXT_WORKING_DAY, calendar=calendar)
+
+        # 22 April is easter monday, 22 June is saturday
+        self.assertEqual([date(2019, 3, 22), date(2019, 4, 23), date(2019, 5, 22), date(2019, 6, 24)],
+                         schedule.get_due_dates(date(2019, 1, 1), date(2020, 1, 1)))
+        self.assertFalse(schedule.is_due(date(2019, 4, 22)))
+        self.assertTrue(schedule.is_due(date(2019, 4, 23)))
+        self.assertEqual(date(2019, 6, 24), schedule.next_due_date(date(2019, 5, 22)))
+
+        schedule.adjustment = BusinessDayAdjustment.PREVIOUS_WORKING_DAY
+        self.assertEqual(date(2019, 4, 18), schedule.next_due_date(date(2019, 3, 22)))
+
+        schedule.adjustment = BusinessDayAdjustment.CLOSEST_WORKING_DAY
+        self.assertEqual([date(2019, 3, 22), date(2019, 4, 23), date(2019, 5, 22), date(2019, 6, 21)],
+                         list(schedule.due_dates()))
+        self.assertEqual(list(schedule.due_dates()), schedule_due_dates([schedule])[0].astype(date).tolist())
+
+        # dates are adjusted again when a holiday is added to the calendar
+        calendar.add("HOLIDAY", date(2019, 5, 22))
+        self.assertEqual(date(2019, 5, 23), schedule.next_due_date(date(2019, 4, 23)))
+
+        # without calendar dates are not adjusted
+        schedule.calendar = None
+        self.assertTrue(schedule.is_due(date(2019, 4, 22)))
+
+    def test_account_calendar(self):
+        calendar = get_euro_calendar()
+        account_type = create_savings_account()
+        start_date = date(2019, 3, 22)
+        account = Account(start_date=start_date, account_type_name=account_type.name, account_type=account_type,
+                          properties={"monthlyFee": PropertyValue(value={start_date: Decimal(0)}),
+                                      "withholdingTax": PropertyValue(value={start_date: Decimal(0)})},
+                          calendar=calendar)
+        account.schedules["compounding"].adjustment = BusinessDayAdjustment.NEXT_WORKING_DAY
+
+        self.assertTrue(all(schedule.calendar is calendar for schedule in account.schedules.values()))
+        self.assertEqual(date(2019, 4, 23), account.schedules["compounding"].next_due_date(start_date))
+
+        # calendar is not serialized, parsed account is given it again
+        text = account.schedules["compounding"].json()
+        self.assertNotIn("holidays", text)
+        self.assertIsNone(Schedule.parse_raw(text).calendar)
+        self.assertNotIn("calendar", account.dict())
+
+        parsed = Account(**account.dict(), calendar=calendar)
+        self.assertTrue(all(schedule.calendar is calendar for schedule in parsed.schedules.values()))
+        self.assertEqual(date(2019, 4, 23), parsed.schedules["compounding"].next_due_date(start_date))
+
 
 if __name__ == '__main__':
     unittest.main()
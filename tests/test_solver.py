@@ -0,0 +1,119 @@
+import pickle
+import unittest
+
+from accounts.runtime import *
+from tests.test_config import create_loan_given_account
+from tests.test_loanGiven import create_loan_account
+
+
+class TestSolver(unittest.TestCase):
+    @staticmethod
+    def __valuation(instalment: Optional[Decimal] = None) -> AccountValuation:
+        account_type = create_loan_given_account()
+        account, end_date = create_loan_account(account_type, date(2013, 3, 8))
+        if instalment is not None:
+            account.apply_calculated_installment(instalment)
+
+        return AccountValuation(account=account, account_type=account_type, action_date=end_date,
+                                forecast_mode=ForecastMode.COLLAPSED)
+
+    def test_rate_for_instalment(self):
+        valuation = self.__valuation()
+        solver = Solver(valuation)
+
+        rate = solver.goal_seek(RateVariable("interest"), InstalmentTarget(), Decimal("2964.37"),
+                                guess=Decimal("0.05"), step=Decimal("0.01"), lower=Decimal(0))
+
+        self.assertEqual(Decimal("0.0304"), rate)
+        self.assertEqual("brentq", solver.report.method)
+        self.assertEqual(Decimal(0), solver.report.residual)
+
+    def test_rate_of_account_type_restored(self):
+        valuation = self.__valuation()
+        variable = RateVariable("interest")
+        rates = [rate_tier.rate for rate_tier in variable.rate_tiers(valuation)]
+
+        Solver(valuation).goal_seek(variable, InstalmentTarget(), Decimal("2964.37"),
+                                    guess=Decimal("0.05"), step=Decimal("0.01"), lower=Decimal(0))
+
+        self.assertEqual(rates, [rate_tier.rate for rate_tier in variable.rate_tiers(valuation)])
+
+    def test_term_for_balance(self):
+        valuation = self.__valuation(Decimal("2964.37"))
+
+        with Solver(valuation, workers=2) as solver:
+            term = solver.goal_seek(TermVariable("end_date"), PositionTarget("principal", "end_date"),
+                                    guess=Decimal(240), step=Decimal(12), lower=Decimal(1))
+
+        self.assertEqual(Decimal(300), term)
+        self.assertEqual(date(2038, 3, 8), valuation.account.dates["end_date"])
+        self.assertAlmostEqual(Decimal(0), valuation.account.positions["principal"].amount, delta=Decimal(5))
+
+    def test_longer_term_extends_schedules(self):
+        valuation = self.__valuation(Decimal("2964.37"))
+        account = valuation.account
+        end_date = account.dates["end_date"]
+        for name in ("interest", "redemption"):
+            account.schedules[name].end_type = ScheduleEndType.END_DATE
+        account.instalments = {key: instalment for key, instalment in account.instalments.items()
+                               if date.fromisoformat(key) <= end_date}
+
+        TermVariable("end_date").apply(valuation, Decimal(360))
+
+        self.assertEqual(date(2043, 3, 8), account.dates["end_date"])
+        for name in ("interest", "redemption"):
+            self.assertEqual(date(2043, 3, 8), account.schedules[name].end_date)
+            self.assertTrue(account.schedules[name].is_due(date(2040, 3, 31)))
+        self.assertEqual(Decimal("2964.37"), account.instalments["2040-03-31"].amount)
+        self.assertIn("2043-03-08", account.instalments)
+        self.assertNotIn("2043-03-31", account.instalments)
+
+        # principal is repaid sooner than the longer term, when instalments are posted for all of it
+        self.assertLess(PositionTarget("principal", "end_date").evaluate(valuation), Decimal(0))
+
+    def test_memoized(self):
+        valuation = self.__valuation(Decimal("2964.37"))
+        solver = Solver(valuation, root_finder=scipy.optimize.bisect)
+        variable, target = PropertyVariable("advance"), PositionTarget("principal", "end_date")
+
+        advance = solver.goal_seek(variable, target, bracket=(Decimal(600000), Decimal(650000)))
+        principal = valuation.account.positions["principal"].amount
+        valuation.account.apply_calculated_installment(Decimal("3000"))
+
+        self.assertGreater(solver.report.iterations, 0)
+        self.assertEqual(principal, solver.evaluate(variable, target, advance))
+        solver.clear_memo()
+        self.assertNotEqual(principal, solver.evaluate(variable, target, advance))
+
+    def test_memo_cleared_by_goal_seek(self):
+        valuation = self.__valuation(Decimal("2964.37"))
+        solver = Solver(valuation)
+        variable, target = PropertyVariable("advance"), PositionTarget("principal", "end_date")
+
+        advance = solver.goal_seek(variable, target, bracket=(Decimal(600000), Decimal(650000)))
+        valuation.account.apply_calculated_installment(Decimal("3000"))
+
+        self.assertGreater(solver.goal_seek(variable, target, bracket=(Decimal(600000), Decimal(650000))), advance)
+        self.assertGreater(solver.report.iterations, 0)
+
+    def test_find_bracket(self):
+        solver = Solver(self.__valuation(Decimal("2964.37")))
+
+        low, high = solver.find_bracket(PropertyVariable("advance"), PositionTarget("principal", "end_date"),
+                                        Decimal(0), Decimal(500000), Decimal(10000))
+
+        self.assertEqual((Decimal(580000), Decimal(660000)), (low, high))
+
+    def test_account_type_pickled_without_plan(self):
+        account_type = create_loan_given_account()
+        account_type.valuation_plan()
+
+        copy = pickle.loads(pickle.dumps(account_type))
+
+        self.assertEqual(account_type, copy)
+        self.assertEqual(account_type.valuation_plan().transaction_types.keys(),
+                         copy.valuation_plan().transaction_types.keys())
+
+
+if __name__ == '__main__':
+    unittest.main()